@@ -1,27 +1,41 @@
+import json
+import logging
 import os
-import threading
 import uuid
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from azure.storage.blob import BlobServiceClient
 
-from config import load_config
-from clients import init_clients
+from config import get_config
+from clients import get_clients
 
-from processing.pipeline import run_pipeline
-from processing.rag_module import run_rag_question
+from processing.pipeline import ingest_blob
+from processing.jobs import IngestionQueue, QueueFullError
+from processing.rag_module import run_rag, run_rag_batch
+from processing.answer_cache import get_answer_cache
+from processing.embedding_cache import get_embedding_cache
+from utils.ratelimit import configure_rate_limits_once
+from utils.telemetry import REGISTRY
 
 app = Flask(__name__)
 # Habilitar CORS para todas las rutas y orígenes
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# Configuración de Azure Storage
-cfg = load_config()
-clients = init_clients(cfg)
-CONN_STR  = os.getenv("AZ_STORAGE_CONN_STRING")
-CONTAINER = os.getenv("AZ_BLOB_CONTAINER")
-blob_svc  = BlobServiceClient.from_connection_string(CONN_STR)
+# Configuración y registro de clientes compartido (se construyen bajo demanda)
+cfg = get_config()
+clients = get_clients(cfg)
+# Límites de tasa por servicio compartidos por todos los workers del proceso
+configure_rate_limits_once(clients, cfg)
+
+# Cola de ingesta acotada: los workers comparten los clientes del registro
+def _ingest_job(blob_name, on_stage):
+    return ingest_blob(blob_name, clients, cfg, on_stage=on_stage)
+
+jobs = IngestionQueue(
+    _ingest_job,
+    num_workers=cfg['INGEST_WORKERS'],
+    max_queue=cfg['INGEST_QUEUE_SIZE']
+)
 
 # Endpoint para subir archivos y disparar pipeline
 @app.route("/upload", methods=["POST"])
@@ -38,19 +52,47 @@ def upload():
     if ext not in {".pdf", ".png", ".jpg", ".jpeg"}:
         return jsonify({"error": "Tipo de archivo no permitido"}), 400
 
+    # Backpressure: rechaza antes de subir si la cola está llena
+    if jobs.is_full():
+        return jsonify({"error": "Cola de ingesta llena, reintente más tarde"}), 429, {"Retry-After": "30"}
+
     # Genera nombre único y sube
     blob_name = f"{uuid.uuid4().hex}{ext}"
     try:
-        container_client = blob_svc.get_container_client(CONTAINER)
-        blob_client = container_client.get_blob_client(blob_name)
+        blob_client = clients['blob'].get_blob_client(blob_name)
         blob_client.upload_blob(file.stream, overwrite=True)
     except Exception as ex:
         return jsonify({"error": str(ex)}), 500
 
-    # Corre pipeline en background
-    threading.Thread(target=run_pipeline, daemon=True).start()
+    # Encola la ingesta del blob recién subido. Si otra petición llenó la cola
+    # mientras se subía, se borra el blob para no dejarlo sin ingerir
+    try:
+        job = jobs.submit(blob_name)
+    except QueueFullError as ex:
+        try:
+            blob_client.delete_blob()
+        except Exception as del_ex:
+            logging.warning("No se pudo borrar el blob %s sin encolar: %s", blob_name, del_ex)
+            return jsonify({
+                "error": f"{ex}; el archivo quedó guardado como {blob_name} pero no se ingerirá",
+                "blob_name": blob_name
+            }), 429, {"Retry-After": "30"}
+        return jsonify({"error": str(ex)}), 429, {"Retry-After": "30"}
 
-    return jsonify({"status": "ok", "blob_name": blob_name}), 201
+    return jsonify({"status": "ok", "blob_name": blob_name, "job_id": job["job_id"]}), 201
+
+# Endpoint para consultar el estado de un trabajo de ingesta
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(job), 200
+
+# Estado general de la cola de ingesta
+@app.route("/jobs", methods=["GET"])
+def jobs_stats():
+    return jsonify(jobs.stats()), 200
 
 # Endpoint para consultas RAG desde Postman
 @app.route("/query", methods=["POST"])
@@ -62,10 +104,42 @@ def query():
         return jsonify({"error": "Se requiere el campo 'question' en JSON"}), 400
 
     try:
-        answer = run_rag_question(question, k)
-        return jsonify({"answer": answer}), 200
+        result = run_rag(question, k)
+        return jsonify({"answer": result["answer"], "usage": result["usage"], "cached": result["cached"]}), 200
     except Exception as ex:
         return jsonify({"error": str(ex)}), 500
 
+# Consultas RAG por lotes (evaluaciones): un resultado JSON por línea según terminan
+@app.route("/query/batch", methods=["POST"])
+def query_batch():
+    data = request.get_json(force=True)
+    questions = data.get("questions")
+    k = data.get("k", 5)
+    temperature = data.get("temperature", 0.7)
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q for q in questions):
+        return jsonify({"error": "Se requiere el campo 'questions' (lista de preguntas no vacías) en JSON"}), 400
+    if len(questions) > cfg['RAG_BATCH_MAX_QUESTIONS']:
+        return jsonify({"error": f"Como máximo {cfg['RAG_BATCH_MAX_QUESTIONS']} preguntas por lote"}), 413
+
+    def lines():
+        for result in run_rag_batch(questions, k, temperature):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(lines()), mimetype="application/x-ndjson")
+
+# Contadores de las cachés de respuestas y de embeddings
+@app.route("/stats/cache", methods=["GET"])
+def cache_stats():
+    answer_cache = get_answer_cache(cfg)
+    return jsonify({
+        "answers": answer_cache.snapshot() if answer_cache is not None else None,
+        "embeddings": get_embedding_cache(cfg).snapshot()
+    }), 200
+
+# Métricas de latencia, reintentos, bytes y tokens en formato Prometheus
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
@@ -0,0 +1,91 @@
+import json
+from contextlib import asynccontextmanager
+from typing import List
+
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from clients import get_async_clients, get_clients
+from config import get_config
+from processing.rag_async import arun_rag, stream_rag_answer
+from processing.rag_module import run_rag_batch
+from utils.ratelimit import configure_rate_limits_once
+
+
+class QueryRequest(BaseModel):
+    question: str
+    k: int = 5
+    temperature: float = 0.7
+
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    k: int = 5
+    temperature: float = 0.7
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Límites de tasa por servicio compartidos por todas las peticiones del proceso
+    cfg = get_config()
+    configure_rate_limits_once(get_clients(cfg), cfg)
+    yield
+    await get_async_clients().aclose()
+
+
+# API asíncrona de consultas RAG: uvicorn asgi:app --host 0.0.0.0 --port 8000
+app = FastAPI(title="DataCrafter RAG", lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+# Respuesta completa, sin bloquear un worker durante la generación
+@app.post("/query")
+async def query(req: QueryRequest):
+    if not req.question:
+        raise HTTPException(status_code=400, detail="Se requiere el campo 'question' en JSON")
+    try:
+        result = await arun_rag(req.question, req.k, req.temperature)
+    except Exception as ex:
+        raise HTTPException(status_code=500, detail=str(ex))
+    return {"answer": result["answer"], "usage": result["usage"], "cached": result["cached"]}
+
+
+# Respuesta en streaming como Server-Sent Events (un evento por fragmento de texto)
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    if not req.question:
+        raise HTTPException(status_code=400, detail="Se requiere el campo 'question' en JSON")
+
+    async def events():
+        info = {}
+        try:
+            async for token in stream_rag_answer(req.question, req.k, req.temperature, info):
+                yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+            yield f"event: done\ndata: {json.dumps(info, ensure_ascii=False)}\n\n"
+        except Exception as ex:
+            yield f"event: error\ndata: {json.dumps({'error': str(ex)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Consultas RAG por lotes (evaluaciones) como JSON Lines, un resultado por pregunta
+# según terminan. run_rag_batch es síncrono: StreamingResponse lo itera en el pool de hilos
+@app.post("/query/batch")
+async def query_batch(req: BatchQueryRequest):
+    if not req.questions or not all(req.questions):
+        raise HTTPException(status_code=400, detail="Se requiere el campo 'questions' (lista de preguntas no vacías) en JSON")
+    limit = get_config()['RAG_BATCH_MAX_QUESTIONS']
+    if len(req.questions) > limit:
+        raise HTTPException(status_code=413, detail=f"Como máximo {limit} preguntas por lote")
+
+    def lines():
+        for result in run_rag_batch(req.questions, req.k, req.temperature):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
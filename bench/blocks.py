@@ -0,0 +1,100 @@
+"""
+Micro-benchmark del clasificador de bloques (processing.blocks) y de la
+fragmentación completa sobre un flujo sintético grande de párrafos como los
+de Document Intelligence, con Text Analytics falso sin latencia: mide solo
+CPU.
+
+    python -m bench.blocks --blocks 100000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from bench.corpus import page_blocks
+
+
+def synthetic_blocks(n: int, seed: int = 0):
+    """n bloques {'type', 'role', 'content', 'page'} con títulos, listas, continuaciones y párrafos."""
+    rng = random.Random(seed)
+    blocks, page = [], 1
+    while len(blocks) < n:
+        for kind, text in page_blocks(rng):
+            role = 'paragraph'
+            if kind == 'heading' and rng.random() < 0.5:
+                role = 'sectionHeading'
+            elif kind == 'list' and rng.random() < 0.2:
+                blocks.append({'type': 'paragraph', 'role': role, 'content': text, 'page': page})
+                text = f"o {text[2:]}"
+            elif kind == 'paragraph' and rng.random() < 0.1:
+                # Títulos ambiguos (sin patrón ni rol) que acaban en Text Analytics
+                text = f"Capítulo {rng.randint(1, 30)}" if rng.random() < 0.3 else text.split('.')[0][:40].strip()
+            blocks.append({'type': 'paragraph', 'role': role, 'content': text, 'page': page})
+        page += 1
+    return blocks[:n]
+
+
+def _best(fn, repeats: int):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings), statistics.median(timings)
+
+
+def bench_blocks(n: int = 100000, repeats: int = 3, seed: int = 0) -> dict:
+    """Bloques/s de classify_blocks y de classify_blocks + chunk_classified + resize_chunks."""
+    from bench.fakes import FakeTextAnalyticsClient, _Service
+    from processing import chunking
+    from processing.blocks import classify_blocks
+    from utils import ratelimit
+
+    blocks = synthetic_blocks(n, seed)
+    ta_client = FakeTextAnalyticsClient(_Service('ta', 0.0, 0.0))
+
+    pairs, classify_s, classify_median = _best(lambda: list(classify_blocks(blocks)), repeats)
+
+    def chunk_all():
+        chunking._key_phrase_cache.clear()
+        return list(chunking.resize_chunks(
+            chunking.chunk_classified(classify_blocks(blocks), ta_client), 300, 2000, 200
+        ))
+
+    # Solo CPU: sin el limitador de peticiones que haya configurado el proceso
+    limiter, ratelimit._limiter = ratelimit._limiter, None
+    ta_calls = ta_client.service.stats['calls']
+    try:
+        chunks, chunk_s, chunk_median = _best(chunk_all, repeats)
+    finally:
+        ratelimit.set_rate_limiter(limiter)
+    return {
+        'blocks': n,
+        'list_blocks': sum(1 for b, _ in pairs if b['type'] != 'paragraph'),
+        'local_headings': sum(1 for _, g in pairs if g),
+        'ta_candidates': sum(1 for _, g in pairs if g is None),
+        'ta_calls_per_run': (ta_client.service.stats['calls'] - ta_calls) // repeats,
+        'chunks': len(chunks),
+        'repeats': repeats,
+        'classify_blocks': {'best_s': classify_s, 'median_s': classify_median,
+                            'items_per_s': n / classify_s if classify_s else 0.0},
+        'chunking': {'best_s': chunk_s, 'median_s': chunk_median,
+                     'items_per_s': n / chunk_s if chunk_s else 0.0},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark del clasificador de bloques")
+    parser.add_argument('--blocks', type=int, default=100000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    result = bench_blocks(args.blocks, args.repeats, args.seed)
+    for name in ('classify_blocks', 'chunking'):
+        print(f"{name:16s} {result[name]['items_per_s']:12.0f} bloques/s  ({result[name]['best_s']:.3f}s)")
+    print(f"{result['ta_candidates']} candidatos a Text Analytics, {result['ta_calls_per_run']} llamadas por pasada")
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Generador de un corpus sintético de PDFs para los benchmarks: documentos
+nativos digitales (texto extraíble) y escaneados (solo imagen por página)
+de longitud variable, deterministas para una semilla dada.
+"""
+import math
+import random
+
+import fitz
+
+_VOCAB = (
+    "administración artículo autorización beneficiario capítulo certificado "
+    "comisión competencia contrato convocatoria cumplimiento declaración "
+    "disposición documentación ejecución entidad expediente financiación "
+    "garantía gestión importe informe interesado justificación licitación "
+    "normativa notificación obligación plazo presupuesto procedimiento "
+    "propuesta protección recurso reglamento requisito resolución responsable "
+    "seguimiento servicio solicitud subvención supuesto tramitación usuario "
+    "datos personales sistema información seguridad acceso registro control"
+).split()
+
+_PAGE_WIDTH, _PAGE_HEIGHT = 595, 842
+_MARGIN_X, _MARGIN_TOP, _MARGIN_BOTTOM = 50, 50, 40
+# Interlineado de insert_textbox respecto al tamaño de letra, con holgura para el ajuste de línea
+_LINE_HEIGHT = 1.3
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(_VOCAB, k=rng.randint(8, 22))
+    return ' '.join(words).capitalize() + '.'
+
+
+def _paragraph(rng: random.Random) -> str:
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(2, 6)))
+
+
+def page_blocks(rng: random.Random):
+    """Bloques (tipo, texto) de una página: títulos, párrafos y viñetas."""
+    blocks = []
+    while len(blocks) < 9:
+        roll = rng.random()
+        if roll < 0.15:
+            blocks.append(('heading', f"{rng.randint(1, 9)}.{rng.randint(1, 9)} {rng.choice(_VOCAB).capitalize()}"))
+        elif roll < 0.22:
+            blocks.append(('heading', ' '.join(rng.choices(_VOCAB, k=3)).upper()))
+        elif roll < 0.35:
+            # Helvetica (la fuente base) no tiene '•': se usa un guion, que también es viñeta
+            blocks.append(('list', f"- {_sentence(rng)}"))
+        else:
+            blocks.append(('paragraph', _paragraph(rng)))
+    return blocks
+
+
+def _block_height(text: str, fontsize: float, width: float) -> float:
+    """Alto estimado de las líneas del texto (sin contar el ajuste por palabras)."""
+    lines = math.ceil(fitz.get_text_length(text, fontsize=fontsize) / width)
+    return lines * fontsize * _LINE_HEIGHT
+
+
+def _write_page(doc, rng: random.Random):
+    page = doc.new_page(width=_PAGE_WIDTH, height=_PAGE_HEIGHT)
+    width = _PAGE_WIDTH - 2 * _MARGIN_X
+    bottom = _PAGE_HEIGHT - _MARGIN_BOTTOM
+    y = _MARGIN_TOP
+    for kind, text in page_blocks(rng):
+        size = 13 if kind == 'heading' else 9
+        height = _block_height(text, size, width)
+        if y + height > bottom:
+            break
+        rect = fitz.Rect(_MARGIN_X, y, _MARGIN_X + width, y + height)
+        # Si no cabe, insert_textbox no dibuja nada y devuelve el alto que falta (negativo)
+        left = page.insert_textbox(rect, text, fontsize=size)
+        if left < 0:
+            height -= left
+            if y + height > bottom:
+                break
+            rect.y1 = y + height
+            left = page.insert_textbox(rect, text, fontsize=size)
+        assert left >= 0, f"El bloque no cabe en su rectángulo ({left:.1f}): {text[:40]!r}"
+        y += height - left + 6
+    return page
+
+
+def born_digital_pdf(pages: int, seed: int = 0) -> bytes:
+    """PDF con texto extraíble de `pages` páginas."""
+    rng = random.Random(seed)
+    with fitz.open() as doc:
+        for _ in range(pages):
+            _write_page(doc, rng)
+        return doc.tobytes()
+
+
+def scanned_pdf(pages: int, seed: int = 0, dpi: int = 100) -> bytes:
+    """PDF escaneado: cada página es solo una imagen rasterizada, sin capa de texto."""
+    with fitz.open(stream=born_digital_pdf(pages, seed), filetype='pdf') as src, fitz.open() as doc:
+        for src_page in src:
+            pix = src_page.get_pixmap(dpi=dpi)
+            page = doc.new_page(width=_PAGE_WIDTH, height=_PAGE_HEIGHT)
+            page.insert_image(page.rect, stream=pix.tobytes('png'))
+        return doc.tobytes(deflate=True, garbage=3)
+
+
+def generate_corpus(num_docs: int, scanned_ratio: float = 0.25, min_pages: int = 1,
+                    max_pages: int = 30, seed: int = 0):
+    """
+    Genera num_docs documentos con un número de páginas entre min_pages y
+    max_pages. Devuelve una lista de dicts {name, kind, pages, data}.
+    """
+    rng = random.Random(seed)
+    docs = []
+    for i in range(num_docs):
+        pages = rng.randint(min_pages, max_pages)
+        scanned = rng.random() < scanned_ratio
+        build = scanned_pdf if scanned else born_digital_pdf
+        docs.append({
+            'name': f"bench-{i:04d}-{'scan' if scanned else 'digital'}.pdf",
+            'kind': 'scanned' if scanned else 'digital',
+            'pages': pages,
+            'data': build(pages, seed=seed * 100003 + i)
+        })
+    return docs
@@ -0,0 +1,486 @@
+"""
+Sustitutos locales de los servicios de Azure (Blob, Document Intelligence,
+Text Analytics, OpenAI, Cognitive Search y Table Storage) con latencia y
+límite de peticiones configurables, para medir el pipeline y el RAG sin red.
+"""
+import base64
+import hashlib
+import random
+import re
+import threading
+import time
+import types
+import zlib
+
+import fitz
+import httpx
+import numpy as np
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from openai import RateLimitError
+
+import clients as clients_module
+from bench.corpus import page_blocks
+from clients import ClientRegistry
+
+EMBED_DIM = 1536
+_WORD_RE = re.compile(r'\w+')
+
+# Latencia base por llamada, latencia por unidad (página, entrada, documento,
+# MB...) y peticiones por segundo permitidas (None = sin límite)
+DEFAULT_PROFILES = {
+    'blob':   {'latency_s': 0.020, 'per_unit_s': 0.010, 'rate_per_s': None},
+    'doc':    {'latency_s': 0.400, 'per_unit_s': 0.120, 'rate_per_s': 15},
+    'ta':     {'latency_s': 0.060, 'per_unit_s': 0.004, 'rate_per_s': 100},
+    'oai':    {'latency_s': 0.100, 'per_unit_s': 0.002, 'rate_per_s': 50},
+    'chat':   {'latency_s': 0.300, 'per_unit_s': 0.004, 'rate_per_s': 20},
+    'search': {'latency_s': 0.030, 'per_unit_s': 0.0005, 'rate_per_s': 100},
+    'table':  {'latency_s': 0.010, 'per_unit_s': 0.0, 'rate_per_s': None},
+}
+
+
+class _Service:
+    """
+    Simula la latencia y el límite de peticiones (token bucket) de un servicio.
+    Al superar el límite espera como lo haría la política de reintentos del
+    SDK de Azure (que reintenta los 429 internamente) y lo cuenta en stats.
+    """
+
+    def __init__(self, name: str, latency_s: float, per_unit_s: float, rate_per_s=None,
+                 scale: float = 1.0, seed: int = 0):
+        self.name = name
+        self.latency_s = latency_s * scale
+        self.per_unit_s = per_unit_s * scale
+        self.rate_per_s = rate_per_s
+        self._tokens = float(rate_per_s or 0)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.stats = {'calls': 0, 'throttled': 0, 'units': 0}
+
+    def _acquire(self) -> float:
+        """Consume un token; devuelve 0 o los segundos hasta que haya uno."""
+        if not self.rate_per_s:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(float(self.rate_per_s), self._tokens + (now - self._last) * self.rate_per_s)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate_per_s
+
+    def call(self, units: float = 1):
+        while True:
+            with self._lock:
+                wait = self._acquire()
+                if wait:
+                    self.stats['throttled'] += 1
+                else:
+                    self.stats['calls'] += 1
+                    self.stats['units'] += units
+                jitter = 0.8 + 0.4 * self._rng.random()
+            if not wait:
+                break
+            self.on_throttle(wait)
+        time.sleep((self.latency_s + self.per_unit_s * units) * jitter)
+
+    def on_throttle(self, wait: float):
+        time.sleep(wait)
+
+
+class _OpenAIService(_Service):
+    """Los 429 de OpenAI se propagan como RateLimitError (con retry-after-ms) al llamador."""
+
+    def on_throttle(self, wait: float):
+        response = httpx.Response(
+            429, headers={'retry-after-ms': str(int(wait * 1000) + 1)},
+            request=httpx.Request('POST', 'https://fake.openai.azure.com')
+        )
+        raise RateLimitError(f"{self.name}: Too Many Requests", response=response, body=None)
+
+
+def _read_body(body) -> bytes:
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    if hasattr(body, 'getvalue'):
+        return body.getvalue()
+    return body.read()
+
+
+def synthetic_paragraphs(seed: bytes, count: int):
+    """Párrafos deterministas a partir de una semilla (para páginas escaneadas)."""
+    rng = random.Random(zlib.crc32(seed))
+    return [text for _, text in page_blocks(rng)][:count]
+
+
+def hashed_embedding(text: str) -> list:
+    """Embedding determinista de bolsa de palabras con hashing (coseno ~ solapamiento léxico)."""
+    vec = np.zeros(EMBED_DIM, dtype=np.float32)
+    for word in _WORD_RE.findall(text.lower()):
+        h = zlib.crc32(word.encode('utf-8'))
+        vec[h % EMBED_DIM] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vec)
+    if norm:
+        vec /= norm
+    return vec.tolist()
+
+
+def _encode_embedding(vec: list, encoding_format=None, dimensions=None):
+    """Como la API: recorta y renormaliza a dimensions y devuelve base64 de float32 si se pide."""
+    arr = np.asarray(vec, dtype=np.float32)
+    if dimensions:
+        arr = arr[:dimensions]
+        norm = np.linalg.norm(arr)
+        if norm:
+            arr = arr / norm
+    if encoding_format == 'base64':
+        return base64.b64encode(arr.astype(np.float32).tobytes()).decode('ascii')
+    return arr.tolist()
+
+
+# Blob Storage
+class FakeDownloader:
+    def __init__(self, service: _Service, data: bytes):
+        self._service = service
+        self._data = data
+
+    def readall(self) -> bytes:
+        self._service.call(len(self._data) / 1e6)
+        return self._data
+
+    def readinto(self, stream) -> int:
+        stream.write(self.readall())
+        return len(self._data)
+
+
+class FakeBlobClient:
+    def __init__(self, container, name: str):
+        self._container = container
+        self.blob_name = name
+
+    def upload_blob(self, data, overwrite: bool = False, **kwargs):
+        self._container.put(self.blob_name, _read_body(data))
+
+    def download_blob(self, **kwargs) -> FakeDownloader:
+        data = self._container.blobs.get(self.blob_name)
+        if data is None:
+            raise ResourceNotFoundError(f"Blob no encontrado: {self.blob_name}")
+        return FakeDownloader(self._container.service, data)
+
+    def delete_blob(self, **kwargs):
+        if self._container.blobs.pop(self.blob_name, None) is None:
+            raise ResourceNotFoundError(f"Blob no encontrado: {self.blob_name}")
+
+    def get_blob_properties(self):
+        if self.blob_name not in self._container.blobs:
+            raise ResourceNotFoundError(f"Blob no encontrado: {self.blob_name}")
+        return self._container.properties(self.blob_name)
+
+
+class FakeContainerClient:
+    def __init__(self, service: _Service):
+        self.service = service
+        self.blobs = {}
+
+    def put(self, name: str, data: bytes):
+        self.blobs[name] = data
+
+    def clear(self):
+        self.blobs.clear()
+
+    def properties(self, name: str):
+        data = self.blobs[name]
+        md5 = hashlib.md5(data).digest()
+        return types.SimpleNamespace(
+            name=name, size=len(data), etag=f'"{md5.hex()[:16]}"',
+            content_settings=types.SimpleNamespace(content_md5=md5)
+        )
+
+    def get_blob_client(self, name: str) -> FakeBlobClient:
+        return FakeBlobClient(self, name)
+
+    def list_blobs(self):
+        return [self.properties(name) for name in list(self.blobs)]
+
+
+# Document Intelligence
+class _Paragraph:
+    def __init__(self, content: str, page: int, role=None):
+        self.content = content
+        self.role = role
+        self.bounding_regions = [types.SimpleNamespace(page_number=page)]
+
+
+class _Poller:
+    def __init__(self, result):
+        self._result = result
+
+    def result(self, timeout=None):
+        return self._result
+
+
+class FakeDocumentIntelligenceClient:
+    """
+    Modelo de layout: extrae los bloques de texto reales del PDF con PyMuPDF.
+    Modelo OCR sobre imágenes: devuelve párrafos sintéticos deterministas.
+    """
+
+    def __init__(self, service: _Service):
+        self.service = service
+
+    def begin_analyze_document(self, model_id: str, body, **kwargs):
+        data = _read_body(body)
+        if data[:4] == b'%PDF':
+            paragraphs = []
+            with fitz.open(stream=data, filetype='pdf') as doc:
+                pages = doc.page_count
+                for page in doc:
+                    for block in page.get_text('blocks'):
+                        # DI devuelve el párrafo en una línea, sin los saltos del ajuste
+                        text = ' '.join(block[4].split())
+                        if text:
+                            paragraphs.append(_Paragraph(text, page.number + 1))
+        else:
+            pages = 1
+            paragraphs = [_Paragraph(t, 1) for t in synthetic_paragraphs(data[-4096:], 12)]
+        self.service.call(pages)
+        return _Poller(types.SimpleNamespace(paragraphs=paragraphs))
+
+
+# Text Analytics
+class FakeTextAnalyticsClient:
+    def __init__(self, service: _Service):
+        self.service = service
+
+    def extract_key_phrases(self, documents, language=None, **kwargs):
+        if len(documents) > 10:
+            raise HttpResponseError(message="Batch request contains too many records")
+        self.service.call(len(documents))
+        results = []
+        for i, doc in enumerate(documents):
+            text = doc if isinstance(doc, str) else doc.get('text', '')
+            words = [w for w in _WORD_RE.findall(text) if len(w) > 3]
+            phrases = words[:1] if len(words) <= 4 else words[:3]
+            results.append(types.SimpleNamespace(id=str(i), key_phrases=phrases, is_error=False))
+        return results
+
+
+# Azure OpenAI
+class _FakeEmbeddings:
+    def __init__(self, service: _Service):
+        self.service = service
+
+    def create(self, model: str, input, encoding_format=None, dimensions=None, **kwargs):
+        inputs = [input] if isinstance(input, str) else list(input)
+        self.service.call(len(inputs))
+        data = [types.SimpleNamespace(index=i, embedding=_encode_embedding(hashed_embedding(t), encoding_format, dimensions))
+                for i, t in enumerate(inputs)]
+        tokens = sum(len(t) // 4 for t in inputs)
+        return types.SimpleNamespace(data=data, usage=types.SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens))
+
+
+class _FakeCompletions:
+    def __init__(self, service: _Service, answer_tokens: int = 150):
+        self.service = service
+        self.answer_tokens = answer_tokens
+
+    def create(self, model: str, messages, **kwargs):
+        prompt_tokens = sum(len(m['content']) for m in messages) // 4
+        self.service.call(self.answer_tokens)
+        answer = ' '.join(['respuesta'] * self.answer_tokens)
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=answer), finish_reason='stop')],
+            usage=types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=self.answer_tokens)
+        )
+
+
+class FakeOpenAIClient:
+    def __init__(self, service: _Service):
+        self.embeddings = _FakeEmbeddings(service)
+        self.chat = types.SimpleNamespace(completions=_FakeCompletions(service))
+
+
+# Cognitive Search
+class _IndexingResult:
+    def __init__(self, key: str):
+        self.key = key
+        self.succeeded = True
+        self.status_code = 200
+        self.error_message = None
+
+
+class FakeSearchClient:
+    """Índice en memoria: búsqueda vectorial exacta (coseno) y léxica por solapamiento de términos."""
+
+    def __init__(self, service: _Service):
+        self.service = service
+        self.docs = {}
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._ids = None
+
+    def merge_or_upload_documents(self, documents):
+        self.service.call(len(documents))
+        with self._lock:
+            for doc in documents:
+                self.docs[doc['id']] = dict(self.docs.get(doc['id'], {}), **doc)
+            self._matrix = None
+        return [_IndexingResult(d['id']) for d in documents]
+
+    upload_documents = merge_or_upload_documents
+    merge_documents = merge_or_upload_documents
+
+    def delete_documents(self, documents):
+        self.service.call(len(documents))
+        with self._lock:
+            for doc in documents:
+                self.docs.pop(doc['id'], None)
+            self._matrix = None
+        return [_IndexingResult(d['id']) for d in documents]
+
+    def _vectors(self):
+        with self._lock:
+            if self._matrix is None:
+                self._ids = [k for k, d in self.docs.items() if d.get('contentVector') is not None]
+                self._matrix = np.array(
+                    [self.docs[k]['contentVector'] for k in self._ids], dtype=np.float32
+                ).reshape(len(self._ids), -1)
+            return self._ids, self._matrix
+
+    def _public(self, doc: dict, select=None) -> dict:
+        fields = select or [k for k in doc if k != 'contentVector']
+        return {k: doc.get(k) for k in fields}
+
+    def search(self, search_text=None, vector_queries=None, select=None, top: int = 50, **kwargs):
+        self.service.call(top)
+        if vector_queries:
+            query = vector_queries[0]
+            ids, matrix = self._vectors()
+            if not ids:
+                return []
+            q = np.asarray(query.vector, dtype=np.float32)
+            scores = matrix @ q / ((np.linalg.norm(matrix, axis=1) * np.linalg.norm(q)) + 1e-9)
+            k = min(query.k_nearest_neighbors or top, top, len(ids))
+            best = np.argsort(-scores)[:k]
+            return [dict(self._public(self.docs[ids[i]], select), **{'@search.score': float(scores[i])})
+                    for i in best]
+        terms = set(_WORD_RE.findall((search_text or '').lower())) - {'*'}
+        if not terms:
+            return [self._public(d, select) for d in list(self.docs.values())[:top]]
+        scored = []
+        for doc in list(self.docs.values()):
+            overlap = len(terms & set(_WORD_RE.findall(doc.get('content', '').lower())))
+            if overlap:
+                scored.append((overlap, doc))
+        scored.sort(key=lambda x: -x[0])
+        return [dict(self._public(d, select), **{'@search.score': float(s)}) for s, d in scored[:top]]
+
+
+class FakeSearchIndexClient:
+    def __init__(self, service: _Service):
+        self.service = service
+        self.indexes = {}
+
+    def get_index(self, name: str):
+        self.service.call()
+        if name not in self.indexes:
+            raise ResourceNotFoundError(f"Índice no encontrado: {name}")
+        return self.indexes[name]
+
+    def create_or_update_index(self, index):
+        self.service.call()
+        self.indexes[index.name] = index
+        return index
+
+    def delete_index(self, name: str):
+        self.indexes.pop(name, None)
+
+
+# Table Storage
+class FakeTableClient:
+    def __init__(self, service: _Service):
+        self.service = service
+        self.rows = {}
+        self._lock = threading.Lock()
+
+    def create_table(self):
+        pass
+
+    def get_entity(self, partition_key: str, row_key: str, **kwargs):
+        self.service.call()
+        with self._lock:
+            row = self.rows.get((partition_key, row_key))
+        if row is None:
+            raise ResourceNotFoundError("Entidad no encontrada")
+        return dict(row)
+
+    def upsert_entity(self, entity: dict, mode=None, **kwargs):
+        self.service.call()
+        key = (entity['PartitionKey'], entity['RowKey'])
+        with self._lock:
+            merged = dict(self.rows.get(key, {})) if str(mode).lower().endswith('merge') else {}
+            merged.update(entity)
+            self.rows[key] = merged
+
+    def delete_entity(self, partition_key: str, row_key: str, **kwargs):
+        self.service.call()
+        with self._lock:
+            self.rows.pop((partition_key, row_key), None)
+
+    def submit_transaction(self, operations, **kwargs):
+        operations = list(operations)
+        if len(operations) > 100 or len({op[1]['PartitionKey'] for op in operations}) > 1:
+            raise HttpResponseError(message="Invalid batch")
+        self.service.call(len(operations))
+        keys = [(op[1]['PartitionKey'], op[1]['RowKey']) for op in operations]
+        if len(set(keys)) < len(keys):
+            raise HttpResponseError(message="Duplicate RowKey in batch")
+        with self._lock:
+            for key, (_, entity, *kwargs) in zip(keys, operations):
+                mode = (kwargs[0] if kwargs else {}).get('mode')
+                merged = dict(self.rows.get(key, {})) if str(mode).lower().endswith('merge') else {}
+                merged.update(entity)
+                self.rows[key] = merged
+        return [{} for _ in operations]
+
+    def list_entities(self, **kwargs):
+        with self._lock:
+            return [dict(v) for v in self.rows.values()]
+
+
+class FakeClientRegistry(ClientRegistry):
+    """
+    Registro de clientes con los sustitutos locales. Se instala como registro
+    compartido del proceso con install(), de modo que run_pipeline y el módulo
+    RAG lo usan sin cambios.
+    """
+
+    def __init__(self, cfg: dict, profiles: dict = None, scale: float = 1.0, seed: int = 0):
+        super().__init__(cfg)
+        profiles = dict(DEFAULT_PROFILES, **(profiles or {}))
+        self.services = {}
+        for name, profile in profiles.items():
+            cls = _OpenAIService if name in ('oai', 'chat') else _Service
+            self.services[name] = cls(name, scale=scale, seed=seed, **profile)
+        self._fakes = {
+            'blob': FakeContainerClient(self.services['blob']),
+            'doc': FakeDocumentIntelligenceClient(self.services['doc']),
+            'ta': FakeTextAnalyticsClient(self.services['ta']),
+            'table': FakeTableClient(self.services['table']),
+            'index': FakeSearchIndexClient(self.services['search']),
+            'search': FakeSearchClient(self.services['search']),
+            'oai': FakeOpenAIClient(self.services['oai']),
+            'chat': FakeOpenAIClient(self.services['chat']),
+        }
+        self._factories = {name: (lambda n=name: self._fakes[n]) for name in self._fakes}
+
+    def service_stats(self) -> dict:
+        return {name: dict(service.stats) for name, service in self.services.items()}
+
+
+def install(cfg: dict, profiles: dict = None, scale: float = 1.0, seed: int = 0) -> FakeClientRegistry:
+    """Sustituye el registro de clientes compartido del proceso por uno falso."""
+    registry = FakeClientRegistry(cfg, profiles=profiles, scale=scale, seed=seed)
+    with clients_module._registry_lock:
+        clients_module._registry = registry
+    return registry
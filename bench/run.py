@@ -0,0 +1,430 @@
+"""
+Benchmark offline del pipeline de ingesta y de la consulta RAG sobre los
+sustitutos locales de bench.fakes y un corpus sintético (bench.corpus).
+
+    python -m bench.run --docs 12 --queries 40
+    python -m bench.run --latency-scale 0 --baseline bench/results/anterior.json
+
+Mide docs/s, páginas/s y fragmentos/s de run_pipeline (nativos digitales en
+modo layout y escaneados en modo OCR), el rendimiento de normalize_lists,
+chunk_by_headings y compute_chunk_metrics, el del clasificador de bloques
+sobre un flujo sintético grande (bench.blocks), la latencia p50/p95 de
+run_rag_question, las preguntas/s de run_rag_batch y la memoria pico. Guarda el resultado en JSON para
+comparar entre commits.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Variables obligatorias de config.py; los clientes son falsos, así que los valores no se usan
+_REQUIRED_ENV = {
+    'AZ_ENDPOINT': 'https://bench.local', 'AZ_KEY': 'bench',
+    'AZ_MODEL_ID': 'prebuilt-layout', 'AZ_OCR_MODEL_ID': 'prebuilt-read', 'AZ_ANALYZE_MODE': 'layout',
+    'AZ_STORAGE_CONN_STRING': 'UseDevelopmentStorage=true', 'AZ_BLOB_CONTAINER': 'bench',
+    'AZ_TABLE_NAME': 'bench', 'SLOW_THRESHOLD_S': '30',
+    'AZ_SEARCH_ENDPOINT': 'https://bench.local', 'AZ_SEARCH_KEY': 'bench', 'AZ_SEARCH_INDEX': 'bench',
+    'AZ_OPENAI_ENDPOINT': 'https://bench.local', 'AZ_OPENAI_KEY': 'bench',
+    'AZ_EMBED_DEPLOY': 'bench-embeddings', 'AZ_OPENAI_API_VERSION': '2024-02-01',
+    'AZ_GPT_DEPLOYMENT': 'bench-chat', 'AZ_GPT_OPENAI_ENDPOINT': 'https://bench.local',
+    'AZ_GPT_OPENAI_4_KEY': 'bench', 'AZ_GPT_OPENAI_KEY': 'bench',
+    'MIN_CHUNK_SIZE_CHARS': '300', 'MAX_CHUNK_SIZE_CHARS': '2000', 'COVERAGE_THRESHOLD_PCT': '80',
+}
+
+# Ajustes que se fuerzan para que las medidas no dependan de cachés previas
+_FORCED_ENV = {
+    'EMBED_CACHE_PATH': '',
+    'CHECKPOINT_DIR': '',
+    'ANSWER_CACHE_ENABLED': 'false',
+    'RETRIEVAL_BACKEND': 'azure',
+    # Los clientes falsos viven en este proceso: el pool de procesos no los vería
+    'PIPELINE_POOL': 'thread',
+    # Límites de tasa alineados con los perfiles de fakes.DEFAULT_PROFILES (chat y
+    # embeddings comparten el límite de OpenAI, así que manda el más estricto)
+    'DI_MAX_RPS': '15',
+    'TA_MAX_RPS': '100',
+    'OPENAI_MAX_RPS': '20',
+    'SEARCH_MAX_RPS': '100',
+}
+
+
+def _configure_env(output_csv: str):
+    for key, value in _REQUIRED_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ.update(_FORCED_ENV)
+    os.environ.setdefault('OUTPUT_CSV', output_csv)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _peak_rss_mb() -> float:
+    """Memoria residente pico del proceso y sus hijos (MB), si la plataforma lo permite."""
+    if resource is None:
+        return None
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / scale, 1)
+
+
+def _percentile(values, q: float) -> float:
+    """Percentil por rango más cercano."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[idx]
+
+
+class _Phase:
+    """Mide tiempo de pared y, opcionalmente, memoria pico de Python de una fase."""
+
+    def __init__(self, trace_memory: bool):
+        self.trace_memory = trace_memory
+        self.result = {}
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.result['seconds'] = time.perf_counter() - self._start
+        if self.trace_memory:
+            self.result['python_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            tracemalloc.stop()
+        self.result['peak_rss_mb'] = _peak_rss_mb()
+        return False
+
+
+def bench_ingest(registry, cfg: dict, docs: list, mode: str, trace_memory: bool) -> dict:
+    """Ejecuta run_pipeline sobre los documentos indicados en el modo de análisis dado."""
+    from processing.pipeline import run_pipeline
+
+    container = registry['blob']
+    container.clear()
+    for doc in docs:
+        container.put(doc['name'], doc['data'])
+    cfg['ANALYZE_MODE'] = mode
+    before = registry.service_stats()
+
+    with _Phase(trace_memory) as phase:
+        summary = run_pipeline(force=True)
+
+    names = {doc['name'] for doc in docs}
+    rows = [row for row in registry['table'].list_entities()
+            if row.get('RowKey') in names and row.get('PartitionKey') != 'manifest']
+    chunks = sum(int(row.get('num_chunks', 0)) for row in rows)
+    pages = sum(doc['pages'] for doc in docs)
+    seconds = phase.result['seconds']
+    stages = {}
+    for row in rows:
+        for key, value in row.items():
+            if key.startswith('stage_') and key.endswith('_s'):
+                stages[key[6:-2]] = stages.get(key[6:-2], 0.0) + value
+    after = registry.service_stats()
+    return {
+        'mode': mode,
+        'docs': len(docs),
+        'pages': pages,
+        'chunks': chunks,
+        'summary': summary,
+        'docs_per_s': len(docs) / seconds if seconds else 0.0,
+        'pages_per_s': pages / seconds if seconds else 0.0,
+        'chunks_per_s': chunks / seconds if seconds else 0.0,
+        'stage_seconds': {k: round(v, 4) for k, v in sorted(stages.items())},
+        'service_calls': {
+            name: {k: after[name][k] - before[name][k] for k in after[name]}
+            for name in after
+        },
+        **phase.result,
+    }
+
+
+def bench_chunking(registry, docs: list, repeats: int) -> dict:
+    """Rendimiento de normalize_lists, chunk_by_headings y compute_chunk_metrics sin latencia de red."""
+    from bench.fakes import FakeTextAnalyticsClient, _Service
+    from processing import chunking
+    from processing.analyzer import extract_paragraphs_objects
+    from processing.metrics import compute_chunk_metrics
+
+    doc_client = registry['doc']
+    paras = []
+    for doc in docs:
+        result = doc_client.begin_analyze_document('prebuilt-layout', doc['data']).result()
+        paras.extend(extract_paragraphs_objects(result.paragraphs))
+    ta_client = FakeTextAnalyticsClient(_Service('ta', 0.0, 0.0))
+
+    timings = {'normalize_lists': [], 'chunk_by_headings': [], 'compute_chunk_metrics': []}
+    for _ in range(repeats):
+        chunking._key_phrase_cache.clear()
+        start = time.perf_counter()
+        blocks = list(chunking.normalize_lists(paras))
+        timings['normalize_lists'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        chunks = list(chunking.chunk_by_headings(blocks, ta_client))
+        timings['chunk_by_headings'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        compute_chunk_metrics(paras, chunks, [], 300, 2000)
+        timings['compute_chunk_metrics'].append(time.perf_counter() - start)
+
+    out = {'paragraphs': len(paras), 'blocks': len(blocks), 'chunks': len(chunks), 'repeats': repeats}
+    for name, values in timings.items():
+        best = min(values)
+        out[name] = {
+            'best_s': best,
+            'median_s': statistics.median(values),
+            'items_per_s': (len(paras) if name != 'compute_chunk_metrics' else len(chunks)) / best if best else 0.0
+        }
+    return out
+
+
+def _questions(registry, num_queries: int, seed: int) -> list:
+    """Preguntas sintéticas tomadas del contenido indexado."""
+    rng = random.Random(seed)
+    contents = [doc.get('content', '') for doc in registry['search'].docs.values() if doc.get('content')]
+    questions = []
+    for _ in range(num_queries if contents else 0):
+        words = rng.choice(contents).split()
+        start = rng.randrange(max(1, len(words) - 8))
+        questions.append('¿Qué dice el documento sobre ' + ' '.join(words[start:start + 8]) + '?')
+    return questions
+
+
+def bench_rag(registry, num_queries: int, seed: int, trace_memory: bool) -> dict:
+    """Latencia de run_rag_question con preguntas tomadas del contenido indexado."""
+    from processing.rag_module import run_rag_question
+
+    questions = _questions(registry, num_queries, seed)
+    if not questions:
+        return {'queries': 0}
+
+    latencies = []
+    with _Phase(trace_memory) as phase:
+        for question in questions:
+            start = time.perf_counter()
+            run_rag_question(question)
+            latencies.append(time.perf_counter() - start)
+    return {
+        'queries': len(latencies),
+        'p50_s': _percentile(latencies, 50),
+        'p95_s': _percentile(latencies, 95),
+        'mean_s': statistics.mean(latencies),
+        'qps': len(latencies) / phase.result['seconds'] if phase.result['seconds'] else 0.0,
+        **phase.result,
+    }
+
+
+def bench_rag_batch(registry, num_queries: int, seed: int, trace_memory: bool) -> dict:
+    """Rendimiento de run_rag_batch con preguntas distintas de las de bench_rag (sin aciertos de caché)."""
+    from processing.rag_module import run_rag_batch
+
+    questions = _questions(registry, num_queries, seed + 2)
+    if not questions:
+        return {'queries': 0}
+
+    with _Phase(trace_memory) as phase:
+        results = list(run_rag_batch(questions))
+    totals = [r['latency']['total_s'] for r in results]
+    breakdown = {
+        name: statistics.mean(r['latency'][name] for r in results)
+        for name in ('embed_s', 'search_wait_s', 'search_s', 'context_s', 'chat_wait_s', 'chat_s')
+    }
+    return {
+        'queries': len(results),
+        'errors': sum(1 for r in results if r.get('error')),
+        'p50_s': _percentile(totals, 50),
+        'p95_s': _percentile(totals, 95),
+        'qps': len(results) / phase.result['seconds'] if phase.result['seconds'] else 0.0,
+        'mean_latency_s': breakdown,
+        **phase.result,
+    }
+
+
+# Métricas comparadas con --baseline: (ruta, mayor es mejor)
+_KEY_METRICS = [
+    (('ingest', 'digital', 'docs_per_s'), True),
+    (('ingest', 'digital', 'chunks_per_s'), True),
+    (('ingest', 'scanned', 'docs_per_s'), True),
+    (('ingest', 'scanned', 'pages_per_s'), True),
+    (('chunking', 'chunk_by_headings', 'items_per_s'), True),
+    (('chunking', 'compute_chunk_metrics', 'items_per_s'), True),
+    (('blocks', 'chunking', 'items_per_s'), True),
+    (('rag', 'p50_s'), False),
+    (('rag', 'p95_s'), False),
+    (('rag_batch', 'qps'), True),
+    (('vectors', 'recall', 'int8', 'recall_at_10_rescored'), True),
+    (('vectors', 'recall', 'binary', 'recall_at_10_rescored'), True),
+    (('memory', 'peak_rss_mb'), False),
+]
+
+
+def _lookup(data: dict, path):
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def compare(baseline: dict, current: dict) -> list:
+    """Filas (métrica, antes, ahora, cambio %, empeora) para las métricas clave."""
+    rows = []
+    for path, higher_is_better in _KEY_METRICS:
+        old, new = _lookup(baseline, path), _lookup(current, path)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        worse = change < 0 if higher_is_better else change > 0
+        rows.append(('.'.join(path), old, new, change, worse))
+    return rows
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="Benchmark offline de ingesta y RAG con servicios falsos")
+    parser.add_argument('--docs', type=int, default=12, help="documentos del corpus sintético")
+    parser.add_argument('--scanned-ratio', type=float, default=0.25)
+    parser.add_argument('--min-pages', type=int, default=1)
+    parser.add_argument('--max-pages', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=40)
+    parser.add_argument('--batch-queries', type=int, default=200,
+                        help="preguntas de la evaluación por lotes (run_rag_batch)")
+    parser.add_argument('--chunking-repeats', type=int, default=5)
+    parser.add_argument('--blocks', type=int, default=100000,
+                        help="bloques sintéticos del micro-benchmark del clasificador (0 = omitirlo)")
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help="multiplica las latencias simuladas (0 = sin latencia)")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="documentos ingeridos en paralelo (PIPELINE_WORKERS)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="mide la memoria pico de Python por fase con tracemalloc (más lento)")
+    parser.add_argument('--out', default='bench/results', help="directorio de resultados JSON")
+    parser.add_argument('--baseline', help="JSON de una ejecución anterior con el que comparar")
+    args = parser.parse_args(argv)
+
+    # Sin los logs INFO por documento y por consulta del pipeline y el RAG
+    logging.basicConfig(level=logging.WARNING)
+    tmp_dir = tempfile.mkdtemp(prefix='bench-')
+    _configure_env(os.path.join(tmp_dir, 'metrics.csv'))
+    os.environ['PIPELINE_WORKERS'] = str(args.workers)
+
+    from bench import fakes
+    from bench.blocks import bench_blocks
+    from bench.corpus import generate_corpus
+    from bench.vectors import bench_vectors
+    from config import get_config
+
+    cfg = get_config()
+    registry = fakes.install(cfg, scale=args.latency_scale, seed=args.seed)
+
+    start = time.perf_counter()
+    corpus = generate_corpus(args.docs, args.scanned_ratio, args.min_pages, args.max_pages, seed=args.seed)
+    corpus_s = time.perf_counter() - start
+    digital = [d for d in corpus if d['kind'] == 'digital']
+    scanned = [d for d in corpus if d['kind'] == 'scanned']
+
+    results = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'corpus': {
+            'docs': len(corpus),
+            'digital': len(digital),
+            'scanned': len(scanned),
+            'pages': sum(d['pages'] for d in corpus),
+            'bytes': sum(len(d['data']) for d in corpus),
+            'generation_s': corpus_s,
+        },
+        'ingest': {},
+    }
+    if digital:
+        results['ingest']['digital'] = bench_ingest(registry, cfg, digital, 'layout', args.trace_memory)
+    if scanned:
+        results['ingest']['scanned'] = bench_ingest(registry, cfg, scanned, 'ocr', args.trace_memory)
+    if digital:
+        results['chunking'] = bench_chunking(registry, digital, args.chunking_repeats)
+    if args.blocks:
+        results['blocks'] = bench_blocks(args.blocks, seed=args.seed)
+    results['rag'] = bench_rag(registry, args.queries, args.seed, args.trace_memory)
+    results['rag_batch'] = bench_rag_batch(registry, args.batch_queries, args.seed, args.trace_memory)
+    results['vectors'] = bench_vectors(
+        registry, _questions(registry, args.queries, args.seed + 1),
+        embed=lambda texts: [fakes.hashed_embedding(t) for t in texts],
+        oversampling=cfg['VECTOR_OVERSAMPLING']
+    )
+    results['memory'] = {'peak_rss_mb': _peak_rss_mb()}
+    results['services'] = registry.service_stats()
+
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    out_path = out_dir / f"{stamp}-{results['meta']['commit']}.json"
+    out_path.write_text(json.dumps(results, indent=2, ensure_ascii=False, default=str), encoding='utf-8')
+
+    for kind, data in results['ingest'].items():
+        print(f"ingesta {kind:8s} {data['docs']:4d} docs {data['docs_per_s']:8.2f} docs/s "
+              f"{data['chunks_per_s']:8.1f} fragmentos/s  ({data['seconds']:.1f}s)")
+    if 'chunking' in results:
+        for name in ('normalize_lists', 'chunk_by_headings', 'compute_chunk_metrics'):
+            print(f"{name:22s} {results['chunking'][name]['items_per_s']:12.0f} elementos/s")
+    if 'blocks' in results:
+        for name in ('classify_blocks', 'chunking'):
+            print(f"{'bloques ' + name:22s} {results['blocks'][name]['items_per_s']:12.0f} bloques/s "
+                  f"({results['blocks']['blocks']} bloques)")
+    if results['rag'].get('queries'):
+        print(f"rag p50 {results['rag']['p50_s'] * 1000:.0f} ms  p95 {results['rag']['p95_s'] * 1000:.0f} ms")
+    if results['rag_batch'].get('queries'):
+        batch = results['rag_batch']
+        print(f"rag por lotes {batch['queries']} preguntas {batch['qps']:.1f} preguntas/s "
+              f"(secuencial {results['rag'].get('qps', 0):.1f}), {batch['errors']} errores")
+    if results['vectors']:
+        sizes = results['vectors']['sizes']
+        print(f"vector: lista {sizes['list_of_float_bytes']} B, float32 {sizes['float32_buffer_bytes']} B, "
+              f"JSON {sizes['json_full_bytes']} -> {sizes['json_compact_bytes']} B")
+        print(f"recall sobre {results['vectors']['vectors']} vectores, {results['vectors']['candidates']} candidatos:")
+        for name, recall in results['vectors']['recall'].items():
+            print(f"recall@10 {name:6s} {recall['recall_at_10']:.3f}  con rescoring {recall['recall_at_10_rescored']:.3f}")
+    print(f"memoria pico {results['memory']['peak_rss_mb']} MB")
+    print(f"resultados: {out_path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        print(f"\ncomparación con {args.baseline} ({baseline.get('meta', {}).get('commit')}):")
+        for name, old, new, change, worse in compare(baseline, results):
+            flag = '  <-- peor' if worse and abs(change) >= 5 else ''
+            print(f"  {name:42s} {old:12.4f} -> {new:12.4f} ({change:+6.1f}%){flag}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Coste de representación de los vectores y recall de la compresión vectorial.
+
+Azure AI Search cuantiza en el servicio, así que aquí se simulan localmente
+la cuantización escalar int8 y la binaria (con y sin rescoring con los
+vectores originales tras sobremuestrear candidatos) y se compara su top-k
+con el de la búsqueda exacta en float32.
+"""
+import json
+import sys
+
+import numpy as np
+
+from search.uploader import compact_vector
+
+
+def quantize_int8(matrix: np.ndarray):
+    """Cuantización escalar por dimensión a int8 (rango min-max de cada dimensión)."""
+    low, high = matrix.min(axis=0), matrix.max(axis=0)
+    scale = np.where(high > low, (high - low) / 255, 1.0).astype(np.float32)
+    codes = np.round((matrix - low) / scale - 128).clip(-128, 127).astype(np.int8)
+    return codes, low, scale
+
+
+def _int8_scores(query: np.ndarray, quantized) -> np.ndarray:
+    codes, low, scale = quantized
+    return (codes.astype(np.float32) + 128) @ (query * scale) + float(query @ low)
+
+
+def _binary_scores(query: np.ndarray, bits: np.ndarray) -> np.ndarray:
+    # Menor distancia de Hamming = mayor puntuación
+    q = np.packbits(query > 0)
+    return -np.unpackbits(bits ^ q, axis=1).sum(axis=1, dtype=np.int32)
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _recall(found: np.ndarray, exact: np.ndarray) -> float:
+    return len(set(found.tolist()) & set(exact.tolist())) / len(exact)
+
+
+def quantization_recall(matrix: np.ndarray, queries: np.ndarray, k: int = 10, oversampling: float = 10.0) -> dict:
+    """recall@k de int8 y binaria frente a la búsqueda exacta, sin y con rescoring."""
+    matrix = matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9)
+    queries = queries / (np.linalg.norm(queries, axis=1, keepdims=True) + 1e-9)
+    int8 = quantize_int8(matrix)
+    bits = np.packbits(matrix > 0, axis=1)
+    candidates = int(k * oversampling)
+    out = {name: {'plain': [], 'rescored': []} for name in ('int8', 'binary')}
+    for query in queries:
+        exact = _top(matrix @ query, k)
+        for name, scores in (('int8', _int8_scores(query, int8)), ('binary', _binary_scores(query, bits))):
+            out[name]['plain'].append(_recall(_top(scores, k), exact))
+            pool = _top(scores, candidates)
+            rescored = pool[_top(matrix[pool] @ query, k)]
+            out[name]['rescored'].append(_recall(rescored, exact))
+    return {
+        name: {f"recall_at_{k}": float(np.mean(r['plain'])),
+               f"recall_at_{k}_rescored": float(np.mean(r['rescored']))}
+        for name, r in out.items()
+    }
+
+
+def representation_sizes(dims: int, seed: int = 0) -> dict:
+    """
+    Bytes por vector en memoria, en el JSON de subida y en el índice según la
+    compresión, para un vector unitario denso (como los de los modelos reales).
+    """
+    vector = np.random.default_rng(seed).standard_normal(dims).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    as_list = vector.astype(np.float64).tolist()
+    return {
+        'dimensions': dims,
+        'list_of_float_bytes': sys.getsizeof(as_list) + sum(sys.getsizeof(x) for x in as_list),
+        'float32_buffer_bytes': vector.astype(np.float32).nbytes,
+        'json_full_bytes': len(json.dumps(as_list)),
+        'json_compact_bytes': len(json.dumps(compact_vector(vector))),
+        'index_float32_bytes': 4 * dims,
+        'index_int8_bytes': dims,
+        'index_binary_bytes': (dims + 7) // 8,
+    }
+
+
+def bench_vectors(registry, questions, embed, k: int = 10, oversampling: float = 10.0) -> dict:
+    """
+    Mide tamaños y recall sobre los vectores indexados en el buscador falso.
+    embed(textos) devuelve los vectores de las preguntas.
+    """
+    docs = [d for d in registry['search'].docs.values() if d.get('contentVector') is not None]
+    if not docs or not questions:
+        return {}
+    matrix = np.asarray([d['contentVector'] for d in docs], dtype=np.float32)
+    queries = np.asarray(embed(questions), dtype=np.float32)
+    return {
+        'vectors': len(docs),
+        'queries': len(questions),
+        'oversampling': oversampling,
+        # Si candidates >= vectors el rescoring ve todo el corpus y su recall es trivialmente 1
+        'candidates': int(k * oversampling),
+        'sizes': representation_sizes(matrix.shape[1]),
+        'recall': quantization_recall(matrix, queries, k, oversampling),
+    }
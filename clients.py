@@ -1,40 +1,247 @@
+import threading
+from collections.abc import Mapping
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
 from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
 from azure.storage.blob import BlobServiceClient
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.textanalytics import TextAnalyticsClient
 from azure.data.tables import TableClient
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents import SearchClient
-from openai import AzureOpenAI
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+from openai import AzureOpenAI, AsyncAzureOpenAI
+
+from config import get_config
+
+
+class ClientRegistry(Mapping):
+    """
+    Registro de clientes de Azure construidos bajo demanda y compartidos por
+    todo el proceso (app Flask, módulo RAG y workers del pipeline).
+
+    - Ningún cliente se crea hasta que se accede a él: importar módulos no
+      toca la red.
+    - Los clientes del SDK de Azure comparten un único transporte HTTP con
+      pool de conexiones, y los de OpenAI un único httpx.Client.
+    - once() ejecuta comprobaciones de existencia (tabla, índice) una sola vez.
+    """
+
+    def __init__(self, cfg: dict):
+        self.cfg = cfg
+        self._clients = {}
+        self._done = set()
+        self._lock = threading.RLock()
+        self._factories = {
+            'blob': self._build_blob,
+            'doc': self._build_doc,
+            'ta': self._build_ta,
+            'table': self._build_table,
+            'index': self._build_index,
+            'search': self._build_search,
+            'oai': self._build_oai,
+            'chat': self._build_chat,
+        }
+        self._transport = None
+        self._http_client = None
+
+    # Transportes compartidos
+    def _azure_transport(self):
+        if self._transport is None:
+            pool = self.cfg['HTTP_POOL_SIZE']
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._transport = RequestsTransport(session=session, session_owner=False)
+        return self._transport
+
+    def _openai_http_client(self):
+        if self._http_client is None:
+            pool = self.cfg['HTTP_POOL_SIZE']
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=pool, max_keepalive_connections=pool)
+            )
+        return self._http_client
+
+    # Fábricas de clientes
+    def _build_blob(self):
+        blob_service = BlobServiceClient.from_connection_string(
+            self.cfg['STORAGE_CONN_STR'], transport=self._azure_transport()
+        )
+        return blob_service.get_container_client(self.cfg['BLOB_CONTAINER'])
+
+    def _build_doc(self):
+        return DocumentIntelligenceClient(
+            self.cfg['ENDPOINT_DI'], AzureKeyCredential(self.cfg['KEY_DI']),
+            transport=self._azure_transport()
+        )
+
+    def _build_ta(self):
+        return TextAnalyticsClient(
+            self.cfg['ENDPOINT_DI'], AzureKeyCredential(self.cfg['KEY_DI']),
+            transport=self._azure_transport()
+        )
+
+    def _build_table(self):
+        table_client = TableClient.from_connection_string(
+            self.cfg['STORAGE_CONN_STR'], self.cfg['TABLE_NAME'],
+            transport=self._azure_transport()
+        )
+        try:
+            table_client.create_table()
+        except Exception:
+            pass
+        return table_client
+
+    def _build_index(self):
+        return SearchIndexClient(
+            self.cfg['SEARCH_ENDPOINT'], AzureKeyCredential(self.cfg['SEARCH_KEY']),
+            transport=self._azure_transport()
+        )
+
+    def _build_search(self):
+        return SearchClient(
+            self.cfg['SEARCH_ENDPOINT'], self.cfg['INDEX_NAME'], AzureKeyCredential(self.cfg['SEARCH_KEY']),
+            transport=self._azure_transport()
+        )
+
+    def _build_oai(self):
+        return AzureOpenAI(
+            api_key=self.cfg['OAI_KEY'],
+            api_version=self.cfg['OAI_API_VERSION'],
+            azure_endpoint=self.cfg['OAI_ENDPOINT'],
+            http_client=self._openai_http_client()
+        )
+
+    def _build_chat(self):
+        return AzureOpenAI(
+            api_key=self.cfg['AZ_GPT_KEY'],
+            api_version=self.cfg['GPT_API_VERSION'],
+            azure_endpoint=self.cfg['AZ_GPT_ENPOINT'],
+            http_client=self._openai_http_client()
+        )
+
+    # Interfaz Mapping: clients['search'], etc.
+    def __getitem__(self, name: str):
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = self._factories[name]()
+            return self._clients[name]
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+    def once(self, key: str, fn):
+        """Ejecuta fn una sola vez por proceso para la clave dada (p. ej. crear el índice)."""
+        if key in self._done:
+            return
+        with self._lock:
+            if key not in self._done:
+                fn()
+                self._done.add(key)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_clients(cfg: dict = None) -> ClientRegistry:
+    """Devuelve el registro de clientes compartido del proceso."""
+    global _registry
+    cfg = cfg if cfg is not None else get_config()
+    with _registry_lock:
+        if _registry is None or _registry.cfg != cfg:
+            _registry = ClientRegistry(cfg)
+        return _registry
+
 
 def init_clients(cfg):
-    # Blob & Container
-    blob_service = BlobServiceClient.from_connection_string(cfg['STORAGE_CONN_STR'])
-    container_client = blob_service.get_container_client(cfg['BLOB_CONTAINER'])
-    # AI Document Intelligence
-    doc_client = DocumentIntelligenceClient(cfg['ENDPOINT_DI'], AzureKeyCredential(cfg['KEY_DI']))
-    ta_client = TextAnalyticsClient(cfg['ENDPOINT_DI'], AzureKeyCredential(cfg['KEY_DI']))
-    # Table Storage
-    table_client = TableClient.from_connection_string(cfg['STORAGE_CONN_STR'], cfg['TABLE_NAME'])
-    try:
-        table_client.create_table()
-    except Exception:
-        pass
-    # Cognitive Search
-    index_client = SearchIndexClient(cfg['SEARCH_ENDPOINT'], AzureKeyCredential(cfg['SEARCH_KEY']))
-    search_client = SearchClient(cfg['SEARCH_ENDPOINT'], cfg['INDEX_NAME'], AzureKeyCredential(cfg['SEARCH_KEY']))
-    # Azure OpenAI client
-    oai_client = AzureOpenAI(
-        api_key=cfg['OAI_KEY'],
-        api_version=cfg['OAI_API_VERSION'],
-        azure_endpoint=cfg['OAI_ENDPOINT']
-    )
-    return {
-        'blob': container_client,
-        'doc': doc_client,
-        'ta': ta_client,
-        'table': table_client,
-        'index': index_client,
-        'search': search_client,
-        'oai': oai_client
-    }
+    return get_clients(cfg)
+
+
+class AsyncClientRegistry(Mapping):
+    """
+    Clientes asíncronos (búsqueda, embeddings y chat) para la ruta de consulta
+    async. Se construyen bajo demanda y deben usarse desde un único event loop.
+    """
+
+    def __init__(self, cfg: dict):
+        self.cfg = cfg
+        self._clients = {}
+        self._http_client = None
+        self._factories = {
+            'search': self._build_search,
+            'oai': self._build_oai,
+            'chat': self._build_chat,
+        }
+
+    def _openai_http_client(self):
+        if self._http_client is None:
+            pool = self.cfg['HTTP_POOL_SIZE']
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=pool, max_keepalive_connections=pool)
+            )
+        return self._http_client
+
+    def _build_search(self):
+        return AsyncSearchClient(
+            self.cfg['SEARCH_ENDPOINT'], self.cfg['INDEX_NAME'], AzureKeyCredential(self.cfg['SEARCH_KEY'])
+        )
+
+    def _build_oai(self):
+        return AsyncAzureOpenAI(
+            api_key=self.cfg['OAI_KEY'],
+            api_version=self.cfg['OAI_API_VERSION'],
+            azure_endpoint=self.cfg['OAI_ENDPOINT'],
+            http_client=self._openai_http_client()
+        )
+
+    def _build_chat(self):
+        return AsyncAzureOpenAI(
+            api_key=self.cfg['AZ_GPT_KEY'],
+            api_version=self.cfg['GPT_API_VERSION'],
+            azure_endpoint=self.cfg['AZ_GPT_ENPOINT'],
+            http_client=self._openai_http_client()
+        )
+
+    def __getitem__(self, name: str):
+        if name not in self._clients:
+            self._clients[name] = self._factories[name]()
+        return self._clients[name]
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+    async def aclose(self):
+        """Cierra las conexiones de los clientes creados."""
+        if 'search' in self._clients:
+            await self._clients['search'].close()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._clients.clear()
+        self._http_client = None
+
+
+_async_registry = None
+
+
+def get_async_clients(cfg: dict = None) -> AsyncClientRegistry:
+    """Devuelve el registro de clientes asíncronos del proceso."""
+    global _async_registry
+    cfg = cfg if cfg is not None else get_config()
+    if _async_registry is None or _async_registry.cfg != cfg:
+        _async_registry = AsyncClientRegistry(cfg)
+    return _async_registry
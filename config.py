@@ -1,4 +1,5 @@
 import os
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -11,6 +12,16 @@ def load_config():
         'MODEL_ID_LAYOUT': os.getenv('AZ_MODEL_ID'),
         'MODEL_ID_OCR': os.getenv('AZ_OCR_MODEL_ID'),
         'ANALYZE_MODE': os.getenv('AZ_ANALYZE_MODE'),
+        'OCR_RENDER_WORKERS': int(os.getenv('OCR_RENDER_WORKERS', '2')),
+        'OCR_ANALYZE_WORKERS': int(os.getenv('OCR_ANALYZE_WORKERS', '8')),
+        'OCR_PAGE_RETRIES': int(os.getenv('OCR_PAGE_RETRIES', '2')),
+        'OCR_PAGE_TIMEOUT_S': float(os.getenv('OCR_PAGE_TIMEOUT_S', '120')),
+        'OCR_PAGE_WINDOW': int(os.getenv('OCR_PAGE_WINDOW', '16')),
+        # Directorio de los archivos temporales de descarga ('' = el del sistema)
+        'SPOOL_DIR': os.getenv('SPOOL_DIR', ''),
+        # Puntos de control por etapa (análisis y fragmentación; '' = desactivados)
+        'CHECKPOINT_DIR': os.getenv('CHECKPOINT_DIR', '.cache/checkpoints'),
+        'CHECKPOINT_MAX_MB': float(os.getenv('CHECKPOINT_MAX_MB', '2048')),
 
         # Blob Storage
         'STORAGE_CONN_STR': os.getenv('AZ_STORAGE_CONN_STRING'),
@@ -20,28 +31,99 @@ def load_config():
         'TABLE_NAME': os.getenv('AZ_TABLE_NAME'),
         'OUTPUT_CSV': Path(os.getenv('OUTPUT_CSV')),
         'SLOW_THRESHOLD': float(os.getenv('SLOW_THRESHOLD_S')),
+        # Las métricas por documento se escriben en lotes en segundo plano cada METRICS_FLUSH_S
+        'METRICS_FLUSH_S': float(os.getenv('METRICS_FLUSH_S', '2')),
 
         # Cognitive Search
         'SEARCH_ENDPOINT': os.getenv('AZ_SEARCH_ENDPOINT'),
         'SEARCH_KEY': os.getenv('AZ_SEARCH_KEY'),
         'INDEX_NAME': os.getenv('AZ_SEARCH_INDEX'),
+        'RETRIEVAL_BACKEND': os.getenv('RETRIEVAL_BACKEND', 'azure'),
+        'LOCAL_INDEX_DIR': os.getenv('LOCAL_INDEX_DIR', '.cache/local_index'),
+        'LOCAL_IVF_THRESHOLD': int(os.getenv('LOCAL_IVF_THRESHOLD', '50000')),
+        'LOCAL_IVF_NPROBE': int(os.getenv('LOCAL_IVF_NPROBE', '8')),
+        # Compresión del campo vectorial del índice: none, int8 o binary
+        'VECTOR_COMPRESSION': os.getenv('VECTOR_COMPRESSION', 'none'),
+        'VECTOR_OVERSAMPLING': float(os.getenv('VECTOR_OVERSAMPLING', '10')),
+        'RETRIEVAL_MODE': os.getenv('RETRIEVAL_MODE', 'vector'),
+        'HYBRID_CANDIDATES': int(os.getenv('HYBRID_CANDIDATES', '20')),
+        'RRF_K': int(os.getenv('RRF_K', '60')),
+        'CONTEXT_TOKEN_BUDGET': int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000')),
+        'CONTEXT_MAX_PASSAGE_TOKENS': int(os.getenv('CONTEXT_MAX_PASSAGE_TOKENS', '800')),
+        'CONTEXT_DUP_THRESHOLD': float(os.getenv('CONTEXT_DUP_THRESHOLD', '0.8')),
+        'UPLOAD_BATCH_DOCS': int(os.getenv('UPLOAD_BATCH_DOCS', '500')),
+        'UPLOAD_BATCH_BYTES': int(os.getenv('UPLOAD_BATCH_BYTES', '8000000')),
+        'UPLOAD_MAX_RETRIES': int(os.getenv('UPLOAD_MAX_RETRIES', '5')),
+        'UPLOAD_OVERLAP': os.getenv('UPLOAD_OVERLAP', 'true').lower() == 'true',
 
         # Azure OpenAI Embeddings
         'OAI_ENDPOINT': os.getenv('AZ_OPENAI_ENDPOINT'),
         'OAI_KEY': os.getenv('AZ_OPENAI_KEY'),
         'OAI_DEPLOYMENT': os.getenv('AZ_EMBED_DEPLOY'),
         'OAI_API_VERSION': os.getenv('AZ_OPENAI_API_VERSION'),
+        'EMBED_BATCH_SIZE': int(os.getenv('EMBED_BATCH_SIZE', '16')),
+        'EMBED_BATCH_TOKENS': int(os.getenv('EMBED_BATCH_TOKENS', '32000')),
+        'EMBED_CONCURRENCY': int(os.getenv('EMBED_CONCURRENCY', '4')),
+        'EMBED_MAX_RETRIES': int(os.getenv('EMBED_MAX_RETRIES', '6')),
+        # Dimensión reducida de los embeddings (0 = la del modelo; solo text-embedding-3)
+        'EMBED_DIMENSIONS': int(os.getenv('EMBED_DIMENSIONS', '0')),
+        'EMBED_CACHE_PATH': os.getenv('EMBED_CACHE_PATH', '.cache/embeddings.sqlite'),
+        'EMBED_CACHE_MEMORY_ITEMS': int(os.getenv('EMBED_CACHE_MEMORY_ITEMS', '10000')),
+        'EMBED_CACHE_DISK_ITEMS': int(os.getenv('EMBED_CACHE_DISK_ITEMS', '1000000')),
 
         # GPT (Azure)
         'AZ_GPT_DEPLOYMENT': os.getenv('AZ_GPT_DEPLOYMENT'),
         'AZ_GPT_ENPOINT': os.getenv('AZ_GPT_OPENAI_ENDPOINT'),
         'AZ_GPT_KEY': os.getenv('AZ_GPT_OPENAI_4_KEY'),
         'GPT_OAI_KEY': os.getenv('AZ_GPT_OPENAI_KEY'),
+        'GPT_API_VERSION': os.getenv('AZ_GPT_API_VERSION', '2025-01-01-preview'),
+
+        # Caché semántica de respuestas RAG
+        'ANSWER_CACHE_ENABLED': os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true',
+        'ANSWER_CACHE_THRESHOLD': float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.97')),
+        'ANSWER_CACHE_TTL_S': float(os.getenv('ANSWER_CACHE_TTL_S', '3600')),
+        'ANSWER_CACHE_MAX_ENTRIES': int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '2000')),
+
+        # Consultas RAG por lotes (/query/batch): preguntas por petición de embeddings,
+        # preguntas embebidas por ventana y búsquedas / llamadas de chat simultáneas
+        'RAG_BATCH_EMBED_SIZE': int(os.getenv('RAG_BATCH_EMBED_SIZE', '128')),
+        'RAG_BATCH_WINDOW': int(os.getenv('RAG_BATCH_WINDOW', '512')),
+        'RAG_BATCH_SEARCH_CONCURRENCY': int(os.getenv('RAG_BATCH_SEARCH_CONCURRENCY', '16')),
+        'RAG_BATCH_CHAT_CONCURRENCY': int(os.getenv('RAG_BATCH_CHAT_CONCURRENCY', '8')),
+        'RAG_BATCH_MAX_QUESTIONS': int(os.getenv('RAG_BATCH_MAX_QUESTIONS', '10000')),
+
+        # Conexiones HTTP compartidas por los clientes
+        'HTTP_POOL_SIZE': int(os.getenv('HTTP_POOL_SIZE', '32')),
 
         # Chunk sizes
         'MIN_CHUNK_SIZE': int(os.getenv('MIN_CHUNK_SIZE_CHARS')),
         'MAX_CHUNK_SIZE': int(os.getenv('MAX_CHUNK_SIZE_CHARS')),
         'COVERAGE_THRESHOLD': float(os.getenv('COVERAGE_THRESHOLD_PCT')),
+        'CHUNK_OVERLAP': int(os.getenv('CHUNK_OVERLAP_CHARS', '200')),
+
+        # Deduplicación de fragmentos (exacta + MinHash/LSH)
+        'DEDUP_NEAR_THRESHOLD': float(os.getenv('DEDUP_NEAR_THRESHOLD', '0.85')),
+        'DEDUP_NUM_PERM': int(os.getenv('DEDUP_NUM_PERM', '128')),
+        'DEDUP_BANDS': int(os.getenv('DEDUP_BANDS', '16')),
+        'DEDUP_CORPUS': os.getenv('DEDUP_CORPUS', 'false').lower() == 'true',
+        'DEDUP_INDEX_PATH': os.getenv('DEDUP_INDEX_PATH', '.cache/dedup.sqlite'),
+
+        # Cola de ingesta
+        'INGEST_WORKERS': int(os.getenv('INGEST_WORKERS', '2')),
+        'INGEST_QUEUE_SIZE': int(os.getenv('INGEST_QUEUE_SIZE', '100')),
+
+        # Ingesta masiva (run_pipeline / ingest_blobs): documentos en paralelo
+        'PIPELINE_WORKERS': int(os.getenv('PIPELINE_WORKERS', '4')),
+        'PIPELINE_POOL': os.getenv('PIPELINE_POOL', 'thread'),
+        'PIPELINE_DOC_RETRIES': int(os.getenv('PIPELINE_DOC_RETRIES', '2')),
+
+        # Límites de tasa compartidos por servicio (peticiones/s; 0 = sin límite)
+        'DI_MAX_RPS': float(os.getenv('DI_MAX_RPS', '15')),
+        'TA_MAX_RPS': float(os.getenv('TA_MAX_RPS', '0')),
+        'OPENAI_MAX_RPS': float(os.getenv('OPENAI_MAX_RPS', '0')),
+        'OPENAI_MAX_TPM': float(os.getenv('OPENAI_MAX_TPM', '0')),
+        'SEARCH_MAX_RPS': float(os.getenv('SEARCH_MAX_RPS', '0')),
+        'RATE_LIMIT_BURST_S': float(os.getenv('RATE_LIMIT_BURST_S', '1')),
     }
 
     missing = [k for k, v in cfg.items() if v is None]
@@ -49,3 +131,16 @@ def load_config():
         raise EnvironmentError(f"Faltan variables de entorno: {', '.join(missing)}")
     
     return cfg
+
+
+_cfg = None
+_cfg_lock = threading.Lock()
+
+
+def get_config():
+    """Devuelve la configuración del proceso, cargada una sola vez."""
+    global _cfg
+    with _cfg_lock:
+        if _cfg is None:
+            _cfg = load_config()
+        return _cfg
@@ -1,12 +1,42 @@
 import io
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
 import fitz
 
-def analyze_bytes(stream: io.BytesIO, model: str, doc_client):
+from utils.telemetry import external_call, record, submit_in_context
+
+# PyMuPDF no es seguro entre hilos: con varios documentos en paralelo, el uso
+# de fitz en el proceso principal se serializa
+_FITZ_LOCK = threading.Lock()
+
+# Documento PDF abierto una sola vez por proceso de renderizado
+_render_doc = None
+
+# Hacer fork de este proceso, que ya tiene hilos (cola de ingesta, pool del
+# pipeline, limitador, estado de MuPDF), puede dejar a los hijos bloqueados en
+# locks heredados: los renderizadores salen de un servidor forkserver de un
+# solo hilo con este módulo precargado (o de spawn donde no hay forkserver)
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    _RENDER_CONTEXT = multiprocessing.get_context('forkserver')
+    _RENDER_CONTEXT.set_forkserver_preload(['processing.analyzer'])
+else:
+    _RENDER_CONTEXT = multiprocessing.get_context('spawn')
+
+
+def analyze_bytes(stream: io.BytesIO, model: str, doc_client, timeout: float = 120):
     """Analiza bytes como documento con el modelo especificado."""
-    return doc_client.begin_analyze_document(model, stream).result(timeout=120)
+    with external_call('document_intelligence', model):
+        return doc_client.begin_analyze_document(model, stream).result(timeout=timeout)
 
-def extract_paragraphs_objects(paragraph_objs):
-    """Convierte objetos de párrafo de Document Intelligence en dicts filtrados."""
+def extract_paragraphs_objects(paragraph_objs, page_number: int = None):
+    """
+    Convierte objetos de párrafo de Document Intelligence en dicts filtrados.
+    Si se indica page_number se usa en lugar del de la región (OCR por página).
+    """
     paras = []
     for p in paragraph_objs:
         if (p.role or 'paragraph') in ('pageFooter','pageNumber'):
@@ -15,23 +45,132 @@ def extract_paragraphs_objects(paragraph_objs):
             'type': 'paragraph',
             'role': p.role or 'paragraph',
             'content': p.content.strip(),
-            'page': p.bounding_regions[0].page_number
+            'page': page_number or p.bounding_regions[0].page_number
         })
     return paras
 
-def analyze_document_stream(stream: io.BytesIO, doc_client, use_ocr: bool, model_layout: str, model_ocr: str):
-    """Analiza el documento completo, con OCR si se solicita."""
-    stream.seek(0)
+def _init_renderer(pdf_path: str):
+    global _render_doc
+    _render_doc = fitz.open(pdf_path)
+
+def _render_page(page_index: int) -> bytes:
+    """Renderiza una página del PDF del proceso actual como PNG."""
+    return _render_doc[page_index].get_pixmap().tobytes('png')
+
+def _analyze_page(img_data: bytes, page_number: int, doc_client, model_ocr: str, retries: int, timeout: float):
+    """Analiza la imagen de una página con reintentos y backoff exponencial."""
+    for attempt in range(retries + 1):
+        try:
+            result = analyze_bytes(io.BytesIO(img_data), model_ocr, doc_client, timeout=timeout)
+            return extract_paragraphs_objects(getattr(result, 'paragraphs', None) or [], page_number)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            wait = 2 ** attempt
+            record('retries', 1, 'Reintentos de llamadas externas', service='document_intelligence')
+            logging.warning("OCR página %d: reintento %d en %ds (%s)", page_number, attempt + 1, wait, e)
+            time.sleep(wait)
+
+def _noop_image(size: int):
+    pass
+
+def analyze_pages_concurrently(
+    pdf_path: str,
+    doc_client,
+    model_ocr: str,
+    render_workers: int = 2,
+    analyze_workers: int = 8,
+    retries: int = 2,
+    timeout: float = 120,
+    page_window: int = 16,
+    on_image=None
+):
+    """
+    OCR concurrente por ventanas de page_window páginas: cada ventana se
+    renderiza en un pool de procesos (que abren el PDF desde disco) y se
+    analiza en un pool de hilos acotado. Genera los párrafos en orden de
+    página; solo las imágenes de la ventana en curso están en memoria.
+    """
+    on_image = on_image or _noop_image
+    with _FITZ_LOCK, fitz.open(pdf_path) as doc:
+        num_pages = doc.page_count
+    if not num_pages:
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(render_workers, num_pages)),
+        mp_context=_RENDER_CONTEXT,
+        initializer=_init_renderer,
+        initargs=(pdf_path,)
+    ) as renderers, ThreadPoolExecutor(max_workers=max(1, analyze_workers)) as analyzers:
+        for start in range(0, num_pages, page_window):
+            pages = range(start, min(start + page_window, num_pages))
+            rendered = {renderers.submit(_render_page, i): i for i in pages}
+            analyses, page_paras = {}, {}
+            try:
+                for fut in as_completed(rendered):
+                    i = rendered[fut]
+                    img_data = fut.result()
+                    on_image(len(img_data))
+                    analyses[submit_in_context(
+                        analyzers, _analyze_page, img_data, i + 1, doc_client, model_ocr, retries, timeout
+                    )] = i
+                for fut in as_completed(analyses):
+                    page_paras[analyses[fut]] = fut.result()
+            except Exception:
+                # Si una página falla definitivamente, no seguir con el resto
+                for fut in list(rendered) + list(analyses):
+                    fut.cancel()
+                raise
+            for i in pages:
+                yield from page_paras.pop(i)
+
+def iter_document_paragraphs(
+    pdf_path: str,
+    doc_client,
+    use_ocr: bool,
+    model_layout: str,
+    model_ocr: str,
+    render_workers: int = 1,
+    analyze_workers: int = 1,
+    page_retries: int = 0,
+    page_timeout: float = 120,
+    page_window: int = 16,
+    on_image=None
+):
+    """
+    Analiza el documento guardado en pdf_path y genera sus párrafos en orden,
+    con OCR por página si se solicita. El archivo se lee desde disco, de modo
+    que la memoria no depende del tamaño del documento. on_image(bytes) se
+    invoca con el tamaño de cada página renderizada.
+    """
+    on_image = on_image or _noop_image
     if use_ocr:
-        doc = fitz.open(stream=stream.getbuffer(), filetype='pdf')
-        paras_all, img_sizes = [], []
-        for page in doc:
-            pix = page.get_pixmap()
-            img_data = pix.tobytes('png')
-            img_sizes.append(len(img_data))
-            paras = analyze_bytes(io.BytesIO(img_data), model_ocr, doc_client)
-            paras_all.extend(getattr(paras, 'paragraphs', []))
-        return extract_paragraphs_objects(paras_all), img_sizes
+        if analyze_workers > 1:
+            yield from analyze_pages_concurrently(
+                pdf_path, doc_client, model_ocr,
+                render_workers=render_workers,
+                analyze_workers=analyze_workers,
+                retries=page_retries,
+                timeout=page_timeout,
+                page_window=page_window,
+                on_image=on_image
+            )
+            return
+        with _FITZ_LOCK:
+            doc = fitz.open(pdf_path)
+        try:
+            for i in range(doc.page_count):
+                with _FITZ_LOCK:
+                    img_data = doc[i].get_pixmap().tobytes('png')
+                on_image(len(img_data))
+                yield from _analyze_page(
+                    img_data, i + 1, doc_client, model_ocr, page_retries, page_timeout
+                )
+        finally:
+            with _FITZ_LOCK:
+                doc.close()
     else:
-        result = doc_client.begin_analyze_document(model_layout, stream).result(timeout=120)
-        return extract_paragraphs_objects(getattr(result, 'paragraphs', [])), []
+        with open(pdf_path, 'rb') as body:
+            result = analyze_bytes(body, model_layout, doc_client)
+        yield from extract_paragraphs_objects(getattr(result, 'paragraphs', None) or [])
@@ -0,0 +1,147 @@
+import threading
+import time
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Caché de respuestas RAG indexada por similitud del embedding de la pregunta.
+
+    Una entrada se reutiliza cuando la pregunta nueva tiene similitud coseno
+    >= threshold con una pregunta cacheada con los mismos k y temperature y la
+    entrada no ha caducado (ttl_s). Cada entrada recuerda qué documentos
+    aportaron contexto; invalidate_files() descarta las entradas afectadas
+    cuando esos documentos se reingestan.
+
+    La caché vive en el proceso: las ingestas hechas en otro proceso no la
+    invalidan y en ese caso el TTL acota la antigüedad de las respuestas.
+    """
+
+    def __init__(self, threshold: float = 0.97, ttl_s: float = 3600, max_entries: int = 2000):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._entries = [None] * max_entries
+        self._active = np.zeros(max_entries, dtype=bool)
+        self._next = 0
+        self._by_file = {}
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'invalidated': 0,
+            'expired': 0,
+            'latency_saved_s': 0.0,
+        }
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _drop(self, slot: int):
+        entry = self._entries[slot]
+        if entry is None:
+            return
+        for name in entry['file_names']:
+            slots = self._by_file.get(name)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del self._by_file[name]
+        self._entries[slot] = None
+        self._active[slot] = False
+
+    def lookup(self, vector, k: int, temperature: float) -> Optional[dict]:
+        """Devuelve la entrada cacheada más similar por encima del umbral, o None."""
+        with self._lock:
+            if self._matrix is None or not self._active.any():
+                self.stats['misses'] += 1
+                return None
+            query = self._normalize(vector)
+            slots = np.flatnonzero(self._active)
+            sims = self._matrix[slots] @ query
+            now = time.time()
+            for idx in np.argsort(-sims):
+                if sims[idx] < self.threshold:
+                    break
+                slot = int(slots[idx])
+                entry = self._entries[slot]
+                if now - entry['created'] > self.ttl_s:
+                    self._drop(slot)
+                    self.stats['expired'] += 1
+                    continue
+                if entry['k'] == k and entry['temperature'] == temperature:
+                    self.stats['hits'] += 1
+                    self.stats['latency_saved_s'] += entry['latency_s']
+                    return dict(entry, similarity=float(sims[idx]))
+            self.stats['misses'] += 1
+            return None
+
+    def store(self, vector, k: int, temperature: float, answer: str,
+              file_names: Iterable[str], latency_s: float):
+        """Guarda una respuesta; al llenarse reemplaza la entrada más antigua."""
+        vec = self._normalize(vector)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vec.shape[0]), dtype=np.float32)
+            slot = self._next
+            self._next = (self._next + 1) % self.max_entries
+            self._drop(slot)
+            names = set(file_names)
+            self._matrix[slot] = vec
+            self._entries[slot] = {
+                'answer': answer,
+                'k': k,
+                'temperature': temperature,
+                'file_names': names,
+                'latency_s': latency_s,
+                'created': time.time(),
+            }
+            self._active[slot] = True
+            for name in names:
+                self._by_file.setdefault(name, set()).add(slot)
+            self.stats['stores'] += 1
+
+    def invalidate_files(self, file_names: List[str]) -> int:
+        """Descarta las entradas cuyo contexto incluía alguno de los documentos."""
+        with self._lock:
+            slots = set()
+            for name in file_names:
+                slots.update(self._by_file.get(name, ()))
+            for slot in slots:
+                self._drop(slot)
+            self.stats['invalidated'] += len(slots)
+            return len(slots)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = int(self._active.sum())
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_answer_cache(cfg: dict) -> Optional[SemanticAnswerCache]:
+    """Caché de respuestas compartida del proceso, o None si está deshabilitada."""
+    global _default_cache
+    if not cfg['ANSWER_CACHE_ENABLED']:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SemanticAnswerCache(
+                threshold=cfg['ANSWER_CACHE_THRESHOLD'],
+                ttl_s=cfg['ANSWER_CACHE_TTL_S'],
+                max_entries=cfg['ANSWER_CACHE_MAX_ENTRIES']
+            )
+        return _default_cache
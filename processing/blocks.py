@@ -0,0 +1,86 @@
+"""
+Clasificador de bloques en una sola pasada: elementos de lista, líneas de
+continuación ('o ...') y títulos, con un único patrón precompilado que
+combina todas las reglas locales. Lo usa chunking antes de decidir qué
+bloques hay que consultar a Text Analytics.
+"""
+import re
+
+from utils.helpers import LIST_MARKER
+
+# Roles de Document Intelligence que ya indican un título
+HEADING_ROLES = frozenset(('title', 'sectionHeading'))
+# Tipos de los bloques de lista que genera classify_blocks
+LIST_TYPES = frozenset(('list_item', 'list_text'))
+# Un título rara vez supera estos límites; por encima no se consulta Text Analytics
+MAX_HEADING_CHARS = 120
+MAX_HEADING_WORDS = 15
+
+# Un solo match por bloque: primero marcador de lista y, si no, las reglas de título
+# (mayúsculas, numeración de sección, 'texto:' corto y 'Capítulo N')
+_BLOCK_RE = re.compile(
+    rf'^(?:(?P<indent>\s*)(?:{LIST_MARKER})\s+'
+    r'|(?P<heading>[A-ZÁÉÍÓÚÑ\s]{5,}$|\d+(?:\.\d+)*\s|.{1,50}:$|(?i:capítulo)\s+\d))'
+)
+
+
+def _text_guess(text: str):
+    """Reglas de título que no dependen del patrón: longitud y puntuación final."""
+    if len(text) > MAX_HEADING_CHARS:
+        return False
+    words = len(text.split())
+    if words < 2:
+        return False
+    if words > MAX_HEADING_WORDS:
+        return False
+    if text.rstrip()[-1] in '.;,':
+        return False
+    return None
+
+
+def heading_guess(block):
+    """
+    Clasifica un bloque con las reglas locales (rol de DI, patrones,
+    longitud, puntuación). Devuelve True/False si es concluyente o None si
+    hay que consultar Text Analytics.
+    """
+    if block.get('role') in HEADING_ROLES:
+        return True
+    if block.get('type') in LIST_TYPES:
+        return False
+    text = block.get('content', '')
+    m = _BLOCK_RE.match(text)
+    if m and m.group('heading'):
+        return True
+    return _text_guess(text)
+
+
+def classify_blocks(blocks):
+    """
+    Genera (bloque, título) recorriendo los bloques una sola vez. título es
+    True/False/None como en heading_guess. Los elementos de lista salen como
+    bloques 'list_item' sin el marcador (con su nivel de anidamiento) y las
+    líneas 'o ...' que los siguen como 'list_text'; ninguno es un título.
+    """
+    levels, last_list = [], False
+    for b in blocks:
+        if b.get('role') in HEADING_ROLES:
+            last_list = False
+            yield b, True
+            continue
+        text = b.get('content', '')
+        m = _BLOCK_RE.match(text)
+        if m and m.group('heading') is None:
+            indent = len(m.group('indent'))
+            while levels and indent <= levels[-1]:
+                levels.pop()
+            levels.append(indent)
+            last_list = True
+            yield dict(b, type='list_item', content=text[m.end():].strip(), level=len(levels) - 1), False
+            continue
+        if last_list and text.lstrip().startswith('o '):
+            yield dict(b, type='list_text', content=text.lstrip()[2:].strip(), level=len(levels) - 1), False
+            continue
+        last_list = False
+        levels.clear()
+        yield b, (True if m else _text_guess(text))
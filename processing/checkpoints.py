@@ -0,0 +1,136 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+# Versión del formato de cada etapa: subirla invalida los puntos de control
+# guardados cuando cambia el código que produce esa etapa
+STAGE_VERSIONS = {'paragraphs': 1, 'chunks': 2}
+
+_READ_CHUNK = 1 << 20
+
+
+def file_digest(path: str) -> str:
+    """sha256 del contenido de un archivo, leído por bloques."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_READ_CHUNK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def stage_key(stage: str, *parts) -> str:
+    """Clave de una etapa a partir de su entrada (hash del contenido o de la etapa anterior) y sus parámetros."""
+    raw = json.dumps([stage, STAGE_VERSIONS[stage], *parts], default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class StageCheckpoints:
+    """
+    Puntos de control por etapa del pipeline, direccionados por contenido.
+
+    Cada etapa se guarda como JSON Lines comprimido con gzip en
+    <directorio>/<etapa>/<clave>.jsonl.gz. Los elementos se escriben a medida
+    que el generador los produce y el archivo solo se publica (rename
+    atómico) si la etapa termina completa, de modo que un fallo a mitad de
+    documento nunca deja un punto de control parcial. El tamaño total se
+    acota a max_bytes borrando primero los archivos usados hace más tiempo.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 0):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = sum(p.stat().st_size for p in self.directory.glob('*/*.jsonl.gz')) \
+            if self.directory.exists() else 0
+
+    def _path(self, stage: str, key: str) -> Path:
+        return self.directory / stage / f"{key}.jsonl.gz"
+
+    def read(self, stage: str, key: str) -> Optional[Iterator]:
+        """Generador con los elementos guardados de la etapa, o None si no hay punto de control."""
+        path = self._path(stage, key)
+        if not path.exists():
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return self._iter_file(path)
+
+    @staticmethod
+    def _iter_file(path: Path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def record(self, stage: str, key: str, items: Iterable) -> Iterator:
+        """
+        Genera los elementos de items guardándolos a la vez; el punto de
+        control se publica solo si items se consume hasta el final.
+        """
+        path = self._path(stage, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        complete = False
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8', compresslevel=6) as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False, separators=(',', ':')))
+                    f.write('\n')
+                    yield item
+            complete = True
+        finally:
+            if complete:
+                os.replace(tmp, path)
+                self._account(path)
+            else:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def write(self, stage: str, key: str, items: Iterable) -> int:
+        """Consume items entero y publica el punto de control. Devuelve el número de elementos."""
+        n = 0
+        for _ in self.record(stage, key, items):
+            n += 1
+        return n
+
+    def _account(self, written: Path):
+        with self._lock:
+            self._total += written.stat().st_size
+            if not self.max_bytes or self._total <= self.max_bytes:
+                return
+            files = sorted(self.directory.glob('*/*.jsonl.gz'), key=lambda p: p.stat().st_mtime)
+            for old in files:
+                if self._total <= self.max_bytes:
+                    break
+                if old == written:
+                    continue
+                try:
+                    freed = old.stat().st_size
+                    old.unlink()
+                    self._total -= freed
+                except OSError:
+                    logging.warning("No se pudo borrar el punto de control %s", old)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_checkpoints(cfg: dict) -> Optional[StageCheckpoints]:
+    """Puntos de control compartidos del proceso, o None si CHECKPOINT_DIR está vacío."""
+    global _default
+    if not cfg['CHECKPOINT_DIR']:
+        return None
+    with _default_lock:
+        if _default is None:
+            _default = StageCheckpoints(cfg['CHECKPOINT_DIR'], int(cfg['CHECKPOINT_MAX_MB'] * 2**20))
+        return _default
@@ -1,63 +1,214 @@
+import hashlib
 import re
-from utils.helpers import compile_list_regex
+import threading
+from collections import OrderedDict
+from processing.blocks import classify_blocks, heading_guess
+from utils.helpers import iter_windows
+from utils.telemetry import external_call
+
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?;:])\s+')
+
+# Máximo de documentos por petición síncrona de extract_key_phrases
+TA_MAX_BATCH = 10
+# Bloques clasificados por ventana en chunk_by_headings (acota memoria y agrupa llamadas a TA)
+HEADING_WINDOW_BLOCKS = 500
+
+_key_phrase_cache = OrderedDict()
+_key_phrase_lock = threading.Lock()
+_KEY_PHRASE_CACHE_ITEMS = 50000
+
+
+def _key_phrase_verdicts(texts, ta_client):
+    """
+    Devuelve {texto: es_titulo} consultando extract_key_phrases en lotes del
+    tamaño máximo permitido y cacheando el resultado por hash del texto.
+    """
+    verdicts, pending = {}, {}
+    with _key_phrase_lock:
+        for text in texts:
+            key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            if key in _key_phrase_cache:
+                _key_phrase_cache.move_to_end(key)
+                verdicts[text] = _key_phrase_cache[key]
+            else:
+                pending[key] = text
+
+    items = list(pending.items())
+    for start in range(0, len(items), TA_MAX_BATCH):
+        batch = items[start:start + TA_MAX_BATCH]
+        try:
+            with external_call('text_analytics', 'key_phrases'):
+                results = ta_client.extract_key_phrases([t for _, t in batch], language='es')
+        except Exception:
+            for _, text in batch:
+                verdicts[text] = False
+            continue
+        with _key_phrase_lock:
+            for (key, text), resp in zip(batch, results):
+                if getattr(resp, 'is_error', False):
+                    verdicts[text] = False
+                    continue
+                verdict = bool(resp.key_phrases) and len(resp.key_phrases) < 2
+                verdicts[text] = verdict
+                _key_phrase_cache[key] = verdict
+            while len(_key_phrase_cache) > _KEY_PHRASE_CACHE_ITEMS:
+                _key_phrase_cache.popitem(last=False)
+    return verdicts
+
+
+def classify_headings(blocks, ta_client, guesses=None):
+    """
+    Indica para cada bloque si es un título. Las reglas locales resuelven la
+    mayoría de los casos y los candidatos restantes se envían a Text Analytics
+    en peticiones por lotes, de modo que un documento largo requiere unas
+    pocas llamadas en lugar de una por párrafo. guesses permite pasar las
+    clasificaciones locales ya calculadas (classify_blocks).
+    """
+    if guesses is None:
+        guesses = [heading_guess(b) for b in blocks]
+    candidates = list(dict.fromkeys(
+        b.get('content', '') for b, g in zip(blocks, guesses) if g is None
+    ))
+    verdicts = _key_phrase_verdicts(candidates, ta_client) if candidates else {}
+    return [
+        g if g is not None else verdicts.get(b.get('content', ''), False)
+        for b, g in zip(blocks, guesses)
+    ]
+
 
 def detect_title_with_text_analytics(text: str, ta_client) -> bool:
-    if not text or len(text.split()) < 2:
-        return False
-    if re.match(r'^.{1,50}:$', text) or re.match(r'^Capítulo\s+\d+', text, re.IGNORECASE):
-        return True
-    try:
-        resp = ta_client.extract_key_phrases([text], language='es')[0]
-        return bool(resp.key_phrases) and len(resp.key_phrases) < 2
-    except Exception:
-        return False
+    return classify_headings([{'content': text}], ta_client)[0]
 
 def normalize_lists(blocks):
-    list_re = compile_list_regex()
-    root, stack, last_list = [], [(0, [])], False
-    for b in blocks:
-        text = b.get('content', '')
-        m = list_re.match(text)
-        if m:
-            indent = len(m.group('indent'))
-            item = {'type': 'list_item', 'text': text[m.end():].strip(), 'children': []}
-            while len(stack) > 1 and indent <= stack[-1][0]:
-                stack.pop()
-            stack[-1][1].append(item)
-            stack.append((indent, item['children']))
-            last_list = True
-            continue
-        if last_list and text.lstrip().startswith('o '):
-            stack[-1][1].append({'type':'list_text', 'text':text.lstrip()[2:].strip()})
-            continue
-        last_list = False
-        root.append(b)
-    return root
-
-def chunk_by_headings(blocks, ta_client):
-    up_re    = re.compile(r'^[A-ZÁÉÍÓÚÑ\s]{5,}$')
-    sec_re   = re.compile(r'^(\d+(?:\.\d+)*)\s+')
-    colon_re = re.compile(r'^.{1,50}:$')
-    chunks, cur = [], {'heading': None, 'paragraphs': []}
-
-    def start_chunk(h):
-        nonlocal cur
-        if cur['paragraphs']:
-            chunks.append(cur)
-        cur = {'heading': h, 'paragraphs': []}
-
-    for b in blocks:
-        text = b.get('content', '')
-        if (
-            b.get('role') in ('title','sectionHeading')
-            or up_re.match(text)
-            or sec_re.match(text)
-            or colon_re.match(text)
-            or detect_title_with_text_analytics(text, ta_client)
-        ):
-            start_chunk(text)
-        elif b.get('type') in ('paragraph','list_item','list_text'):
-            cur['paragraphs'].append(text)
+    """Bloques con los elementos de lista y sus continuaciones como 'list_item' / 'list_text'."""
+    return (b for b, _ in classify_blocks(blocks))
+
+def chunk_classified(pairs, ta_client, window: int = HEADING_WINDOW_BLOCKS):
+    """
+    Genera fragmentos {'heading', 'paragraphs'} a medida que se cierran a
+    partir de pares (bloque, título local) de classify_blocks. Los títulos
+    dudosos se resuelven por ventanas de bloques, así que los pares pueden
+    llegar de un generador sin cargar el documento entero.
+    """
+    cur = {'heading': None, 'paragraphs': []}
+    for batch in iter_windows(pairs, window):
+        blocks = [b for b, _ in batch]
+        for b, heading in zip(blocks, classify_headings(blocks, ta_client, [g for _, g in batch])):
+            text = b.get('content', '')
+            if heading:
+                if cur['paragraphs']:
+                    yield cur
+                cur = {'heading': text, 'paragraphs': []}
+            elif b.get('type') in ('paragraph','list_item','list_text'):
+                cur['paragraphs'].append(text)
     if cur['paragraphs']:
-        chunks.append(cur)
-    return chunks
+        yield cur
+
+def chunk_by_headings(blocks, ta_client, window: int = HEADING_WINDOW_BLOCKS):
+    """chunk_classified para bloques ya normalizados (clasifica cada uno con heading_guess)."""
+    return chunk_classified(((b, heading_guess(b)) for b in blocks), ta_client, window)
+
+
+def _split_text(text: str, max_size: int):
+    """
+    Divide un párrafo en unidades de como máximo max_size caracteres cortando
+    por oraciones; una oración que por sí sola no cabe se corta por palabras.
+    """
+    if len(text) <= max_size:
+        return [text]
+    units = []
+    for sentence in _SENTENCE_END_RE.split(text):
+        if len(sentence) <= max_size:
+            units.append(sentence)
+            continue
+        cur = ''
+        for word in sentence.split():
+            while len(word) > max_size:
+                if cur:
+                    units.append(cur)
+                    cur = ''
+                units.append(word[:max_size])
+                word = word[max_size:]
+            if cur and len(cur) + 1 + len(word) > max_size:
+                units.append(cur)
+                cur = word
+            else:
+                cur = f"{cur} {word}" if cur else word
+        if cur:
+            units.append(cur)
+    return units
+
+
+def _overlap_tail(units, overlap: int):
+    """Últimas unidades de un fragmento que caben en overlap caracteres."""
+    tail, size = [], 0
+    for unit in reversed(units):
+        add = len(unit) + (1 if tail else 0)
+        if size + add > overlap:
+            break
+        tail.insert(0, unit)
+        size += add
+    return tail, size
+
+
+def _pack_section(paragraphs, max_size: int, overlap: int):
+    """
+    Reparte los párrafos de una sección en piezas de como máximo max_size
+    caracteres (medidos como ' '.join). Cada pieza nueva empieza con las
+    últimas oraciones de la anterior hasta overlap caracteres.
+    """
+    pieces, cur, size, carried = [], [], 0, 0
+    for para in paragraphs:
+        for unit in _split_text(para, max_size):
+            if cur and size + 1 + len(unit) > max_size:
+                # Una pieza con solo el solape heredado no aporta texto nuevo
+                if len(cur) > carried:
+                    pieces.append(cur)
+                cur, size = _overlap_tail(cur, min(overlap, max_size - len(unit) - 1))
+                carried = len(cur)
+            size += len(unit) + (1 if cur else 0)
+            cur.append(unit)
+    if len(cur) > carried:
+        pieces.append(cur)
+    return pieces
+
+
+def resize_chunks(chunks, min_size: int, max_size: int, overlap: int = 0):
+    """
+    Ajusta en una sola pasada (como generador) los fragmentos de
+    chunk_by_headings a [min_size, max_size] caracteres:
+      - las secciones demasiado largas se parten por párrafos y oraciones,
+        solapando overlap caracteres entre piezas consecutivas;
+      - las secciones cortas se fusionan con la vecina anterior mientras el
+        resultado no supere max_size.
+    Cada fragmento conserva 'heading' (el de su primera sección) y añade
+    'headings' con todos los títulos de las secciones que contiene.
+    """
+    overlap = max(0, min(overlap, max_size // 2))
+    prev, prev_size = None, 0
+    for chunk in chunks:
+        heading = chunk.get('heading')
+        pieces = _pack_section(chunk['paragraphs'], max_size, overlap)
+        for i, paragraphs in enumerate(pieces):
+            size = len(' '.join(paragraphs))
+            # Solo la primera pieza de una sección (sin solape) puede fusionarse
+            if (
+                i == 0 and prev is not None
+                and (size < min_size or prev_size < min_size)
+                and prev_size + 1 + size <= max_size
+            ):
+                prev['paragraphs'].extend(paragraphs)
+                if heading is not None and heading not in prev['headings']:
+                    prev['headings'].append(heading)
+                prev_size += 1 + size
+                continue
+            if prev is not None:
+                yield prev
+            prev = {
+                'heading': heading,
+                'headings': [heading] if heading is not None else [],
+                'paragraphs': list(paragraphs)
+            }
+            prev_size = size
+    if prev is not None:
+        yield prev
@@ -0,0 +1,82 @@
+import re
+from typing import List, Tuple
+
+from processing.dedup import jaccard, shingle_hashes
+from utils.helpers import estimate_tokens
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?;:])\s+')
+_WORD_RE = re.compile(r'\w+')
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+# Por debajo de este espacio restante no compensa recortar un pasaje más
+_MIN_PASSAGE_TOKENS = 40
+
+
+def _terms(text: str) -> set:
+    return {w for w in _WORD_RE.findall(text.lower()) if len(w) > 2}
+
+
+def trim_to_relevant(text: str, query_terms: set, max_tokens: int) -> str:
+    """
+    Recorta un pasaje a max_tokens conservando las oraciones con más términos
+    de la pregunta, en su orden original.
+    """
+    sentences = [s for s in _SENTENCE_RE.split(text) if s.strip()]
+    if len(sentences) <= 1:
+        return text[:max_tokens * 4]
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(_terms(sentences[i]) & query_terms), i)
+    )
+    keep, used = set(), 0
+    for i in ranked:
+        tokens = estimate_tokens(sentences[i])
+        if used + tokens > max_tokens:
+            continue
+        keep.add(i)
+        used += tokens
+    if not keep:
+        return sentences[ranked[0]][:max_tokens * 4]
+    return ' '.join(sentences[i] for i in sorted(keep))
+
+
+def build_context(
+    question: str,
+    docs: List[dict],
+    budget: int,
+    max_passage_tokens: int = 800,
+    dup_threshold: float = 0.8
+) -> Tuple[str, List[dict], dict]:
+    """
+    Construye el contexto del prompt a partir de los documentos recuperados
+    (ya ordenados por relevancia):
+      - descarta pasajes casi duplicados (Jaccard de 5-gramas >= dup_threshold),
+      - recorta los pasajes demasiado largos a sus oraciones más relevantes,
+      - llena el presupuesto de tokens y recorta el último pasaje si hace falta.
+    Devuelve el contexto, los documentos usados y estadísticas.
+    """
+    query_terms = _terms(question)
+    used_docs, passages, shingles = [], [], []
+    stats = {'passages_in': len(docs), 'duplicates_removed': 0, 'trimmed': 0}
+    used = 0
+    for doc in docs:
+        remaining = budget - used
+        if remaining < _MIN_PASSAGE_TOKENS and passages:
+            break
+        text = doc.get('content', '')
+        sh = shingle_hashes(text)
+        if any(jaccard(sh, prev) >= dup_threshold for prev in shingles):
+            stats['duplicates_removed'] += 1
+            continue
+        limit = min(max_passage_tokens, remaining)
+        if estimate_tokens(text) > limit:
+            text = trim_to_relevant(text, query_terms, limit)
+            stats['trimmed'] += 1
+        passages.append(text)
+        shingles.append(sh)
+        used_docs.append(doc)
+        used += estimate_tokens(text)
+
+    stats['passages_used'] = len(passages)
+    stats['context_tokens'] = used
+    return CONTEXT_SEPARATOR.join(passages), used_docs, stats
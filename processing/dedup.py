@@ -0,0 +1,307 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from processing.embedding_cache import normalize_text
+
+_WORD_RE = re.compile(r'\w+')
+# Primo de Mersenne 2^61 - 1 para la familia de hashes de MinHash
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+# Semilla fija: las firmas guardadas en el índice persistente deben ser reproducibles
+_PERM_SEED = 1
+
+
+def content_hash(text: str) -> str:
+    """Hash estable (entre procesos) del texto con los espacios normalizados."""
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+def shingle_hashes(text: str, n: int = 5) -> np.ndarray:
+    """Hashes (crc32, estables) únicos de los n-gramas de palabras del texto."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= n:
+        grams = [' '.join(words)]
+    else:
+        grams = [' '.join(words[i:i + n]) for i in range(len(words) - n + 1)]
+    return np.unique(np.fromiter(
+        (zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams)
+    ))
+
+
+class MinHasher:
+    """Firmas MinHash vectorizadas con numpy (num_perm permutaciones a*x + b mod p)."""
+
+    def __init__(self, num_perm: int = 128):
+        rng = np.random.default_rng(_PERM_SEED)
+        self.num_perm = num_perm
+        self._a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)[:, None]
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray:
+        # El desbordamiento de uint64 es intencionado: sigue siendo una familia de hashes válida
+        with np.errstate(over='ignore'):
+            hashed = ((self._a * shingles[None, :] + self._b) % _PRIME) & _MAX_HASH
+        return hashed.min(axis=1).astype(np.uint32)
+
+
+def _band_keys(signature: np.ndarray, bands: int):
+    """Clave de cubo LSH de cada banda de la firma."""
+    rows = len(signature) // bands
+    return [
+        int.from_bytes(hashlib.blake2b(signature[i * rows:(i + 1) * rows].tobytes(), digest_size=8).digest(),
+                       'big', signed=True)
+        for i in range(bands)
+    ]
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Similitud de Jaccard entre dos conjuntos de shingle_hashes (arrays ordenados y únicos)."""
+    if not len(a) or not len(b):
+        return 0.0
+    inter = len(np.intersect1d(a, b, assume_unique=True))
+    return inter / (len(a) + len(b) - inter)
+
+
+class SignatureIndex:
+    """
+    Índice persistente (SQLite) de hashes de contenido y firmas MinHash de los
+    fragmentos ya indexados, con cubos LSH por banda, para detectar duplicados
+    entre documentos de todo el corpus.
+
+    Las firmas de un documento solo se publican con replace_file(), una vez
+    indexado, en una única transacción. La tabla refs guarda qué fragmentos
+    de cada documento se omitieron por existir en otro (su propietario), de
+    modo que si el propietario cambia o se olvida se sabe qué documentos
+    dependientes hay que reingestar.
+    """
+
+    def __init__(self, path: str, num_perm: int = 128, bands: int = 16):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.num_perm = num_perm
+        self.bands = bands
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(
+            'CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT);'
+            'CREATE TABLE IF NOT EXISTS chunks ('
+            ' hash TEXT NOT NULL, file_name TEXT NOT NULL, sig BLOB NOT NULL,'
+            ' PRIMARY KEY (hash, file_name));'
+            'CREATE TABLE IF NOT EXISTS bands ('
+            ' band INTEGER NOT NULL, bucket INTEGER NOT NULL, hash TEXT NOT NULL, file_name TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS ix_bands ON bands(band, bucket);'
+            'CREATE INDEX IF NOT EXISTS ix_bands_file ON bands(file_name);'
+            'CREATE TABLE IF NOT EXISTS refs ('
+            ' file_name TEXT NOT NULL, owner TEXT NOT NULL, hash TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS ix_refs_owner ON refs(owner);'
+            'CREATE INDEX IF NOT EXISTS ix_refs_file ON refs(file_name);'
+        )
+        params = f"{num_perm}:{bands}:{_PERM_SEED}"
+        row = self._db.execute("SELECT value FROM info WHERE key='params'").fetchone()
+        if row is None:
+            self._db.execute("INSERT INTO info(key, value) VALUES ('params', ?)", (params,))
+        elif row[0] != params:
+            raise ValueError(f"El índice de firmas {path} usa otros parámetros ({row[0]} != {params})")
+        self._db.commit()
+
+    def _dependents(self, file_name: str, kept) -> List[str]:
+        """Documentos con fragmentos omitidos por duplicar uno de file_name que ya no está en kept."""
+        rows = self._db.execute(
+            'SELECT DISTINCT file_name, hash FROM refs WHERE owner=? AND file_name<>?', (file_name, file_name)
+        ).fetchall()
+        return sorted({dependent for dependent, text_hash in rows if text_hash not in kept})
+
+    def _delete_file(self, file_name: str):
+        self._db.execute('DELETE FROM chunks WHERE file_name=?', (file_name,))
+        self._db.execute('DELETE FROM bands WHERE file_name=?', (file_name,))
+        self._db.execute('DELETE FROM refs WHERE file_name=?', (file_name,))
+
+    def forget_file(self, file_name: str) -> List[str]:
+        """
+        Elimina las firmas de un documento (p. ej. al borrarlo del índice).
+        Devuelve los documentos que dependían de sus fragmentos.
+        """
+        with self._lock, self._db:
+            dependents = self._dependents(file_name, set())
+            self._delete_file(file_name)
+            self._db.execute('DELETE FROM refs WHERE owner=?', (file_name,))
+        return dependents
+
+    def replace_file(self, file_name: str, chunks, refs) -> List[str]:
+        """
+        Sustituye en una transacción las firmas de un documento ya indexado.
+        chunks son (hash, firma, claves de banda) de sus fragmentos nuevos y
+        refs (propietario, hash) de los omitidos por existir en otro
+        documento. Devuelve los documentos dependientes cuyo fragmento de
+        referencia ya no está en file_name y que hay que reingestar.
+        """
+        kept = {text_hash for text_hash, _, _ in chunks}
+        with self._lock, self._db:
+            dependents = self._dependents(file_name, kept)
+            self._delete_file(file_name)
+            self._db.execute(
+                'DELETE FROM refs WHERE owner=? AND file_name IN (%s)' % ','.join('?' * len(dependents)),
+                [file_name, *dependents]
+            )
+            self._db.executemany(
+                'INSERT OR IGNORE INTO chunks(hash, file_name, sig) VALUES (?, ?, ?)',
+                [(text_hash, file_name, signature.tobytes()) for text_hash, signature, _ in chunks]
+            )
+            self._db.executemany(
+                'INSERT INTO bands(band, bucket, hash, file_name) VALUES (?, ?, ?, ?)',
+                [(i, key, text_hash, file_name)
+                 for text_hash, _, band_keys in chunks for i, key in enumerate(band_keys)]
+            )
+            self._db.executemany(
+                'INSERT INTO refs(file_name, owner, hash) VALUES (?, ?, ?)',
+                [(file_name, owner, text_hash) for owner, text_hash in refs]
+            )
+        return dependents
+
+    def find(self, text_hash: str, signature: np.ndarray, band_keys, file_name: str,
+             threshold: float) -> Optional[Tuple[str, str, str, float]]:
+        """
+        Busca en otros documentos un fragmento idéntico o con similitud MinHash
+        estimada >= threshold. Devuelve (tipo, file_name, hash, similitud) o None.
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT file_name FROM chunks WHERE hash=? AND file_name<>? LIMIT 1',
+                (text_hash, file_name)
+            ).fetchone()
+            if row is not None:
+                return 'exact', row[0], text_hash, 1.0
+            pairs = ','.join('(?,?)' for _ in band_keys)
+            args = [v for i, key in enumerate(band_keys) for v in (i, key)]
+            candidates = self._db.execute(
+                f'SELECT DISTINCT c.hash, c.file_name, c.sig FROM bands b '
+                f'JOIN chunks c ON c.hash=b.hash AND c.file_name=b.file_name '
+                f'WHERE (b.band, b.bucket) IN (VALUES {pairs}) AND b.file_name<>?',
+                args + [file_name]
+            ).fetchall()
+        best = None
+        for other_hash, other_file, blob in candidates:
+            sim = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == signature))
+            if sim >= threshold and (best is None or sim > best[3]):
+                best = ('near', other_file, other_hash, sim)
+        return best
+
+
+class ChunkDeduplicator:
+    """
+    Detecta fragmentos duplicados de un documento antes de vectorizarlos:
+      - exactos, por hash estable del texto normalizado;
+      - casi duplicados, por MinHash + LSH (bandas) verificando la similitud
+        Jaccard exacta de los 5-gramas de palabras frente a threshold.
+    Si se pasa un SignatureIndex también se descartan los fragmentos que ya
+    existen en otros documentos del corpus. Los nuevos se acumulan y solo se
+    registran en el índice con commit(), cuando el documento ya está
+    indexado; si la ingesta falla basta con no llamarlo.
+    """
+
+    def __init__(self, file_name: str = '', threshold: float = 0.85, num_perm: int = 128,
+                 bands: int = 16, index: SignatureIndex = None):
+        if num_perm % bands:
+            raise ValueError("num_perm debe ser múltiplo de bands")
+        self.file_name = file_name
+        self.threshold = threshold
+        self.bands = bands
+        self.index = index
+        self._hasher = _get_hasher(num_perm)
+        self._hashes = set()
+        self._shingles = []
+        self._buckets = {}
+        self._staged = []
+        self._refs = []
+        self.stats = {'exact': 0, 'near': 0, 'corpus': 0}
+
+    def check(self, text: str) -> Optional[str]:
+        """
+        Devuelve None si el texto es nuevo (y lo registra) o el tipo de
+        duplicado: 'exact', 'near' o 'corpus'.
+        """
+        text_hash = content_hash(text)
+        if text_hash in self._hashes:
+            self.stats['exact'] += 1
+            return 'exact'
+
+        shingles = shingle_hashes(text)
+        signature = self._hasher.signature(shingles)
+        band_keys = _band_keys(signature, self.bands)
+        candidates = set()
+        for i, key in enumerate(band_keys):
+            candidates.update(self._buckets.get((i, key), ()))
+        if any(jaccard(shingles, self._shingles[c]) >= self.threshold for c in candidates):
+            self.stats['near'] += 1
+            return 'near'
+
+        if self.index is not None:
+            found = self.index.find(text_hash, signature, band_keys, self.file_name, self.threshold)
+            if found:
+                self._refs.append((found[1], found[2]))
+                self.stats['corpus'] += 1
+                return 'corpus'
+
+        slot = len(self._shingles)
+        self._hashes.add(text_hash)
+        self._shingles.append(shingles)
+        for i, key in enumerate(band_keys):
+            self._buckets.setdefault((i, key), []).append(slot)
+        if self.index is not None:
+            self._staged.append((text_hash, signature, band_keys))
+        return None
+
+    def commit(self) -> List[str]:
+        """
+        Publica en el índice persistente las firmas del documento (sustituyendo
+        las anteriores) tras indexarlo. Devuelve los documentos dependientes
+        que hay que reingestar porque sus fragmentos omitidos ya no existen.
+        """
+        if self.index is None:
+            return []
+        return self.index.replace_file(self.file_name, self._staged, self._refs)
+
+
+_hashers = {}
+_shared_lock = threading.Lock()
+_indexes = {}
+
+
+def _get_hasher(num_perm: int) -> MinHasher:
+    with _shared_lock:
+        if num_perm not in _hashers:
+            _hashers[num_perm] = MinHasher(num_perm)
+        return _hashers[num_perm]
+
+
+def get_signature_index(cfg: dict) -> Optional[SignatureIndex]:
+    """Índice de firmas compartido del proceso, o None si la deduplicación entre documentos está desactivada."""
+    if not cfg['DEDUP_CORPUS']:
+        return None
+    path = cfg['DEDUP_INDEX_PATH']
+    with _shared_lock:
+        if path not in _indexes:
+            _indexes[path] = SignatureIndex(path, cfg['DEDUP_NUM_PERM'], cfg['DEDUP_BANDS'])
+        return _indexes[path]
+
+
+def get_deduplicator(cfg: dict, file_name: str) -> ChunkDeduplicator:
+    """
+    Deduplicador para un documento con la configuración DEDUP_*. Las firmas
+    previas del propio documento no cuentan como duplicados (find excluye
+    file_name) y se sustituyen al confirmar con commit().
+    """
+    return ChunkDeduplicator(
+        file_name,
+        threshold=cfg['DEDUP_NEAR_THRESHOLD'],
+        num_perm=cfg['DEDUP_NUM_PERM'],
+        bands=cfg['DEDUP_BANDS'],
+        index=get_signature_index(cfg)
+    )
@@ -0,0 +1,154 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+_WS_RE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza espacios en blanco para que textos equivalentes compartan clave."""
+    return _WS_RE.sub(' ', text).strip()
+
+
+def cache_key(deployment: str, text: str) -> str:
+    """Clave direccionada por contenido: hash de (deployment, texto normalizado)."""
+    return hashlib.sha256(f"{deployment}\x00{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Caché de embeddings en dos niveles:
+      - LRU en memoria acotado a memory_items entradas (vectores numpy float32).
+      - Almacén persistente SQLite (vectores float32) acotado a disk_items
+        entradas, con desalojo por último uso.
+    Si path es None solo se usa el nivel en memoria.
+    """
+
+    def __init__(self, path: Optional[str] = None, memory_items: int = 10000, disk_items: int = 1000000):
+        self._lru = OrderedDict()
+        self._memory_items = memory_items
+        self._disk_items = disk_items
+        self._lock = threading.Lock()
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+        }
+        self._db = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS embeddings ('
+                ' key TEXT PRIMARY KEY, vec BLOB NOT NULL, last_used REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS ix_last_used ON embeddings(last_used)')
+            self._db.commit()
+            self._disk_count = self._db.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    def _remember(self, key: str, vec: np.ndarray):
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self._memory_items:
+            self._lru.popitem(last=False)
+            self.stats['memory_evictions'] += 1
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Devuelve los vectores encontrados para las claves dadas."""
+        found, pending = {}, []
+        with self._lock:
+            for key in keys:
+                vec = self._lru.get(key)
+                if vec is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vec
+                    self.stats['memory_hits'] += 1
+                else:
+                    pending.append(key)
+
+            if pending and self._db is not None:
+                now = time.time()
+                for start in range(0, len(pending), 500):
+                    part = pending[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                        part
+                    ).fetchall()
+                    for key, blob in rows:
+                        vec = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vec
+                        self._remember(key, vec)
+                        self.stats['disk_hits'] += 1
+                    if rows:
+                        self._db.executemany(
+                            'UPDATE embeddings SET last_used=? WHERE key=?',
+                            [(now, key) for key, _ in rows]
+                        )
+                self._db.commit()
+
+            self.stats['misses'] += sum(1 for key in pending if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        """Guarda vectores en memoria y, si hay almacén persistente, en disco."""
+        if not items:
+            return
+        items = {key: np.asarray(vec, dtype=np.float32) for key, vec in items.items()}
+        with self._lock:
+            for key, vec in items.items():
+                self._remember(key, vec)
+            if self._db is None:
+                return
+            now = time.time()
+            cur = self._db.executemany(
+                'INSERT OR IGNORE INTO embeddings(key, vec, last_used) VALUES (?, ?, ?)',
+                [(key, vec.tobytes(), now) for key, vec in items.items()]
+            )
+            self._disk_count += max(cur.rowcount, 0)
+            excess = self._disk_count - self._disk_items
+            if excess > 0:
+                self._db.execute(
+                    'DELETE FROM embeddings WHERE key IN '
+                    '(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)',
+                    (excess,)
+                )
+                self._disk_count -= excess
+                self.stats['disk_evictions'] += excess
+            self._db.commit()
+
+    def snapshot(self) -> dict:
+        """Contadores de aciertos/fallos y tamaño actual de cada nivel."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_items'] = len(self._lru)
+            stats['disk_items'] = self._disk_count if self._db is not None else 0
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_embedding_cache(cfg: dict) -> EmbeddingCache:
+    """Devuelve la caché de embeddings compartida del proceso (creada bajo demanda)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache(
+                path=cfg['EMBED_CACHE_PATH'] or None,
+                memory_items=cfg['EMBED_CACHE_MEMORY_ITEMS'],
+                disk_items=cfg['EMBED_CACHE_DISK_ITEMS']
+            )
+        return _default_cache
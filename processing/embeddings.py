@@ -1,9 +1,217 @@
+import asyncio
+import base64
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
-def get_embedding(text: str, client, deployment: str) -> List[float]:
+import numpy as np
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from processing.embedding_cache import cache_key
+from utils.helpers import estimate_tokens
+from utils.telemetry import aexternal_call, external_call, record, submit_in_context
+
+# Límite de tokens por entrada de los modelos de embeddings de Azure OpenAI
+MAX_INPUT_TOKENS = 8191
+# Margen conservador de caracteres por token para truncar entradas enormes
+_CHARS_PER_TOKEN_SAFE = 3
+
+_RETRYABLE = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+def as_vector(embedding) -> np.ndarray:
+    """
+    Vector float32 de una respuesta de embeddings: decodifica el base64
+    directamente a un buffer numpy, sin pasar por una lista de floats.
+    """
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype=np.float32)
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def _model_key(deployment: str, dimensions: int) -> str:
+    """Identificador del modelo para la caché: vectores de distinta dimensión no se mezclan."""
+    return f"{deployment}@{dimensions}" if dimensions else deployment
+
+
+def _create_kwargs(dimensions: int) -> dict:
+    kwargs = {'encoding_format': 'base64'}
+    if dimensions:
+        kwargs['dimensions'] = dimensions
+    return kwargs
+
+
+def get_embedding(text: str, client, deployment: str, dimensions: int = 0) -> np.ndarray:
     """Genera un embedding usando AzureOpenAI.client.embeddings.create."""
-    response = client.embeddings.create(
-        model=deployment,
-        input=text
-    )
-    return response.data[0].embedding
+    return get_embeddings([text], client, deployment, dimensions=dimensions)[0]
+
+
+def pack_batches(texts: List[str], max_items: int, max_tokens: int) -> List[List[int]]:
+    """
+    Agrupa índices de textos consecutivos en lotes que no superan max_items
+    entradas ni max_tokens tokens estimados.
+    """
+    batches, cur, cur_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = min(estimate_tokens(text), MAX_INPUT_TOKENS)
+        if cur and (len(cur) >= max_items or cur_tokens + tokens > max_tokens):
+            batches.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(i)
+        cur_tokens += tokens
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+def _retry_after_seconds(exc) -> float:
+    """Lee Retry-After (o retry-after-ms) de la respuesta de error, si existe."""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+
+def _retry_wait(e: Exception, attempt: int) -> float:
+    """
+    Espera antes del reintento attempt + 1 (Retry-After del servicio o
+    backoff exponencial con jitter); lo contabiliza en las métricas y el log.
+    """
+    wait = _retry_after_seconds(e)
+    if wait is None:
+        wait = min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+    record('retries', 1, 'Reintentos de llamadas externas', service='openai', operation='embeddings')
+    logging.warning("Embeddings: reintento %d en %.1fs (%s)", attempt + 1, wait, type(e).__name__)
+    return wait
+
+
+def _create_with_retry(client, deployment: str, inputs: List[str], max_retries: int,
+                       dimensions: int = 0) -> List[np.ndarray]:
+    """Llama a embeddings.create con reintentos y backoff exponencial con jitter."""
+    for attempt in range(max_retries + 1):
+        try:
+            tokens = sum(min(estimate_tokens(text), MAX_INPUT_TOKENS) for text in inputs)
+            with external_call('openai', 'embeddings', tokens=tokens):
+                response = client.embeddings.create(model=deployment, input=inputs, **_create_kwargs(dimensions))
+            usage = getattr(response, 'usage', None)
+            if usage is not None:
+                record('tokens', usage.prompt_tokens, 'Tokens consumidos', service='openai', operation='embeddings')
+            data = sorted(response.data, key=lambda d: d.index)
+            return [as_vector(d.embedding) for d in data]
+        except _RETRYABLE as e:
+            if attempt == max_retries:
+                raise
+            time.sleep(_retry_wait(e, attempt))
+
+
+def get_embeddings(
+    texts: List[str],
+    client,
+    deployment: str,
+    batch_size: int = 16,
+    batch_tokens: int = 32000,
+    max_workers: int = 4,
+    max_retries: int = 6,
+    cache=None,
+    dimensions: int = 0
+) -> List[np.ndarray]:
+    """
+    Genera embeddings para muchos textos empaquetándolos en peticiones
+    multi-entrada (limitadas por número de entradas y tokens estimados),
+    ejecutando varios lotes en paralelo. Devuelve los vectores (float32) en
+    el orden de entrada. Si se pasa una EmbeddingCache, solo se piden a la
+    API los textos que no estén en caché (y cada texto distinto una sola vez).
+    dimensions > 0 pide vectores reducidos a los modelos que lo admiten.
+    """
+    if not texts:
+        return []
+    if cache is not None:
+        keys = [cache_key(_model_key(deployment, dimensions), t) for t in texts]
+        found = cache.get_many(list(dict.fromkeys(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vecs = get_embeddings(
+                list(missing.values()), client, deployment,
+                batch_size=batch_size, batch_tokens=batch_tokens,
+                max_workers=max_workers, max_retries=max_retries, dimensions=dimensions
+            )
+            new_items = dict(zip(missing.keys(), vecs))
+            cache.put_many(new_items)
+            found.update(new_items)
+        return [found[key] for key in keys]
+
+    max_chars = MAX_INPUT_TOKENS * _CHARS_PER_TOKEN_SAFE
+    inputs = [t[:max_chars] for t in texts]
+    batches = pack_batches(inputs, batch_size, batch_tokens)
+
+    def run(batch):
+        return _create_with_retry(client, deployment, [inputs[i] for i in batch], max_retries, dimensions)
+
+    vectors = [None] * len(inputs)
+    if len(batches) == 1 or max_workers <= 1:
+        results = map(run, batches)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+            results = [f.result() for f in [submit_in_context(pool, run, b) for b in batches]]
+    for batch, vecs in zip(batches, results):
+        for i, vec in zip(batch, vecs):
+            vectors[i] = vec
+    return vectors
+
+
+async def aget_embeddings(
+    texts: List[str],
+    client,
+    deployment: str,
+    max_retries: int = 6,
+    cache=None,
+    dimensions: int = 0
+) -> List[np.ndarray]:
+    """
+    Versión asíncrona para la ruta de consulta (pocas entradas por llamada):
+    una única petición multi-entrada con AsyncAzureOpenAI, reintentos con
+    backoff y la misma caché de embeddings, limitador y métricas que la
+    versión síncrona. La caché se consulta y actualiza en un hilo aparte.
+    """
+    if not texts:
+        return []
+    keys = [cache_key(_model_key(deployment, dimensions), t) for t in texts]
+    # El nivel SQLite de la caché hace E/S bloqueante: fuera del bucle de eventos
+    found = await asyncio.to_thread(cache.get_many, list(dict.fromkeys(keys))) if cache is not None else {}
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text[:MAX_INPUT_TOKENS * _CHARS_PER_TOKEN_SAFE]
+    if missing:
+        tokens = sum(min(estimate_tokens(text), MAX_INPUT_TOKENS) for text in missing.values())
+        for attempt in range(max_retries + 1):
+            try:
+                async with aexternal_call('openai', 'embeddings', tokens=tokens):
+                    response = await client.embeddings.create(
+                        model=deployment, input=list(missing.values()), **_create_kwargs(dimensions)
+                    )
+                break
+            except _RETRYABLE as e:
+                if attempt == max_retries:
+                    raise
+                await asyncio.sleep(_retry_wait(e, attempt))
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            record('tokens', usage.prompt_tokens, 'Tokens consumidos', service='openai', operation='embeddings')
+        data = sorted(response.data, key=lambda d: d.index)
+        new_items = {key: as_vector(d.embedding) for key, d in zip(missing, data)}
+        if cache is not None:
+            await asyncio.to_thread(cache.put_many, new_items)
+        found.update(new_items)
+    return [found[key] for key in keys]
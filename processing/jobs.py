@@ -0,0 +1,157 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+
+class QueueFullError(Exception):
+    """Se lanza cuando la cola de ingesta está llena (backpressure)."""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class IngestionQueue:
+    """
+    Cola acotada de trabajos de ingesta atendida por un pool fijo de workers.
+
+    - submit() encola un blob y devuelve el trabajo; si ya hay un trabajo
+      en cola o en curso para el mismo blob se reutiliza en lugar de lanzar
+      una segunda ingesta concurrente del mismo archivo.
+    - Si la cola está llena se lanza QueueFullError para que la API responda 429.
+    - handler(blob_name, on_stage) hace el trabajo y llama a on_stage(nombre)
+      al comenzar cada etapa, lo que permite exponer el progreso por etapa.
+    """
+
+    def __init__(self, handler, num_workers: int = 2, max_queue: int = 100, max_history: int = 1000):
+        self._handler = handler
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()
+        # blob -> trabajo en cola o en curso
+        self._active = {}
+        self._lock = threading.Lock()
+        self._max_history = max_history
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"ingest-worker-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for w in self._workers:
+            w.start()
+
+    def is_full(self) -> bool:
+        return self._queue.full()
+
+    def submit(self, blob_name: str) -> dict:
+        """Encola un blob para ingesta y devuelve una copia del estado del trabajo."""
+        with self._lock:
+            job_id = self._active.get(blob_name)
+            if job_id is not None:
+                return self._snapshot(self._jobs[job_id])
+
+            job = {
+                'job_id': uuid.uuid4().hex,
+                'blob_name': blob_name,
+                'status': 'queued',
+                'stage': None,
+                'stages': OrderedDict(),
+                'submitted_at': _now(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None,
+            }
+            try:
+                self._queue.put_nowait(job['job_id'])
+            except queue.Full:
+                raise QueueFullError("La cola de ingesta está llena")
+            self._jobs[job['job_id']] = job
+            self._active[blob_name] = job['job_id']
+            self._trim_history()
+            return self._snapshot(job)
+
+    def get(self, job_id: str):
+        """Devuelve una copia del estado del trabajo o None si no existe."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+        return {
+            'queued': self._queue.qsize(),
+            'capacity': self._queue.maxsize,
+            'workers': len(self._workers),
+            'jobs': counts,
+        }
+
+    def _snapshot(self, job: dict) -> dict:
+        snap = dict(job)
+        snap['stages'] = {
+            name: {k: v for k, v in info.items() if not k.startswith('_')}
+            for name, info in job['stages'].items()
+        }
+        return snap
+
+    def _trim_history(self):
+        # Descarta los trabajos terminados más antiguos para acotar la memoria
+        while len(self._jobs) > self._max_history:
+            for job_id, job in self._jobs.items():
+                if job['status'] not in ('queued', 'running'):
+                    del self._jobs[job_id]
+                    break
+            else:
+                return
+
+    def _set_stage(self, job: dict, stage: str):
+        now = time.perf_counter()
+        with self._lock:
+            current = job['stage']
+            if current is not None:
+                info = job['stages'][current]
+                info['status'] = 'done'
+                info['duration_s'] = now - info.pop('_t0')
+            job['stage'] = stage
+            job['stages'][stage] = {'status': 'running', '_t0': now}
+
+    def _finish(self, job: dict, status: str, result=None, error=None):
+        now = time.perf_counter()
+        with self._lock:
+            current = job['stage']
+            if current is not None:
+                info = job['stages'][current]
+                info['status'] = 'done' if status != 'failed' else 'failed'
+                info['duration_s'] = now - info.pop('_t0')
+            job['status'] = status
+            job['result'] = result
+            job['error'] = error
+            job['finished_at'] = _now()
+            if self._active.get(job['blob_name']) == job['job_id']:
+                del self._active[job['blob_name']]
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job['status'] = 'running'
+                    job['started_at'] = _now()
+            if job is None:
+                self._queue.task_done()
+                continue
+            try:
+                result = self._handler(job['blob_name'], lambda stage: self._set_stage(job, stage))
+                status = result.get('status', 'succeeded') if isinstance(result, dict) else 'succeeded'
+                self._finish(job, status, result=result)
+            except Exception as e:
+                logging.exception("Error en trabajo de ingesta %s", job_id)
+                self._finish(job, 'failed', error=str(e))
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.data.tables import UpdateMode
+
+# Partición reservada en la tabla de métricas para el manifiesto de ingesta
+MANIFEST_PARTITION = 'manifest'
+
+
+def blob_fingerprint(props) -> dict:
+    """Extrae etag y hash de contenido (MD5) de las propiedades de un blob."""
+    settings = getattr(props, 'content_settings', None)
+    md5 = getattr(settings, 'content_md5', None)
+    return {
+        'etag': (getattr(props, 'etag', None) or '').strip('"'),
+        'content_md5': bytes(md5).hex() if md5 else '',
+    }
+
+
+def get_manifest_entry(table_client, blob_name: str):
+    """Devuelve la entrada del manifiesto para el blob o None si no existe."""
+    try:
+        return table_client.get_entity(partition_key=MANIFEST_PARTITION, row_key=blob_name)
+    except ResourceNotFoundError:
+        return None
+
+
+def is_unchanged(entry, fingerprint: dict) -> bool:
+    """
+    Indica si el blob ya fue procesado con el mismo contenido.
+    Se prefiere el hash de contenido; si no existe se compara el etag.
+    """
+    if not entry:
+        return False
+    if fingerprint.get('content_md5') and entry.get('content_md5'):
+        return entry['content_md5'] == fingerprint['content_md5']
+    return bool(fingerprint.get('etag')) and entry.get('etag') == fingerprint['etag']
+
+
+def record_processed(table_client, blob_name: str, fingerprint: dict, num_chunks: int):
+    """Registra en el manifiesto que el blob se procesó correctamente."""
+    entity = {
+        'PartitionKey': MANIFEST_PARTITION,
+        'RowKey': blob_name,
+        'etag': fingerprint.get('etag', ''),
+        'content_md5': fingerprint.get('content_md5', ''),
+        'num_chunks': num_chunks,
+        'processed_date': datetime.now(timezone.utc).isoformat()
+    }
+    table_client.upsert_entity(entity=entity, mode=UpdateMode.REPLACE)
+
+
+def forget_processed(table_client, blob_names):
+    """Borra las entradas del manifiesto de los blobs, para que la próxima ejecución los reingeste."""
+    for blob_name in blob_names:
+        try:
+            table_client.delete_entity(partition_key=MANIFEST_PARTITION, row_key=blob_name)
+        except ResourceNotFoundError:
+            pass
@@ -1,33 +1,159 @@
+import csv
 import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from processing.dedup import ChunkDeduplicator
+
+
+class ChunkMetrics:
+    """
+    Acumula las métricas de fragmentación de un documento a medida que pasan
+    párrafos, fragmentos e imágenes, sin retener el documento en memoria.
+    Los duplicados exactos y casi duplicados se descartan con dedup (por
+    defecto, un ChunkDeduplicator limitado al propio documento).
+    """
+
+    def __init__(self, min_size: int, max_size: int, dedup: ChunkDeduplicator = None):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.dedup = dedup if dedup is not None else ChunkDeduplicator()
+        self._total_len = 0
+        self._num_chunks = 0
+        self._size_sum = 0
+        self._size_min = None
+        self._size_max = 0
+        self._too_small = 0
+        self._too_large = 0
+        self._img_count = 0
+        self._img_bytes = 0
+        self._elapsed = 0.0
+
+    def track_paragraphs(self, paras):
+        """Deja pasar los párrafos de un generador contando su longitud."""
+        for p in paras:
+            self._total_len += len(p['content'])
+            yield p
+
+    def add_image(self, size: int):
+        self._img_count += 1
+        self._img_bytes += size
+
+    def add_chunk(self, chunk: dict):
+        """
+        Registra un fragmento y devuelve su texto, o None si está vacío o es
+        duplicado (exacto o casi) de uno anterior.
+        """
+        start = time.perf_counter()
+        try:
+            if not chunk['paragraphs']:
+                return None
+            text = ' '.join(chunk['paragraphs'])
+            if self.dedup.check(text) is not None:
+                return None
+            size = len(text)
+            self._num_chunks += 1
+            self._size_sum += size
+            self._size_min = size if self._size_min is None else min(self._size_min, size)
+            self._size_max = max(self._size_max, size)
+            self._too_small += size < self.min_size
+            self._too_large += size > self.max_size
+            return text
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def result(self) -> dict:
+        n = self._num_chunks
+        dups = self.dedup.stats
+        return {
+            'num_chunks': n,
+            'chunk_size_avg': self._size_sum/n if n else 0,
+            'chunk_size_min': self._size_min or 0,
+            'chunk_size_max': self._size_max,
+            'coverage_pct': (self._size_sum/self._total_len*100) if self._total_len else 0,
+            'num_duplicates_removed': dups['exact'] + dups['near'] + dups['corpus'],
+            'num_exact_duplicates': dups['exact'],
+            'num_near_duplicates': dups['near'],
+            'num_corpus_duplicates': dups['corpus'],
+            'num_chunks_too_small': self._too_small,
+            'num_chunks_too_large': self._too_large,
+            'num_images_generated': self._img_count,
+            'avg_image_size_bytes': self._img_bytes/self._img_count if self._img_count else 0,
+            'processing_time_s': self._elapsed
+        }
+
 
 def compute_chunk_metrics(paras, chunks, img_sizes, min_size: int, max_size: int):
-    start = time.perf_counter()
-    total_len = sum(len(p['content']) for p in paras)
-    unique, seen, dup_cnt = [], set(), 0
-    for c in chunks:
-        if not c['paragraphs']:
-            continue
-        key = ' '.join(c['paragraphs'])[:100]
-        h = hash(key)
-        if h in seen:
-            dup_cnt += 1
-            continue
-        seen.add(h)
-        unique.append(c)
-    sizes = [len(' '.join(c['paragraphs'])) for c in unique]
-    too_small = sum(1 for s in sizes if s < min_size)
-    too_large = sum(1 for s in sizes if s > max_size)
-    metrics = {
-        'num_chunks': len(sizes),
-        'chunk_size_avg': sum(sizes)/len(sizes) if sizes else 0,
-        'chunk_size_min': min(sizes) if sizes else 0,
-        'chunk_size_max': max(sizes) if sizes else 0,
-        'coverage_pct': (sum(sizes)/total_len*100) if total_len else 0,
-        'num_duplicates_removed': dup_cnt,
-        'num_chunks_too_small': too_small,
-        'num_chunks_too_large': too_large,
-        'num_images_generated': len(img_sizes),
-        'avg_image_size_bytes': sum(img_sizes)/len(img_sizes) if img_sizes else 0,
-        'processing_time_s': time.perf_counter() - start
+    acc = ChunkMetrics(min_size, max_size)
+    for _ in acc.track_paragraphs(paras):
+        pass
+    for size in img_sizes:
+        acc.add_image(size)
+    unique = [c for c in chunks if acc.add_chunk(c) is not None]
+    return acc.result(), unique
+
+
+# Columnas del CSV de resumen por ejecución (OUTPUT_CSV)
+RUN_SUMMARY_FIELDS = (
+    'run_date', 'processed', 'skipped', 'failed', 'seconds', 'docs_per_s',
+    'num_chunks', 'num_duplicates', 'duplicate_ratio', 'num_slow', 'slow_blobs', 'failed_blobs'
+)
+
+
+class RunMetrics:
+    """Acumula el resumen de una ejecución del pipeline a partir del resultado de cada documento."""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.summary = {
+            'processed': 0, 'skipped': 0, 'failed': 0, 'failed_blobs': [],
+            'num_chunks': 0, 'num_duplicates': 0, 'slow_blobs': [],
+        }
+
+    def add(self, result: dict):
+        s = self.summary
+        if result['status'] != 'succeeded':
+            s['skipped'] += 1
+            return
+        s['processed'] += 1
+        s['num_chunks'] += result['num_chunks']
+        s['num_duplicates'] += result.get('num_duplicates', 0)
+        if result.get('slow'):
+            s['slow_blobs'].append(result['blob_name'])
+
+    def add_failure(self, name: str):
+        self.summary['failed'] += 1
+        self.summary['failed_blobs'].append(name)
+
+    def result(self) -> dict:
+        s = dict(self.summary)
+        seconds = time.perf_counter() - self._start
+        total = s['num_chunks'] + s['num_duplicates']
+        s.update(
+            seconds=seconds,
+            docs_per_s=s['processed'] / seconds if seconds else 0.0,
+            duplicate_ratio=s['num_duplicates'] / total if total else 0.0,
+            num_slow=len(s['slow_blobs']),
+        )
+        return s
+
+
+def write_run_summary(path, summary: dict):
+    """Añade una fila con el resumen de la ejecución al CSV, con cabecera si el archivo es nuevo."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    row = {
+        **{k: summary.get(k) for k in RUN_SUMMARY_FIELDS},
+        'run_date': datetime.now(timezone.utc).isoformat(),
+        'seconds': round(summary['seconds'], 3),
+        'docs_per_s': round(summary['docs_per_s'], 4),
+        'duplicate_ratio': round(summary['duplicate_ratio'], 4),
+        'slow_blobs': ';'.join(summary['slow_blobs']),
+        'failed_blobs': ';'.join(summary['failed_blobs']),
     }
-    return metrics, unique
+    new = not path.exists() or path.stat().st_size == 0
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=RUN_SUMMARY_FIELDS)
+        if new:
+            writer.writeheader()
+        writer.writerow(row)
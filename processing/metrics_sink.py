@@ -0,0 +1,154 @@
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from itertools import groupby
+
+from azure.data.tables import UpdateMode
+
+from utils.telemetry import external_call, record
+
+# Máximo de operaciones por transacción de Table Storage (todas de la misma partición)
+TABLE_MAX_BATCH = 100
+
+
+class TableMetricsSink:
+    """
+    Escribe entidades de métricas en Table Storage en segundo plano.
+
+    put() solo encola la entidad, así que la escritura no añade latencia al
+    documento. Un hilo las envía como transacciones (submit_transaction)
+    agrupadas por PartitionKey, de hasta TABLE_MAX_BATCH operaciones, cuando
+    se acumulan TABLE_MAX_BATCH entidades o cada flush_interval_s segundos.
+    Varias escrituras de la misma entidad pendientes se combinan en una, ya
+    que una transacción no admite dos operaciones sobre la misma RowKey. Si
+    una transacción falla se reintenta entidad a entidad.
+    """
+
+    def __init__(self, table_client, flush_interval_s: float = 2.0):
+        self.table_client = table_client
+        self.flush_interval_s = flush_interval_s
+        self.stats = {'entities': 0, 'transactions': 0, 'failed': 0}
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._flush_requested = False
+        self._writing = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='table-metrics', daemon=True)
+        self._thread.start()
+
+    def put(self, entity: dict, mode=UpdateMode.MERGE):
+        """Encola un upsert de la entidad (MERGE por defecto, como upsert_entity)."""
+        key = (entity['PartitionKey'], entity['RowKey'])
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("El sumidero de métricas está cerrado")
+            previous = self._pending.pop(key, None)
+            if previous is not None and mode == UpdateMode.MERGE:
+                entity, mode = {**previous[0], **entity}, previous[1]
+            self._pending[key] = (entity, mode)
+            if len(self._pending) >= TABLE_MAX_BATCH:
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Espera a que todo lo encolado hasta ahora esté escrito. Devuelve False si vence timeout."""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def close(self, timeout: float = None):
+        """Escribe lo pendiente y detiene el hilo."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not (self._closed or self._flush_requested or len(self._pending) >= TABLE_MAX_BATCH):
+                    self._cond.wait(self.flush_interval_s)
+                self._flush_requested = False
+                if not self._pending:
+                    self._cond.notify_all()
+                    if self._closed:
+                        return
+                    continue
+                items = list(self._pending.values())
+                self._pending.clear()
+                self._writing = True
+            try:
+                self._write(items)
+            except Exception:
+                logging.exception("Error escribiendo métricas en Table Storage")
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _write(self, items):
+        items.sort(key=lambda item: item[0]['PartitionKey'])
+        for _, group in groupby(items, key=lambda item: item[0]['PartitionKey']):
+            group = list(group)
+            for start in range(0, len(group), TABLE_MAX_BATCH):
+                self._submit(group[start:start + TABLE_MAX_BATCH])
+
+    def _submit(self, batch):
+        operations = [('upsert', entity, {'mode': mode}) for entity, mode in batch]
+        try:
+            with external_call('table', 'submit_transaction'):
+                self.table_client.submit_transaction(operations)
+            self.stats['transactions'] += 1
+            self.stats['entities'] += len(batch)
+            record('table_entities', len(batch), 'Entidades de métricas escritas', mode='batch')
+            return
+        except Exception as e:
+            logging.warning("Transacción de %d métricas fallida, se escriben una a una: %s", len(batch), e)
+        for entity, mode in batch:
+            try:
+                with external_call('table', 'upsert_entity'):
+                    self.table_client.upsert_entity(entity=entity, mode=mode)
+                self.stats['entities'] += 1
+                record('table_entities', 1, 'Entidades de métricas escritas', mode='single')
+            except Exception as e:
+                self.stats['failed'] += 1
+                logging.error("No se pudieron guardar las métricas de %s: %s", entity['RowKey'], e)
+
+
+_default = None
+_default_lock = threading.Lock()
+_atexit_registered = False
+
+
+def get_metrics_sink(table_client, cfg: dict) -> TableMetricsSink:
+    """
+    Sumidero de métricas compartido del proceso para table_client. El hilo
+    del sumidero es daemon, así que al crearlo se registra
+    close_metrics_sink en atexit para no perder lo pendiente al salir.
+    """
+    global _default, _atexit_registered
+    with _default_lock:
+        if _default is None or _default.table_client is not table_client:
+            if _default is not None:
+                _default.close()
+            _default = TableMetricsSink(table_client, cfg['METRICS_FLUSH_S'])
+            if not _atexit_registered:
+                atexit.register(close_metrics_sink)
+                _atexit_registered = True
+        return _default
+
+
+def flush_metrics(timeout: float = None) -> bool:
+    """Espera a que se escriban las métricas pendientes del proceso, si las hay."""
+    sink = _default
+    return sink.flush(timeout) if sink is not None else True
+
+
+def close_metrics_sink():
+    """Escribe las métricas pendientes y detiene el sumidero del proceso."""
+    global _default
+    with _default_lock:
+        if _default is not None:
+            _default.close()
+            _default = None
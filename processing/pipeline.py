@@ -1,163 +1,504 @@
-import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from multiprocessing.util import Finalize
+from itertools import count
 from pathlib import Path
 from datetime import datetime, timezone
 
 import json
 
-from config import load_config
+from config import get_config
 from utils.logging_config import configure_logging
-from clients import init_clients
-from processing.analyzer import analyze_document_stream
-from processing.chunking import normalize_lists, chunk_by_headings
-from processing.embeddings import get_embedding
-from processing.metrics import compute_chunk_metrics
+from clients import get_clients
+from processing.analyzer import iter_document_paragraphs
+from processing.blocks import classify_blocks
+from processing.chunking import chunk_classified, resize_chunks
+from processing.embeddings import get_embeddings
+from processing.embedding_cache import get_embedding_cache
+from processing.answer_cache import get_answer_cache
+from processing.metrics import ChunkMetrics, RunMetrics, write_run_summary
+from processing.metrics_sink import close_metrics_sink, flush_metrics, get_metrics_sink
+from processing.dedup import get_deduplicator
+from processing.checkpoints import file_digest, get_checkpoints, stage_key
+from search.backends import get_backend
+from utils.helpers import iter_completed, iter_windows
+from utils.ratelimit import configure_rate_limits_once, set_rate_limiter, start_shared_limiter
+from utils.telemetry import external_call, record, track_document
+from processing.manifest import (
+    blob_fingerprint,
+    forget_processed,
+    get_manifest_entry,
+    is_unchanged,
+    record_processed
+)
 
 from azure.core.exceptions import ResourceNotFoundError
-from azure.data.tables import UpdateMode
-from azure.search.documents.indexes import SearchIndexClient
-from azure.search.documents.indexes.models import (
-    SearchIndex,
-    SimpleField,
-    SearchableField,
-    SearchFieldDataType,
-    VectorSearch,
-    VectorSearchProfile,
-    HnswAlgorithmConfiguration
-)
 
 
-def ensure_vector_index(index_client: SearchIndexClient, index_name: str):
+def embed_texts(texts, oai_client, cfg: dict):
+    """Genera los embeddings de una lista de textos con los límites de lote configurados."""
+    return get_embeddings(
+        texts, oai_client, cfg['OAI_DEPLOYMENT'],
+        batch_size=cfg['EMBED_BATCH_SIZE'],
+        batch_tokens=cfg['EMBED_BATCH_TOKENS'],
+        max_workers=cfg['EMBED_CONCURRENCY'],
+        max_retries=cfg['EMBED_MAX_RETRIES'],
+        cache=get_embedding_cache(cfg),
+        dimensions=cfg['EMBED_DIMENSIONS']
+    )
+
+
+def iter_index_docs(name: str, texts, oai_client, cfg: dict):
     """
-    Verifica la existencia del índice vectorial y lo crea o actualiza si no existe.
+    Genera los documentos del índice de un blob a partir de un iterable de
+    textos, calculando los embeddings por ventanas del tamaño de lote de
+    subida para no retener todo el documento.
     """
-    try:
-        index_client.get_index(name=index_name)
-    except ResourceNotFoundError:
-        # Definición de campos del índice
-        fields = [
-            SimpleField(name="id", type=SearchFieldDataType.String, key=True),
-            SearchableField(
-                name="content",
-                type=SearchFieldDataType.String,
-                analyzer_name="en.lucene"
-            ),
-            SimpleField(name="file_name", type=SearchFieldDataType.String),
-            # Campo vectorial con dimensiones y perfil de búsqueda
-            SimpleField(
-                name="contentVector",
-                type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
-                searchable=True,
-                vector_search_dimensions=1536,
-                vector_search_profile_name="hnsw-config"
-            ),
-        ]
-
-        # Configuración de búsqueda vectorial con perfil y algoritmo HNSW
-        vector_search = VectorSearch(
-            profiles=[
-                VectorSearchProfile(
-                    name="hnsw-config",
-                    algorithm_configuration_name="hnsw-algo"
-                )
-            ],
-            algorithms=[
-                HnswAlgorithmConfiguration(
-                    name="hnsw-algo",
-                    parameters={
-                        "m": 4,
-                        "efConstruction": 400,
-                        "efSearch": 500,
-                        "metric": "cosine"
-                    }
-                )
-            ]
-        )
+    stem = Path(name).stem
+    ids = count()
+    for part in iter_windows(texts, cfg['UPLOAD_BATCH_DOCS']):
+        for text, vec in zip(part, embed_texts(part, oai_client, cfg)):
+            yield {
+                'id': f"{stem}-{next(ids)}",
+                'content': text,
+                'file_name': name,
+                'contentVector': vec
+            }
 
-        # Crear o actualizar el índice vectorial
-        index = SearchIndex(
-            name=index_name,
-            fields=fields,
-            vector_search=vector_search
-        )
-        index_client.create_or_update_index(index)
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.tiff')
 
 
-def run_pipeline():
+def ensure_index_once(clients, cfg: dict):
+    """Comprueba/crea el índice del backend de recuperación una sola vez por proceso."""
+    get_backend(cfg, clients).ensure_index()
+
+
+def _prepare():
     """
-    Ejecuta el procesamiento de blobs, asegurando siempre que el índice vectorial existe
-    y merge_or_upload_documents para conservar datos previos.
+    Obtiene configuración y clientes compartidos, instala los límites de tasa
+    por servicio (una vez por proceso) y asegura el índice vectorial.
     """
     configure_logging()
-    cfg = load_config()
-    clients = init_clients(cfg)
+    cfg = get_config()
+    clients = get_clients(cfg)
+    configure_rate_limits_once(clients, cfg)
+    ensure_index_once(clients, cfg)
+    return cfg, clients
+
 
+def _noop_stage(stage: str):
+    pass
+
+
+def _announce(items, on_stage, stage: str):
+    """
+    Deja pasar items e invoca on_stage(stage) al llegar el primero: en el
+    procesamiento en streaming la etapa siguiente empieza a trabajar cuando
+    la anterior entrega su primer elemento.
+    """
+    announced = False
+    for item in items:
+        if not announced:
+            announced = True
+            on_stage(stage)
+        yield item
+
+
+@contextmanager
+def spool_blob(blob_client, name: str, spool_dir: str = None):
+    """
+    Descarga un blob a un archivo temporal en disco y devuelve su ruta, de
+    modo que el documento no se carga entero en memoria. El archivo se borra
+    al salir del bloque.
+    """
+    fd, path = tempfile.mkstemp(suffix=Path(name).suffix, dir=spool_dir or None)
+    try:
+        with os.fdopen(fd, 'wb') as f, external_call('blob', 'download'):
+            blob_client.download_blob().readinto(f)
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            logging.warning("No se pudo borrar el temporal %s", path)
+
+
+def process_blob(name: str, clients: dict, cfg: dict, fingerprint: dict = None, on_stage=None) -> dict:
+    """
+    Descarga, analiza, fragmenta, vectoriza e indexa un único blob.
+    on_stage(nombre) se invoca al comenzar cada etapa (download, analyze,
+    chunk, embed, upload, metrics) para reportar progreso; con las etapas en
+    streaming, cada una comienza cuando la anterior entrega su primer elemento.
+    Devuelve la entidad de métricas guardada en Table Storage, con el tiempo
+    de cada etapa y los contadores de llamadas externas del documento.
+    """
+    with track_document(name) as tel:
+        return _process_blob(name, clients, cfg, tel, fingerprint, on_stage)
+
+
+def _analysis_events(path: str, doc_client, cfg: dict):
+    """
+    Párrafos del documento seguidos de los tamaños de las páginas renderizadas
+    ({'type': 'image', 'size': n}), de modo que un punto de control de la
+    etapa también reproduce las métricas de imágenes.
+    """
+    images = []
+    yield from iter_document_paragraphs(
+        path,
+        doc_client=doc_client,
+        use_ocr=(cfg['ANALYZE_MODE'] == 'ocr'),
+        model_layout=cfg['MODEL_ID_LAYOUT'],
+        model_ocr=cfg['MODEL_ID_OCR'],
+        render_workers=cfg['OCR_RENDER_WORKERS'],
+        analyze_workers=cfg['OCR_ANALYZE_WORKERS'],
+        page_retries=cfg['OCR_PAGE_RETRIES'],
+        page_timeout=cfg['OCR_PAGE_TIMEOUT_S'],
+        page_window=cfg['OCR_PAGE_WINDOW'],
+        on_image=images.append
+    )
+    for size in images:
+        yield {'type': 'image', 'size': size}
+
+
+def _replay_images(events, on_image):
+    """Separa los tamaños de imagen de los eventos de análisis y deja pasar los párrafos."""
+    for event in events:
+        if event['type'] == 'image':
+            on_image(event['size'])
+        else:
+            yield event
+
+
+def _drain_then(first, items):
+    """Consume first por completo (por sus efectos en las métricas) y después genera items."""
+    for _ in first:
+        pass
+    yield from items
+
+
+def _document_chunks(path: str, doc_client, ta_client, cfg: dict, acc: ChunkMetrics, tel, on_stage=_noop_stage):
+    """
+    Genera los fragmentos del documento en path. Con CHECKPOINT_DIR se
+    reutilizan los puntos de control de las etapas de análisis (por hash del
+    contenido y modelo) y de fragmentación (por análisis y tamaños de
+    fragmento): un reintento o un cambio de MIN/MAX_CHUNK_SIZE no vuelve a
+    pagar Document Intelligence. Los embeddings ya se reutilizan por texto
+    en la caché de embeddings.
+
+    El análisis se vuelca entero a su punto de control (en disco, no en
+    memoria) antes de fragmentar, para que un fallo posterior (embeddings,
+    subida) no obligue a repetirlo. on_stage('chunk') se invoca al llegar el
+    primer párrafo.
+    """
+    def make_chunks(paras):
+        return resize_chunks(
+            chunk_classified(classify_blocks(paras), ta_client),
+            cfg['MIN_CHUNK_SIZE'], cfg['MAX_CHUNK_SIZE'], cfg['CHUNK_OVERLAP']
+        )
+
+    def track(events):
+        paras = acc.track_paragraphs(tel.timed_iter(_replay_images(events, acc.add_image), 'analyze'))
+        return _announce(paras, on_stage, 'chunk')
+
+    ckpt = get_checkpoints(cfg)
+    if ckpt is None:
+        return make_chunks(track(_analysis_events(path, doc_client, cfg)))
+
+    use_ocr = cfg['ANALYZE_MODE'] == 'ocr'
+    with tel.stage('analyze'):
+        digest = file_digest(path)
+    para_key = stage_key('paragraphs', digest, use_ocr, cfg['MODEL_ID_OCR'] if use_ocr else cfg['MODEL_ID_LAYOUT'])
+    chunk_key = stage_key('chunks', para_key, cfg['MIN_CHUNK_SIZE'], cfg['MAX_CHUNK_SIZE'], cfg['CHUNK_OVERLAP'])
+
+    events = ckpt.read('paragraphs', para_key)
+    if events is None:
+        with tel.stage('analyze'):
+            ckpt.write('paragraphs', para_key, _analysis_events(path, doc_client, cfg))
+        events = ckpt.read('paragraphs', para_key)
+    else:
+        record('checkpoint_hits', 1, 'Etapas reutilizadas de puntos de control', stage='paragraphs')
+    paras = track(events)
+
+    chunks = ckpt.read('chunks', chunk_key)
+    if chunks is None:
+        return ckpt.record('chunks', chunk_key, make_chunks(paras))
+    record('checkpoint_hits', 1, 'Etapas reutilizadas de puntos de control', stage='chunks')
+    return _drain_then(paras, chunks)
+
+
+def _process_blob(name: str, clients: dict, cfg: dict, tel, fingerprint: dict = None, on_stage=None) -> dict:
+    on_stage = on_stage or _noop_stage
     blob_client = clients['blob']
     doc_client = clients['doc']
     ta_client = clients['ta']
     table_client = clients['table']
-    search_client = clients['search']
-    index_client = clients['index']
+    backend = get_backend(cfg, clients)
     oai_client = clients['oai']
 
-    # Asegurar existencia del índice vectorial
-    ensure_vector_index(index_client, cfg['INDEX_NAME'])
+    # Descargar a disco y procesar en streaming: párrafos, bloques y fragmentos
+    # fluyen como generadores hasta la subida, así que la memoria no depende
+    # del tamaño del documento. Cada etapa acumula su tiempo exclusivo en tel
+    # aunque los generadores se intercalen
+    on_stage('download')
+    with ExitStack() as spool:
+        with tel.stage('download'):
+            path = spool.enter_context(
+                spool_blob(blob_client.get_blob_client(name), name, cfg['SPOOL_DIR'])
+            )
+        size_bytes = os.path.getsize(path)
+        record('bytes', size_bytes, 'Bytes transferidos', kind='download')
 
-    # Procesar cada blob en el contenedor
-    for blob in blob_client.list_blobs():
-        name = blob.name
-        if not name.lower().endswith(('.pdf', '.png', '.jpg', '.jpeg', '.tiff')):
-            continue
+        on_stage('analyze')
+        # Los fragmentos duplicados se descartan antes de llegar a embeddings
+        dedup = get_deduplicator(cfg, name)
+        acc = ChunkMetrics(cfg['MIN_CHUNK_SIZE'], cfg['MAX_CHUNK_SIZE'], dedup)
+        chunks = _document_chunks(path, doc_client, ta_client, cfg, acc, tel, on_stage)
+        texts = tel.timed_iter(
+            (text for text in map(acc.add_chunk, chunks) if text is not None), 'chunk'
+        )
 
-        try:
-            # Descargar y analizar documento
-            data = blob_client.get_blob_client(name).download_blob().readall()
-            stream = io.BytesIO(data)
-
-            paras, img_sizes = analyze_document_stream(
-                stream=stream,
-                doc_client=doc_client,
-                use_ocr=(cfg['ANALYZE_MODE'] == 'ocr'),
-                model_layout=cfg['MODEL_ID_LAYOUT'],
-                model_ocr=cfg['MODEL_ID_OCR']
+        # Generar embeddings y subir en streaming con merge_or_upload para conservar lo previo
+        texts = _announce(texts, on_stage, 'embed')
+        docs = _announce(tel.timed_iter(iter_index_docs(name, texts, oai_client, cfg), 'embed'), on_stage, 'upload')
+        with tel.stage('upload'):
+            upload = backend.upload(
+                docs,
+                max_batch_docs=cfg['UPLOAD_BATCH_DOCS'],
+                max_batch_bytes=cfg['UPLOAD_BATCH_BYTES'],
+                max_retries=cfg['UPLOAD_MAX_RETRIES'],
+                overlap=cfg['UPLOAD_OVERLAP']
             )
-            blocks = normalize_lists(paras)
-            chunks = chunk_by_headings(blocks, ta_client)
+    record('bytes', upload['bytes'], 'Bytes transferidos', kind='index')
+    metrics = acc.result()
+    num_chunks = metrics['num_chunks']
 
-            metrics, unique_chunks = compute_chunk_metrics(
-                paras, chunks, img_sizes,
-                cfg['MIN_CHUNK_SIZE'], cfg['MAX_CHUNK_SIZE']
-            )
+    # Si el documento cambió y ahora tiene menos fragmentos, borrar los sobrantes
+    with tel.stage('upload'):
+        previous = get_manifest_entry(table_client, name)
+        prev_chunks = int(previous.get('num_chunks', 0)) if previous else 0
+        stem = Path(name).stem
+        stale = [f"{stem}-{idx}" for idx in range(num_chunks, prev_chunks)]
+        if stale:
+            backend.delete(stale)
 
-            # Generar embeddings y preparar documentos
-            docs = []
-            stem = Path(name).stem
-            for idx, c in enumerate(unique_chunks):
-                text = ' '.join(c['paragraphs'])
-                doc_id = f"{stem}-{idx}"
-                vec = get_embedding(text, oai_client, cfg['OAI_DEPLOYMENT'])
-                docs.append({
-                    'id': doc_id,
-                    'content': text,
-                    'file_name': name,
-                    'contentVector': vec
-                })
-
-            # Subir con merge_or_upload para conservar lo previo
-            if docs:
-                search_client.merge_or_upload_documents(documents=docs)
-
-            # Guardar métricas en Azure Table Storage
-            entity = {
-                'PartitionKey': Path(name).suffix.lstrip('.'),
-                'RowKey': name,
-                'file_name': name,
-                'file_type': Path(name).suffix.lstrip('.'),
-                'original_size_bytes': len(data),
-                **metrics,
-                'slow': metrics['processing_time_s'] > cfg['SLOW_THRESHOLD'],
-                'processing_date': datetime.now(timezone.utc).isoformat()
+    # Encolar las métricas para Azure Table Storage (se escriben en lotes en
+    # segundo plano). processing_time_s y slow usan el tiempo total del
+    # documento, no solo el de las métricas
+    on_stage('metrics')
+    timings = tel.summary()
+    entity = {
+        'PartitionKey': Path(name).suffix.lstrip('.'),
+        'RowKey': name,
+        'file_name': name,
+        'file_type': Path(name).suffix.lstrip('.'),
+        'original_size_bytes': size_bytes,
+        **metrics,
+        **timings,
+        'processing_time_s': timings['total_time_s'],
+        'index_uploaded': upload['uploaded'],
+        'index_failed': upload['failed'],
+        'index_retried': upload['retried'],
+        'index_bytes': upload['bytes'],
+        'index_upload_s': upload['seconds'],
+        'index_docs_per_s': upload['docs_per_s'],
+        'slow': timings['total_time_s'] > cfg['SLOW_THRESHOLD'],
+        'processing_date': datetime.now(timezone.utc).isoformat()
+    }
+    with tel.stage('metrics'):
+        get_metrics_sink(table_client, cfg).put(entity)
+
+    # Las respuestas cacheadas que usaban este documento quedan obsoletas
+    answer_cache = get_answer_cache(cfg)
+    if answer_cache is not None:
+        answer_cache.invalidate_files([name])
+
+    # Solo se marca como procesado si todos los fragmentos quedaron indexados
+    if upload['failed']:
+        raise RuntimeError(f"{upload['failed']} fragmentos de {name} no se pudieron indexar")
+    # Las firmas para la deduplicación entre documentos solo se publican ya
+    # indexado. Los documentos cuyos fragmentos omitidos dependían de un
+    # fragmento que este ya no tiene se reingestarán en la próxima ejecución
+    dependents = dedup.commit()
+    if dependents:
+        logging.warning("%s ya no contiene fragmentos omitidos en %s; se reingestarán", name, dependents)
+        forget_processed(table_client, dependents)
+    if fingerprint is not None:
+        record_processed(table_client, name, fingerprint, num_chunks)
+    return entity
+
+
+def _ingest_props(props, clients: dict, cfg: dict, force: bool = False, on_stage=None) -> dict:
+    """
+    Procesa un blob a partir de sus propiedades, omitiéndolo si el manifiesto lo
+    marca como ya procesado con el mismo contenido (salvo force=True).
+    """
+    return _ingest_one(props.name, blob_fingerprint(props), clients, cfg, force=force, on_stage=on_stage)
+
+
+def _ingest_one(name: str, fingerprint: dict, clients: dict, cfg: dict, force: bool = False,
+                on_stage=None) -> dict:
+    """
+    Procesa un blob (salvo que el manifiesto lo marque sin cambios) con hasta
+    PIPELINE_DOC_RETRIES reintentos del documento completo y backoff
+    exponencial. Reprocesar es seguro: la subida es merge_or_upload y los
+    fragmentos sobrantes de un intento anterior se eliminan.
+    """
+    if not force and is_unchanged(get_manifest_entry(clients['table'], name), fingerprint):
+        logging.info("Sin cambios, se omite %s", name)
+        return {'status': 'skipped', 'blob_name': name}
+
+    retries = cfg['PIPELINE_DOC_RETRIES']
+    for attempt in range(retries + 1):
+        try:
+            entity = process_blob(name, clients, cfg, fingerprint, on_stage=on_stage)
+            return {
+                'status': 'succeeded', 'blob_name': name, 'num_chunks': entity['num_chunks'],
+                'num_duplicates': entity['num_duplicates_removed'], 'slow': entity['slow']
             }
-            table_client.upsert_entity(entity=entity, mode=UpdateMode.MERGE)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            wait_s = 2 ** attempt
+            record('retries', 1, 'Reintentos de llamadas externas', service='pipeline')
+            logging.warning("Documento %s: reintento %d en %ds (%s)", name, attempt + 1, wait_s, e)
+            time.sleep(wait_s)
+
+
+def ingest_blob(name: str, clients: dict, cfg: dict, force: bool = False, on_stage=None) -> dict:
+    """
+    Procesa un único blob con clientes ya inicializados (usado por los workers
+    de la cola de ingesta). Las excepciones se propagan al llamador.
+    """
+    ensure_index_once(clients, cfg)
+    props = clients['blob'].get_blob_client(name).get_blob_properties()
+    return _ingest_props(props, clients, cfg, force=force, on_stage=on_stage)
+
 
+def _init_pipeline_worker(limiter):
+    """
+    Inicializa un proceso del pool de ingesta con el limitador compartido.
+    Las métricas pendientes del proceso se escriben al terminar el proceso
+    (multiprocessing no ejecuta atexit en los hijos, sí sus finalizadores).
+    """
+    configure_logging()
+    set_rate_limiter(limiter)
+    Finalize(None, close_metrics_sink, exitpriority=10)
+
+
+def _ingest_in_worker(name: str, fingerprint: dict, force: bool) -> dict:
+    """Ingesta de un blob en un proceso del pool, con sus propios clientes."""
+    cfg = get_config()
+    clients = get_clients(cfg)
+    try:
+        ensure_index_once(clients, cfg)
+        return _ingest_one(name, fingerprint, clients, cfg, force=force)
+    except Exception as e:
+        # Las excepciones de los SDK no siempre se pueden serializar entre procesos
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+
+@contextmanager
+def _ingest_pool(clients: dict, cfg: dict, force: bool):
+    """
+    Pool de ingesta según PIPELINE_POOL: hilos que comparten clientes y
+    limitador del proceso, o procesos (spawn) con sus propios clientes y un
+    limitador compartido servido por un proceso gestor. Devuelve (pool, fn).
+    Con RETRIEVAL_BACKEND=local se usan siempre hilos: el índice local se
+    carga en memoria en cada proceso y los workers se pisarían al guardarlo.
+    """
+    workers = cfg['PIPELINE_WORKERS']
+    use_processes = cfg['PIPELINE_POOL'] == 'process'
+    if use_processes and cfg['RETRIEVAL_BACKEND'] == 'local':
+        logging.warning("PIPELINE_POOL=process no es compatible con RETRIEVAL_BACKEND=local; se usan hilos")
+        use_processes = False
+    if use_processes:
+        manager, limiter = start_shared_limiter(cfg)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_pipeline_worker,
+                initargs=(limiter,)
+            ) as pool:
+                yield pool, partial(_ingest_in_worker, force=force)
+        finally:
+            manager.shutdown()
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pipeline') as pool:
+            yield pool, partial(_ingest_one, clients=clients, cfg=cfg, force=force)
+
+
+def _process_blobs(blob_props, clients: dict, cfg: dict, force: bool = False) -> dict:
+    """
+    Procesa una secuencia de propiedades de blob y devuelve un resumen. Con
+    PIPELINE_WORKERS > 1 los documentos se procesan en paralelo; el fallo de
+    uno (tras sus reintentos) no afecta a los demás. Al terminar espera a que
+    se escriban las métricas pendientes y añade el resumen de la ejecución
+    (docs/s, fragmentos, proporción de duplicados, documentos lentos) a
+    OUTPUT_CSV.
+    """
+    run = RunMetrics()
+    tasks = (
+        (props.name, blob_fingerprint(props)) for props in blob_props
+        if props.name.lower().endswith(SUPPORTED_EXTENSIONS)
+    )
+
+    def account(name, outcome):
+        try:
+            run.add(outcome())
         except Exception as e:
             print(f"Error procesando {name}: {e}")
+            run.add_failure(name)
+
+    if cfg['PIPELINE_WORKERS'] <= 1:
+        for name, fingerprint in tasks:
+            account(name, partial(_ingest_one, name, fingerprint, clients, cfg, force))
+    else:
+        with _ingest_pool(clients, cfg, force) as (pool, fn):
+            for (name, _), fut in iter_completed(pool, fn, tasks, 2 * cfg['PIPELINE_WORKERS']):
+                account(name, fut.result)
+
+    flush_metrics()
+    summary = run.result()
+    try:
+        write_run_summary(cfg['OUTPUT_CSV'], summary)
+    except OSError as e:
+        logging.warning("No se pudo escribir el resumen en %s: %s", cfg['OUTPUT_CSV'], e)
+    return summary
+
+
+def ingest_blobs(blob_names, force: bool = False) -> dict:
+    """
+    Procesa únicamente los blobs indicados (un nombre o una lista de nombres),
+    de modo que el coste de cada subida depende solo de los datos nuevos.
+    """
+    if isinstance(blob_names, str):
+        blob_names = [blob_names]
+    cfg, clients = _prepare()
+    blob_client = clients['blob']
+
+    def props_iter():
+        for name in blob_names:
+            try:
+                yield blob_client.get_blob_client(name).get_blob_properties()
+            except ResourceNotFoundError:
+                print(f"Blob no encontrado: {name}")
+
+    return _process_blobs(props_iter(), clients, cfg, force=force)
+
+
+def run_pipeline(force: bool = False) -> dict:
+    """
+    Ejecuta el procesamiento de todos los blobs del contenedor, asegurando siempre
+    que el índice vectorial existe y usando merge_or_upload_documents para conservar
+    datos previos. Los blobs sin cambios según el manifiesto se omiten.
+    """
+    cfg, clients = _prepare()
+    return _process_blobs(clients['blob'].list_blobs(), clients, cfg, force=force)
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from typing import AsyncIterator
+
+from azure.search.documents.models import VectorizedQuery
+
+from config import get_config
+from clients import get_async_clients
+from processing.embeddings import aget_embeddings
+from processing.embedding_cache import get_embedding_cache
+from processing.answer_cache import get_answer_cache
+from processing.rag_module import CHAT_PARAMS, assemble_context, build_messages, is_cacheable_answer
+from processing.retrieval import retrieve, rrf_fuse
+from search.uploader import compact_vector
+from search.backends import get_backend
+from utils.telemetry import aexternal_call, record
+
+
+async def aembed_question(question: str):
+    """Embedding asíncrono de la pregunta (con caché de embeddings)."""
+    cfg = get_config()
+    return (await aget_embeddings(
+        [question], get_async_clients(cfg)['oai'], cfg['OAI_DEPLOYMENT'],
+        max_retries=cfg['EMBED_MAX_RETRIES'],
+        cache=get_embedding_cache(cfg),
+        dimensions=cfg['EMBED_DIMENSIONS']
+    ))[0]
+
+
+async def _asearch(search_text: str, query_vec=None, top: int = 5):
+    """Consulta asíncrona a Cognitive Search (léxica o vectorial)."""
+    vector_queries = None
+    if query_vec is not None:
+        vector_queries = [VectorizedQuery(
+            vector=compact_vector(query_vec),
+            fields="contentVector",
+            k_nearest_neighbors=top
+        )]
+    async with aexternal_call('search', 'query_vector' if query_vec is not None else 'query_text'):
+        results = await get_async_clients()['search'].search(
+            search_text=search_text,
+            vector_queries=vector_queries,
+            select=["id", "content", "file_name"],
+            top=top
+        )
+        return [doc async for doc in results]
+
+
+async def aretrieve_context(question: str, query_vec, k: int = 5):
+    """
+    Recuperación asíncrona (vectorial o híbrida según RETRIEVAL_MODE);
+    devuelve el contexto acotado por tokens, los documentos de origen y las
+    estadísticas del contexto.
+    """
+    cfg = get_config()
+    if cfg['RETRIEVAL_BACKEND'] == 'local':
+        # El índice local responde en microsegundos: no hace falta cliente async
+        docs = retrieve(question, query_vec, get_backend(cfg), k, cfg)
+    elif cfg['RETRIEVAL_MODE'] == 'hybrid':
+        n = max(k, cfg['HYBRID_CANDIDATES'])
+        lexical, vector = await asyncio.gather(
+            _asearch(question, top=n),
+            _asearch("*", query_vec, top=n)
+        )
+        docs = rrf_fuse([lexical, vector], cfg['RRF_K'])[:k]
+    else:
+        docs = await _asearch("*", query_vec, top=k)
+    contexto, docs, context_stats = assemble_context(question, docs, cfg)
+    file_names = [doc.get("file_name") for doc in docs if doc.get("file_name")]
+    return contexto, file_names, context_stats
+
+
+async def stream_rag_answer(
+    question: str,
+    k: int = 5,
+    temperature: float = 0.7,
+    info: dict = None
+) -> AsyncIterator[str]:
+    """
+    Ejecuta la consulta RAG y devuelve los fragmentos de texto de la respuesta
+    a medida que el modelo los genera. El primer token llega tras la latencia
+    de recuperación, sin esperar a la respuesta completa. Si la pregunta está
+    en la caché semántica de respuestas, la respuesta se emite de inmediato.
+    Si se pasa info, al terminar contiene 'usage' (tokens) y 'cached'.
+    """
+    info = info if info is not None else {}
+    start = time.perf_counter()
+    cfg = get_config()
+    query_vec = await aembed_question(question)
+
+    answer_cache = get_answer_cache(cfg)
+    if answer_cache is not None:
+        cached = answer_cache.lookup(query_vec, k, temperature)
+        if cached is not None:
+            info.update(usage=None, cached=True)
+            yield cached['answer']
+            return
+
+    contexto, file_names, context_stats = await aretrieve_context(question, query_vec, k)
+    parts, finish_reason = [], None
+    info.update(usage=dict(context_stats), cached=False)
+    # La llamada se mide (y limita) entera, hasta el último evento del stream
+    async with aexternal_call('openai', 'chat'):
+        stream = await get_async_clients(cfg)['chat'].chat.completions.create(
+            model=cfg['AZ_GPT_DEPLOYMENT'],
+            messages=build_messages(question, contexto, k),
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+            **CHAT_PARAMS
+        )
+        async for event in stream:
+            # El último evento trae el uso de tokens y no tiene choices
+            if getattr(event, 'usage', None):
+                info['usage']['prompt_tokens'] = event.usage.prompt_tokens
+                info['usage']['completion_tokens'] = event.usage.completion_tokens
+            # Azure envía eventos sin choices (p. ej. resultados del filtro de contenido)
+            if event.choices and event.choices[0].finish_reason:
+                finish_reason = event.choices[0].finish_reason
+            if event.choices and event.choices[0].delta.content:
+                parts.append(event.choices[0].delta.content)
+                yield parts[-1]
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        if info['usage'].get(kind) is not None:
+            record('tokens', info['usage'][kind], 'Tokens consumidos', service='openai', operation=f"chat_{kind.split('_')[0]}")
+
+    answer = ''.join(parts)
+    if answer_cache is not None and is_cacheable_answer(answer, finish_reason):
+        answer_cache.store(
+            query_vec, k, temperature, answer, file_names,
+            time.perf_counter() - start
+        )
+
+
+async def arun_rag(question: str, k: int = 5, temperature: float = 0.7) -> dict:
+    """Equivalente asíncrono de run_rag: dict con 'answer', 'usage' y 'cached'."""
+    info = {}
+    answer = ''.join([token async for token in stream_rag_answer(question, k, temperature, info)])
+    return {'answer': answer, 'usage': info.get('usage'), 'cached': info.get('cached', False)}
+
+
+async def arun_rag_question(question: str, k: int = 5, temperature: float = 0.7) -> str:
+    """Equivalente asíncrono de run_rag_question (respuesta completa)."""
+    return (await arun_rag(question, k, temperature))['answer']
@@ -1,61 +1,34 @@
-from config import load_config
-from clients import init_clients
-from processing.embeddings import get_embedding
-from openai import AzureOpenAI
-from azure.search.documents.models import VectorizedQuery
-
-# Carga de configuración y clientes de Azure
-cfg = load_config()
-clients = init_clients(cfg)
-search_client = clients['search']      # Azure Cognitive Search
-embedding_client = clients['oai']      # AzureOpenAI para embeddings
-
-# Credenciales fijas para el chat GPT (solo aquí; el resto usa tu config)
-GPT_ENDPOINT   = cfg['AZ_GPT_ENPOINT']
-GPT_API_KEY    = cfg['AZ_GPT_KEY']
-GPT_DEPLOYMENT = cfg['AZ_GPT_DEPLOYMENT']
-
-# Cliente de AzureOpenAI para generación de chat
-chat_client = AzureOpenAI(
-    api_key=GPT_API_KEY,
-    azure_endpoint=GPT_ENDPOINT,
-    api_version="2025-01-01-preview"
-)
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-def run_rag_question(question: str, k: int = 5, temperature: float = 0.7) -> str:
-    """
-    Ejecuta una consulta RAG sobre tu repositorio de documentos:
-      1) Genera embedding de la pregunta.
-      2) Recupera k chunks desde Cognitive Search usando VectorizedQuery.
-      3) Llama a GPT para generar la respuesta.
-
-    :param question: Texto de la pregunta a responder.
-    :param k: Número de fragmentos a recuperar (por defecto 5).
-    :param temperature: Controla cuánto “se suelta” el modelo (por defecto 0.7).
-    :return: Respuesta generada por el modelo de chat.
-    """
-    # 1) Embedding de la pregunta
-    query_vec = get_embedding(question, embedding_client, cfg['OAI_DEPLOYMENT'])
+from config import get_config
+from clients import get_clients
+from processing.embeddings import get_embeddings
+from processing.embedding_cache import get_embedding_cache
+from processing.answer_cache import get_answer_cache
+from processing.retrieval import retrieve
+from processing.context import build_context
+from search.backends import get_backend
+from utils.helpers import iter_windows, iter_completed
+from utils.telemetry import external_call, record
 
-    # 2) Vector search: construye el VectorizedQuery
-    vec_q = VectorizedQuery(
-        vector=query_vec,
-        fields="contentVector",
-        k_nearest_neighbors=k
-    )
+# La configuración y los clientes (búsqueda, embeddings y chat GPT) se obtienen
+# bajo demanda del registro compartido: importar este módulo no toca la red.
 
-    results = search_client.search(
-        search_text="*",
-        vector_queries=[vec_q],
-        top=k
-    )
+# Parámetros comunes de la llamada de chat (síncrona y asíncrona)
+CHAT_PARAMS = {
+    'max_tokens': 1024,
+    'presence_penalty': 0.3,
+    'frequency_penalty': 0.0,
+}
 
-    # Extrae únicamente el campo `content` de cada documento
-    chunks = [doc.get("content", "") for doc in results]
-    contexto = "\n\n---\n\n".join(chunks)
 
-    # 3) Construye el prompt para GPT
-    messages = [
+def build_messages(question: str, contexto: str, k: int) -> list:
+    """Construye los mensajes del prompt RAG a partir del contexto recuperado."""
+    return [
         {
             "role": "system",
             "content": (
@@ -80,14 +53,234 @@ def run_rag_question(question: str, k: int = 5, temperature: float = 0.7) -> str
         }
     ]
 
-    # Llama al modelo de chat
-    response = chat_client.chat.completions.create(
-        model=GPT_DEPLOYMENT,
-        messages=messages,
-        max_tokens=1024,
-        temperature=temperature,
-        presence_penalty=0.3,
-        frequency_penalty=0.0
+
+def assemble_context(question: str, docs: list, cfg: dict):
+    """Aplica el constructor de contexto con el presupuesto de tokens configurado."""
+    return build_context(
+        question, docs,
+        budget=cfg['CONTEXT_TOKEN_BUDGET'],
+        max_passage_tokens=cfg['CONTEXT_MAX_PASSAGE_TOKENS'],
+        dup_threshold=cfg['CONTEXT_DUP_THRESHOLD']
+    )
+
+
+def is_cacheable_answer(answer, finish_reason) -> bool:
+    """
+    Solo se guardan en la caché de respuestas las completas: no vacías y
+    terminadas con finish_reason 'stop' (no cortadas por longitud ni por el
+    filtro de contenido).
+    """
+    return bool(answer and answer.strip()) and finish_reason == 'stop'
+
+
+def _complete(question: str, contexto: str, context_stats: dict, k: int, temperature: float,
+              chat_client, cfg: dict):
+    """
+    Llama al modelo de chat con el contexto ya construido. Devuelve
+    (respuesta, uso de tokens, finish_reason).
+    """
+    messages = build_messages(question, contexto, k)
+    with external_call('openai', 'chat'):
+        response = chat_client.chat.completions.create(
+            model=cfg['AZ_GPT_DEPLOYMENT'],
+            messages=messages,
+            temperature=temperature,
+            **CHAT_PARAMS
+        )
+
+    answer = response.choices[0].message.content
+    finish_reason = response.choices[0].finish_reason
+    usage = {
+        'prompt_tokens': getattr(response.usage, 'prompt_tokens', None),
+        'completion_tokens': getattr(response.usage, 'completion_tokens', None),
+        **context_stats
+    }
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        if usage[kind] is not None:
+            record('tokens', usage[kind], 'Tokens consumidos', service='openai', operation=f"chat_{kind.split('_')[0]}")
+    logging.info(
+        "RAG: prompt_tokens=%s contexto=%d tokens (%d/%d pasajes, %d duplicados, %d recortados)",
+        usage['prompt_tokens'], usage['context_tokens'], usage['passages_used'],
+        usage['passages_in'], usage['duplicates_removed'], usage['trimmed']
     )
+    return answer, usage, finish_reason
+
+
+def run_rag(question: str, k: int = 5, temperature: float = 0.7) -> dict:
+    """
+    Ejecuta una consulta RAG sobre tu repositorio de documentos:
+      1) Genera embedding de la pregunta.
+      2) Recupera hasta k chunks del backend de recuperación (Cognitive Search o
+         índice local), en modo vectorial o híbrido.
+      3) Construye el contexto dentro del presupuesto de tokens (sin casi
+         duplicados y recortando pasajes largos a sus oraciones relevantes).
+      4) Llama a GPT para generar la respuesta.
+    Las preguntas equivalentes a otras ya respondidas (misma k y temperature)
+    se sirven desde la caché semántica de respuestas sin llamar al chat.
 
-    return response.choices[0].message.content
+    :param question: Texto de la pregunta a responder.
+    :param k: Número de fragmentos a recuperar (por defecto 5).
+    :param temperature: Controla cuánto “se suelta” el modelo (por defecto 0.7).
+    :return: dict con la respuesta ('answer'), el uso de tokens ('usage') y
+             si se sirvió desde caché ('cached').
+    """
+    start = time.perf_counter()
+    cfg = get_config()
+    clients = get_clients(cfg)
+    backend = get_backend(cfg, clients)    # Cognitive Search o índice local
+    embedding_client = clients['oai']      # AzureOpenAI para embeddings
+    chat_client = clients['chat']          # AzureOpenAI para generación de chat
+
+    # 1) Embedding de la pregunta
+    query_vec = get_embeddings(
+        [question], embedding_client, cfg['OAI_DEPLOYMENT'],
+        max_retries=cfg['EMBED_MAX_RETRIES'],
+        cache=get_embedding_cache(cfg),
+        dimensions=cfg['EMBED_DIMENSIONS']
+    )[0]
+
+    answer_cache = get_answer_cache(cfg)
+    if answer_cache is not None:
+        cached = answer_cache.lookup(query_vec, k, temperature)
+        if cached is not None:
+            return {'answer': cached['answer'], 'usage': None, 'cached': True}
+
+    # 2) Recuperación vectorial o híbrida (BM25 + vector con RRF)
+    docs = retrieve(question, query_vec, backend, k, cfg)
+
+    # 3) Contexto acotado por tokens y 4) respuesta de GPT
+    contexto, docs, context_stats = assemble_context(question, docs, cfg)
+    answer, usage, finish_reason = _complete(question, contexto, context_stats, k, temperature, chat_client, cfg)
+    if answer_cache is not None and is_cacheable_answer(answer, finish_reason):
+        answer_cache.store(
+            query_vec, k, temperature, answer,
+            [doc.get("file_name") for doc in docs if doc.get("file_name")],
+            time.perf_counter() - start
+        )
+    return {'answer': answer, 'usage': usage, 'cached': False}
+
+
+def run_rag_question(question: str, k: int = 5, temperature: float = 0.7) -> str:
+    """Ejecuta la consulta RAG y devuelve solo el texto de la respuesta."""
+    return run_rag(question, k, temperature)['answer']
+
+
+def _embed_windows(questions, embedding_client, cfg: dict):
+    """
+    Genera (índice, pregunta, vector, embed_s, error) embebiendo las
+    preguntas por ventanas de RAG_BATCH_WINDOW en peticiones multi-entrada.
+    embed_s es el tiempo de la ventana repartido entre sus preguntas. Si
+    falla el embedding de una ventana, sus preguntas salen sin vector y con
+    el error, y se sigue con la ventana siguiente.
+    """
+    offset = 0
+    for window in iter_windows(questions, cfg['RAG_BATCH_WINDOW']):
+        start = time.perf_counter()
+        error = None
+        try:
+            vectors = get_embeddings(
+                window, embedding_client, cfg['OAI_DEPLOYMENT'],
+                batch_size=cfg['RAG_BATCH_EMBED_SIZE'],
+                batch_tokens=cfg['EMBED_BATCH_TOKENS'],
+                max_workers=cfg['EMBED_CONCURRENCY'],
+                max_retries=cfg['EMBED_MAX_RETRIES'],
+                cache=get_embedding_cache(cfg),
+                dimensions=cfg['EMBED_DIMENSIONS']
+            )
+        except Exception as e:
+            logging.warning("RAG por lotes: error en los embeddings de las preguntas %d-%d: %s",
+                            offset, offset + len(window) - 1, e)
+            vectors, error = [None] * len(window), f"{type(e).__name__}: {e}"
+        embed_s = (time.perf_counter() - start) / len(window)
+        for i, (question, vec) in enumerate(zip(window, vectors)):
+            yield offset + i, question, vec, embed_s, error
+        offset += len(window)
+
+
+def _answer_embedded(index: int, question: str, query_vec, embed_s: float, error, k: int, temperature: float, cfg: dict, clients,
+                     search_slots, chat_slots) -> dict:
+    """
+    Responde una pregunta ya embebida: caché de respuestas, recuperación y
+    chat (limitados por search_slots y chat_slots). Los errores se devuelven en
+    el resultado para no interrumpir el lote; error es el del embedding de
+    la pregunta, si falló.
+    """
+    start = time.perf_counter()
+    latency = {'embed_s': embed_s, 'search_wait_s': 0.0, 'search_s': 0.0, 'context_s': 0.0,
+               'chat_wait_s': 0.0, 'chat_s': 0.0}
+    result = {'index': index, 'question': question, 'answer': None, 'usage': None, 'cached': False,
+              'latency': latency}
+    if error is not None:
+        result['error'] = error
+        latency['total_s'] = embed_s
+        return result
+    try:
+        answer_cache = get_answer_cache(cfg)
+        cached = answer_cache.lookup(query_vec, k, temperature) if answer_cache is not None else None
+        if cached is not None:
+            result.update(answer=cached['answer'], cached=True)
+        else:
+            t = time.perf_counter()
+            with search_slots:
+                latency['search_wait_s'] = time.perf_counter() - t
+                t = time.perf_counter()
+                docs = retrieve(question, query_vec, get_backend(cfg, clients), k, cfg)
+            latency['search_s'] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            contexto, docs, context_stats = assemble_context(question, docs, cfg)
+            latency['context_s'] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            with chat_slots:
+                latency['chat_wait_s'] = time.perf_counter() - t
+                t = time.perf_counter()
+                answer, usage, finish_reason = _complete(question, contexto, context_stats, k, temperature,
+                                                         clients['chat'], cfg)
+            latency['chat_s'] = time.perf_counter() - t
+            result.update(answer=answer, usage=usage)
+            if answer_cache is not None and is_cacheable_answer(answer, finish_reason):
+                answer_cache.store(
+                    query_vec, k, temperature, answer,
+                    [doc.get("file_name") for doc in docs if doc.get("file_name")],
+                    time.perf_counter() - start
+                )
+    except Exception as e:
+        logging.warning("RAG por lotes: error en la pregunta %d: %s", index, e)
+        result['error'] = f"{type(e).__name__}: {e}"
+    latency['total_s'] = embed_s + time.perf_counter() - start
+    return result
+
+
+def run_rag_batch(questions, k: int = 5, temperature: float = 0.7):
+    """
+    Ejecuta muchas consultas RAG (p. ej. un conjunto de evaluación) y genera
+    un resultado por pregunta según van terminando, no en orden de entrada:
+      - las preguntas se embeben por ventanas en peticiones multi-entrada;
+      - las búsquedas se lanzan en paralelo, como mucho
+        RAG_BATCH_SEARCH_CONCURRENCY simultáneas;
+      - las llamadas de chat se limitan a RAG_BATCH_CHAT_CONCURRENCY
+        simultáneas (ambas además de los límites de tasa por servicio).
+    La ventana siguiente se embebe mientras se responden las anteriores y el
+    número de preguntas en curso está acotado, así que la memoria no depende
+    del tamaño del lote.
+
+    Cada resultado es un dict con 'index' (posición en questions),
+    'question', 'answer', 'usage', 'cached', 'error' (solo si falló) y
+    'latency' con el desglose en segundos: embed_s (amortizado por
+    pregunta), search_wait_s (espera por un hueco de búsqueda), search_s,
+    context_s, chat_wait_s (espera por un hueco de chat), chat_s y total_s
+    (su suma).
+    """
+    cfg = get_config()
+    clients = get_clients(cfg)
+    searches = cfg['RAG_BATCH_SEARCH_CONCURRENCY']
+    chats = cfg['RAG_BATCH_CHAT_CONCURRENCY']
+    answer = partial(_answer_embedded, k=k, temperature=temperature, cfg=cfg, clients=clients,
+                     search_slots=threading.BoundedSemaphore(searches),
+                     chat_slots=threading.BoundedSemaphore(chats))
+    tasks = _embed_windows(questions, clients['oai'], cfg)
+    # Hilos para tener a la vez todas las búsquedas y todas las llamadas de chat permitidas
+    with ThreadPoolExecutor(max_workers=searches + chats, thread_name_prefix='rag-batch') as pool:
+        for _, fut in iter_completed(pool, answer, tasks, 2 * (searches + chats)):
+            yield fut.result()
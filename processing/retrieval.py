@@ -0,0 +1,47 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+
+def _doc_key(doc: dict) -> str:
+    """Identidad de un fragmento: su id o, si falta, (file_name, hash del contenido)."""
+    if doc.get('id'):
+        return doc['id']
+    digest = hashlib.sha1(doc.get('content', '').encode('utf-8')).hexdigest()
+    return f"{doc.get('file_name')}:{digest}"
+
+
+def rrf_fuse(result_lists: List[List[dict]], rrf_k: int = 60) -> List[dict]:
+    """
+    Fusiona listas ordenadas con Reciprocal Rank Fusion: cada documento suma
+    1 / (rrf_k + rango) por cada lista en la que aparece. Los duplicados (por
+    id o por mismo contenido del mismo archivo) se combinan en uno.
+    """
+    scores, docs, seen_content = {}, {}, {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = _doc_key(doc)
+            content_key = (doc.get('file_name'), hashlib.sha1(doc.get('content', '').encode('utf-8')).digest())
+            key = seen_content.setdefault(content_key, key)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [dict(docs[key], rrf_score=scores[key]) for key in ordered]
+
+
+def retrieve(question: str, query_vec, backend, k: int, cfg: dict) -> List[dict]:
+    """
+    Recupera fragmentos para la pregunta según RETRIEVAL_MODE:
+      - 'vector': top-k vectorial.
+      - 'hybrid': consultas léxica (BM25) y vectorial en paralelo sobre
+        HYBRID_CANDIDATES candidatos cada una, fusionadas con RRF.
+    En ambos casos se devuelven como máximo k fragmentos; el presupuesto de
+    tokens se aplica después al construir el contexto (processing.context).
+    """
+    if cfg['RETRIEVAL_MODE'] == 'hybrid':
+        n = max(k, cfg['HYBRID_CANDIDATES'])
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            lexical = pool.submit(backend.text_search, question, n)
+            vector = pool.submit(backend.vector_search, query_vec, n)
+            return rrf_fuse([lexical.result(), vector.result()], cfg['RRF_K'])[:k]
+    return backend.vector_search(query_vec, k)
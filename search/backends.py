@@ -0,0 +1,142 @@
+import threading
+from typing import Iterable, List
+
+from azure.search.documents.models import VectorizedQuery
+
+from search.index import DEFAULT_DIMENSIONS, ensure_vector_index
+from search.local_index import LocalVectorIndex
+from search.uploader import compact_vector, upload_documents_streaming
+from utils.telemetry import external_call
+
+
+class RetrievalBackend:
+    """
+    Interfaz de backend de recuperación usada por el pipeline y el módulo RAG.
+    Los documentos son dicts con 'id', 'content', 'file_name' y 'contentVector'.
+    """
+
+    def ensure_index(self):
+        """Crea el índice si no existe (idempotente)."""
+        raise NotImplementedError
+
+    def upload(self, docs, **kwargs) -> dict:
+        """Inserta o actualiza documentos desde un iterable; devuelve estadísticas."""
+        raise NotImplementedError
+
+    def delete(self, ids: Iterable[str]):
+        """Elimina documentos por id."""
+        raise NotImplementedError
+
+    def vector_search(self, vector, k: int = 5) -> List[dict]:
+        """Devuelve los k documentos más similares al vector."""
+        raise NotImplementedError
+
+    def text_search(self, query: str, k: int = 5) -> List[dict]:
+        """Devuelve los k documentos con mejor puntuación léxica (BM25)."""
+        raise NotImplementedError
+
+
+class AzureSearchBackend(RetrievalBackend):
+    """Backend sobre Azure Cognitive Search (comportamiento por defecto)."""
+
+    def __init__(self, clients, cfg: dict):
+        self.clients = clients
+        self.cfg = cfg
+
+    def ensure_index(self):
+        self.clients.once(
+            'vector_index',
+            lambda: ensure_vector_index(
+                self.clients['index'], self.cfg['INDEX_NAME'],
+                dimensions=self.cfg['EMBED_DIMENSIONS'] or DEFAULT_DIMENSIONS,
+                compression=self.cfg['VECTOR_COMPRESSION'],
+                oversampling=self.cfg['VECTOR_OVERSAMPLING']
+            )
+        )
+
+    def upload(self, docs, **kwargs) -> dict:
+        return upload_documents_streaming(self.clients['search'], docs, **kwargs)
+
+    def delete(self, ids: Iterable[str]):
+        docs = [{'id': doc_id} for doc_id in ids]
+        if docs:
+            with external_call('search', 'delete'):
+                self.clients['search'].delete_documents(documents=docs)
+
+    def vector_search(self, vector, k: int = 5) -> List[dict]:
+        vec_q = VectorizedQuery(
+            vector=compact_vector(vector),
+            fields="contentVector",
+            k_nearest_neighbors=k
+        )
+        # Los resultados se paginan al iterar: la medición incluye su lectura
+        with external_call('search', 'query_vector'):
+            results = self.clients['search'].search(
+                search_text="*",
+                vector_queries=[vec_q],
+                select=["id", "content", "file_name"],
+                top=k
+            )
+            return [dict(doc) for doc in results]
+
+    def text_search(self, query: str, k: int = 5) -> List[dict]:
+        # Consulta léxica sobre `content` (analizador en.lucene del índice)
+        with external_call('search', 'query_text'):
+            results = self.clients['search'].search(
+                search_text=query,
+                select=["id", "content", "file_name"],
+                top=k
+            )
+            return [dict(doc) for doc in results]
+
+
+class LocalBackend(RetrievalBackend):
+    """Backend en proceso sobre LocalVectorIndex (sin red)."""
+
+    def __init__(self, index: LocalVectorIndex):
+        self.index = index
+
+    def ensure_index(self):
+        pass
+
+    def upload(self, docs, **kwargs) -> dict:
+        return self.index.upload(
+            docs,
+            max_batch_docs=kwargs.get('max_batch_docs', 500),
+            max_batch_bytes=kwargs.get('max_batch_bytes', 8_000_000)
+        )
+
+    def delete(self, ids: Iterable[str]):
+        self.index.delete(ids)
+        self.index.flush()
+
+    def vector_search(self, vector, k: int = 5) -> List[dict]:
+        return self.index.search(vector, k)
+
+    def text_search(self, query: str, k: int = 5) -> List[dict]:
+        return self.index.text_search(query, k)
+
+
+_local_indexes = {}
+_local_lock = threading.Lock()
+
+
+def get_backend(cfg: dict, clients=None) -> RetrievalBackend:
+    """
+    Devuelve el backend configurado en RETRIEVAL_BACKEND ('azure' o 'local').
+    El índice local se abre una sola vez por proceso y directorio.
+    """
+    if cfg['RETRIEVAL_BACKEND'] == 'local':
+        path = cfg['LOCAL_INDEX_DIR']
+        with _local_lock:
+            if path not in _local_indexes:
+                _local_indexes[path] = LocalVectorIndex(
+                    path,
+                    ivf_threshold=cfg['LOCAL_IVF_THRESHOLD'],
+                    nprobe=cfg['LOCAL_IVF_NPROBE']
+                )
+            return LocalBackend(_local_indexes[path])
+    if clients is None:
+        from clients import get_clients
+        clients = get_clients(cfg)
+    return AzureSearchBackend(clients, cfg)
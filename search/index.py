@@ -1,8 +1,14 @@
+from azure.core.exceptions import ResourceNotFoundError
+from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import (
     SearchIndex, SimpleField, SearchableField, SearchField,
-    VectorSearch, HnswAlgorithmConfiguration, VectorSearchProfile, SearchFieldDataType
+    VectorSearch, HnswAlgorithmConfiguration, HnswParameters, VectorSearchProfile, SearchFieldDataType,
+    ScalarQuantizationCompression, ScalarQuantizationParameters, BinaryQuantizationCompression
 )
 
+# Dimensión de los modelos de embeddings actuales (ada-002 / text-embedding-3-small)
+DEFAULT_DIMENSIONS = 1536
+
 def create_vector_index(index_client, index_name: str):
     try:
         index_client.delete_index(index_name)
@@ -26,3 +32,94 @@ def create_vector_index(index_client, index_name: str):
     )
     index = SearchIndex(name=index_name, fields=fields, vector_search=vector_search)
     index_client.create_or_update_index(index)
+
+
+def vector_compression(kind: str, oversampling: float):
+    """
+    Compresión del campo vectorial: 'int8' (cuantización escalar, 4x menos),
+    'binary' (1 bit por dimensión, 32x menos) o 'none'. Las compresiones
+    reordenan los candidatos con los vectores originales (rescoring) tras
+    recuperar oversampling veces más candidatos.
+    """
+    if kind == 'int8':
+        return ScalarQuantizationCompression(
+            compression_name="int8-compression",
+            rerank_with_original_vectors=True,
+            default_oversampling=oversampling,
+            parameters=ScalarQuantizationParameters(quantized_data_type="int8")
+        )
+    if kind == 'binary':
+        return BinaryQuantizationCompression(
+            compression_name="binary-compression",
+            rerank_with_original_vectors=True,
+            default_oversampling=oversampling
+        )
+    if kind not in ('', 'none'):
+        raise ValueError(f"Compresión vectorial desconocida: {kind}")
+    return None
+
+
+def ensure_vector_index(index_client: SearchIndexClient, index_name: str,
+                        dimensions: int = DEFAULT_DIMENSIONS, compression: str = 'none',
+                        oversampling: float = 10.0):
+    """
+    Verifica la existencia del índice vectorial y lo crea o actualiza si no existe.
+    Un índice existente no se modifica: cambiar dimensions o compression
+    requiere recrearlo y reindexar.
+    """
+    try:
+        index_client.get_index(name=index_name)
+    except ResourceNotFoundError:
+        compressor = vector_compression(compression, oversampling)
+        # Definición de campos del índice
+        fields = [
+            SimpleField(name="id", type=SearchFieldDataType.String, key=True),
+            SearchableField(
+                name="content",
+                type=SearchFieldDataType.String,
+                analyzer_name="en.lucene"
+            ),
+            SimpleField(name="file_name", type=SearchFieldDataType.String),
+            # Campo vectorial con dimensiones y perfil de búsqueda. Con compresión
+            # no se guarda la copia recuperable del vector (nunca se selecciona)
+            SearchField(
+                name="contentVector",
+                type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+                searchable=True,
+                hidden=compressor is not None,
+                stored=False if compressor is not None else None,
+                vector_search_dimensions=dimensions,
+                vector_search_profile_name="hnsw-config"
+            ),
+        ]
+
+        # Configuración de búsqueda vectorial con perfil y algoritmo HNSW
+        vector_search = VectorSearch(
+            profiles=[
+                VectorSearchProfile(
+                    name="hnsw-config",
+                    algorithm_configuration_name="hnsw-algo",
+                    compression_name=compressor.compression_name if compressor is not None else None
+                )
+            ],
+            algorithms=[
+                HnswAlgorithmConfiguration(
+                    name="hnsw-algo",
+                    parameters=HnswParameters(
+                        m=4,
+                        ef_construction=400,
+                        ef_search=500,
+                        metric="cosine"
+                    )
+                )
+            ],
+            compressions=[compressor] if compressor is not None else None
+        )
+
+        # Crear o actualizar el índice vectorial
+        index = SearchIndex(
+            name=index_name,
+            fields=fields,
+            vector_search=vector_search
+        )
+        index_client.create_or_update_index(index)
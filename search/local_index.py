@@ -0,0 +1,309 @@
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy as np
+
+from search.uploader import iter_batches
+
+_WORD_RE = re.compile(r'\w+')
+
+
+class LocalVectorIndex:
+    """
+    Índice vectorial local en proceso, alternativa a Cognitive Search para
+    pruebas, benchmarks y ejecución sin Azure.
+
+    - Vectores normalizados en una matriz float32 memory-mapped (vectors.f32)
+      que crece por duplicación; metadatos (id, contenido, file_name) en SQLite.
+    - Búsqueda exacta vectorizada (producto matricial + argpartition) para
+      corpus pequeños.
+    - A partir de ivf_threshold vectores se entrena un índice IVF (k-means)
+      y solo se puntúan las listas de los nprobe centroides más cercanos.
+    - Altas, actualizaciones (por id) y bajas incrementales; las filas
+      borradas se reutilizan.
+    - Búsqueda léxica BM25 sobre el contenido con SQLite FTS5.
+    """
+
+    def __init__(self, path: str, ivf_threshold: int = 50000, nprobe: int = 8):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.path / 'meta.sqlite', check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS docs ('
+            ' id TEXT PRIMARY KEY, row INTEGER NOT NULL, content TEXT, file_name TEXT)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS ix_row ON docs(row)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)')
+        self._db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5("
+            "content, tokenize='unicode61 remove_diacritics 2')"
+        )
+        # Índices creados antes de existir la búsqueda léxica
+        if not self._db.execute('SELECT 1 FROM docs_fts LIMIT 1').fetchone():
+            self._db.execute('INSERT INTO docs_fts(rowid, content) SELECT row, content FROM docs')
+        self._db.commit()
+
+        info = dict(self._db.execute('SELECT key, value FROM info').fetchall())
+        self.dim = int(info['dim']) if 'dim' in info else None
+        self._capacity = int(info.get('capacity', 0))
+        self._vectors = None
+        if self.dim:
+            self._vectors = np.memmap(
+                self.path / 'vectors.f32', dtype=np.float32, mode='r+',
+                shape=(self._capacity, self.dim)
+            )
+
+        rows = self._db.execute('SELECT id, row FROM docs').fetchall()
+        self._row_of = {doc_id: row for doc_id, row in rows}
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        for row in self._row_of.values():
+            self._alive[row] = True
+        self._free = [r for r in range(self._capacity) if not self._alive[r]]
+
+        # Estado IVF
+        self._centroids = None
+        self._assign = None
+        self._trained_size = 0
+        ivf_file = self.path / 'ivf.npz'
+        if ivf_file.exists():
+            data = np.load(ivf_file)
+            self._centroids = data['centroids']
+            self._assign = data['assign']
+            self._trained_size = int(data['trained_size'])
+            if self._assign.shape[0] < self._capacity:
+                self._assign = np.concatenate([
+                    self._assign, np.full(self._capacity - self._assign.shape[0], -1, dtype=np.int32)
+                ])
+            # Las asignaciones solo se guardan en flush(): las filas añadidas
+            # después (p. ej. antes de una salida abrupta) se asignan al cargar
+            self._assign_rows(np.flatnonzero(self._alive & (self._assign < 0)))
+
+    def __len__(self):
+        return len(self._row_of)
+
+    # Almacenamiento
+    def _init_dim(self, dim: int):
+        self.dim = dim
+        self._db.execute('INSERT OR REPLACE INTO info(key, value) VALUES (?, ?)', ('dim', str(dim)))
+
+    def _grow(self, needed: int):
+        """Amplía la matriz memory-mapped (al menos al doble) para alojar needed filas."""
+        new_cap = max(needed, self._capacity * 2, 1024)
+        new_file = self.path / 'vectors.f32.tmp'
+        grown = np.memmap(new_file, dtype=np.float32, mode='w+', shape=(new_cap, self.dim))
+        if self._vectors is not None and self._capacity:
+            grown[:self._capacity] = self._vectors[:self._capacity]
+            grown.flush()
+            del self._vectors
+        del grown
+        new_file.replace(self.path / 'vectors.f32')
+        self._vectors = np.memmap(
+            self.path / 'vectors.f32', dtype=np.float32, mode='r+', shape=(new_cap, self.dim)
+        )
+        self._alive = np.concatenate([self._alive, np.zeros(new_cap - self._capacity, dtype=bool)])
+        if self._assign is not None:
+            self._assign = np.concatenate([
+                self._assign, np.full(new_cap - self._capacity, -1, dtype=np.int32)
+            ])
+        self._free.extend(range(self._capacity, new_cap))
+        self._free.sort(reverse=True)
+        self._capacity = new_cap
+        self._db.execute(
+            'INSERT OR REPLACE INTO info(key, value) VALUES (?, ?)', ('capacity', str(new_cap))
+        )
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, docs: List[dict]):
+        """Inserta o reemplaza documentos {'id', 'content', 'file_name', 'contentVector'}."""
+        if not docs:
+            return
+        with self._lock:
+            vectors = self._normalize(np.asarray([d['contentVector'] for d in docs], dtype=np.float32))
+            if self.dim is None:
+                self._init_dim(vectors.shape[1])
+            new_ids = [d['id'] for d in docs if d['id'] not in self._row_of]
+            if len(new_ids) > len(self._free):
+                self._grow(self._capacity + len(new_ids) - len(self._free))
+            rows = []
+            for d in docs:
+                row = self._row_of.get(d['id'])
+                if row is None:
+                    row = self._free.pop()
+                    self._row_of[d['id']] = row
+                rows.append(row)
+            rows = np.asarray(rows)
+            self._vectors[rows] = vectors
+            self._alive[rows] = True
+            if self._centroids is not None:
+                self._assign[rows] = self._nearest_centroids(vectors)
+            self._db.executemany(
+                'INSERT OR REPLACE INTO docs(id, row, content, file_name) VALUES (?, ?, ?, ?)',
+                [(d['id'], int(r), d.get('content', ''), d.get('file_name')) for d, r in zip(docs, rows)]
+            )
+            self._db.executemany('DELETE FROM docs_fts WHERE rowid=?', [(int(r),) for r in rows])
+            self._db.executemany(
+                'INSERT INTO docs_fts(rowid, content) VALUES (?, ?)',
+                [(int(r), d.get('content', '')) for d, r in zip(docs, rows)]
+            )
+            self._db.commit()
+            self._maybe_train()
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """Elimina documentos por id; devuelve cuántos existían."""
+        with self._lock:
+            removed, rows = [], []
+            for doc_id in ids:
+                row = self._row_of.pop(doc_id, None)
+                if row is not None:
+                    rows.append((row,))
+                    self._alive[row] = False
+                    if self._assign is not None:
+                        self._assign[row] = -1
+                    self._free.append(row)
+                    removed.append(doc_id)
+            if removed:
+                self._db.executemany('DELETE FROM docs WHERE id=?', [(i,) for i in removed])
+                self._db.executemany('DELETE FROM docs_fts WHERE rowid=?', rows)
+                self._db.commit()
+            return len(removed)
+
+    def flush(self):
+        """Persiste vectores y estado IVF en disco."""
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            if self._centroids is not None:
+                np.savez(
+                    self.path / 'ivf.npz', centroids=self._centroids,
+                    assign=self._assign, trained_size=self._trained_size
+                )
+
+    # IVF
+    def _nearest_centroids(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _maybe_train(self):
+        """(Re)entrena el IVF al superar el umbral o al duplicarse el corpus."""
+        n = len(self._row_of)
+        if n < self.ivf_threshold or (self._trained_size and n < 2 * self._trained_size):
+            return
+        self.train_ivf()
+
+    def train_ivf(self, iterations: int = 10, sample_size: int = 100000, seed: int = 0):
+        """K-means esférico sobre una muestra de vectores y asignación de todas las filas."""
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            if rows.size == 0:
+                return
+            nlist = max(1, int(np.sqrt(rows.size)))
+            rng = np.random.default_rng(seed)
+            sample = self._vectors[rng.choice(rows, size=min(sample_size, rows.size), replace=False)]
+            centroids = sample[rng.choice(sample.shape[0], size=min(nlist, sample.shape[0]), replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(centroids.shape[0]):
+                    members = sample[labels == c]
+                    if members.size:
+                        centroids[c] = members.mean(axis=0)
+                centroids = self._normalize(centroids)
+            self._centroids = centroids.astype(np.float32)
+            self._assign = np.full(self._capacity, -1, dtype=np.int32)
+            self._assign_rows(rows)
+            self._trained_size = rows.size
+
+    def _assign_rows(self, rows: np.ndarray, chunk: int = 65536):
+        """Asigna las filas dadas a su centroide más cercano, por bloques."""
+        for start in range(0, rows.size, chunk):
+            part = rows[start:start + chunk]
+            self._assign[part] = self._nearest_centroids(self._vectors[part])
+
+    # Búsqueda
+    def search(self, vector, k: int = 5, exact: bool = False) -> List[dict]:
+        """Top-k por similitud coseno; devuelve dicts con id, content, file_name y score."""
+        with self._lock:
+            if not self._row_of:
+                return []
+            query = np.asarray(vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            if self._centroids is not None and not exact:
+                probes = np.argsort(-(self._centroids @ query))[:self.nprobe]
+                rows = np.flatnonzero(np.isin(self._assign, probes) & self._alive)
+            else:
+                rows = np.flatnonzero(self._alive)
+            if rows.size == 0:
+                return []
+            scores = self._vectors[rows] @ query
+            k = min(k, rows.size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return self._docs_for_rows([(int(rows[i]), float(scores[i])) for i in top])
+
+    def text_search(self, query: str, k: int = 5) -> List[dict]:
+        """Top-k léxico por BM25 (FTS5) sobre el contenido."""
+        terms = _WORD_RE.findall(query)
+        if not terms:
+            return []
+        match = ' OR '.join('"{}"'.format(t.replace('"', '')) for t in dict.fromkeys(terms))
+        with self._lock:
+            hits = self._db.execute(
+                'SELECT rowid, bm25(docs_fts) FROM docs_fts WHERE docs_fts MATCH ? '
+                'ORDER BY bm25(docs_fts) LIMIT ?',
+                (match, k)
+            ).fetchall()
+            # bm25() devuelve valores negativos: más negativo es más relevante
+            return self._docs_for_rows([(row, -score) for row, score in hits])
+
+    def _docs_for_rows(self, hits) -> List[dict]:
+        """Recupera los metadatos de las filas manteniendo el orden de los resultados."""
+        if not hits:
+            return []
+        by_row = {}
+        placeholders = ','.join('?' * len(hits))
+        for doc_id, row, content, file_name in self._db.execute(
+            f'SELECT id, row, content, file_name FROM docs WHERE row IN ({placeholders})',
+            [r for r, _ in hits]
+        ):
+            by_row[row] = {'id': doc_id, 'content': content, 'file_name': file_name}
+        return [dict(by_row[r], score=s) for r, s in hits if r in by_row]
+
+    # Interfaz de backend de recuperación
+    def ensure_index(self):
+        pass
+
+    def upload(self, docs, max_batch_docs: int = 500, max_batch_bytes: int = 8_000_000, **kwargs) -> dict:
+        """Inserta documentos desde un iterable; devuelve estadísticas como el uploader de Azure."""
+        stats = {'uploaded': 0, 'failed': 0, 'retried': 0, 'batches': 0, 'bytes': 0, 'failed_keys': []}
+        start = time.perf_counter()
+        for batch, size in iter_batches(docs, max_batch_docs, max_batch_bytes):
+            self.add(batch)
+            stats['uploaded'] += len(batch)
+            stats['batches'] += 1
+            stats['bytes'] += size
+        self.flush()
+        stats['seconds'] = time.perf_counter() - start
+        stats['docs_per_s'] = stats['uploaded'] / stats['seconds'] if stats['seconds'] else 0.0
+        return stats
+
+    def vector_search(self, vector, k: int = 5) -> List[dict]:
+        return self.search(vector, k)
+
+    def stats(self) -> dict:
+        return {
+            'documents': len(self._row_of),
+            'capacity': self._capacity,
+            'dim': self.dim,
+            'ivf_lists': 0 if self._centroids is None else int(self._centroids.shape[0]),
+        }
@@ -1,5 +1,159 @@
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from azure.core.exceptions import HttpResponseError, ServiceRequestError
+
+from utils.telemetry import external_call, record, submit_in_context
+
+# Códigos de estado por documento que Cognitive Search considera transitorios
+RETRYABLE_STATUS = {409, 422, 429, 500, 503}
+
+# Decimales de los vectores en el JSON enviado: 1e-7 es del orden de la
+# resolución de float32 para componentes de vectores normalizados
+VECTOR_DECIMALS = 7
+
+
+def compact_vector(vec) -> list:
+    """
+    Lista JSON compacta de un vector (float32 o lista): redondeada a
+    VECTOR_DECIMALS, ocupa la mitad que la representación completa de double.
+    """
+    return np.round(np.asarray(vec, dtype=np.float64), VECTOR_DECIMALS).tolist()
+
+
+def _serializable(doc: dict) -> dict:
+    """Copia del documento con los vectores numpy convertidos a listas compactas."""
+    return {key: compact_vector(value) if isinstance(value, np.ndarray) else value
+            for key, value in doc.items()}
+
+
+def _doc_size(doc: dict) -> int:
+    """Estimación barata del tamaño JSON de un documento (sin serializarlo)."""
+    size = 2
+    for key, value in doc.items():
+        size += len(key) + 4
+        if isinstance(value, str):
+            size += len(value) + len(value) // 8 + 2
+        elif isinstance(value, np.ndarray):
+            # ~11 caracteres por componente con compact_vector
+            size += 11 * len(value) + 2
+        elif isinstance(value, (list, tuple)):
+            # ~20 caracteres por float en notación JSON
+            size += 20 * len(value) + 2
+        else:
+            size += 24
+    return size
+
+
+def iter_batches(docs, max_docs: int, max_bytes: int):
+    """Agrupa un iterable de documentos en lotes acotados por número y bytes."""
+    batch, batch_bytes = [], 0
+    for doc in docs:
+        size = _doc_size(doc)
+        if batch and (len(batch) >= max_docs or batch_bytes + size > max_bytes):
+            yield batch, batch_bytes
+            batch, batch_bytes = [], 0
+        batch.append(doc)
+        batch_bytes += size
+    if batch:
+        yield batch, batch_bytes
+
+
+def _send_batch(search_client, batch: list, action: str, max_retries: int) -> dict:
+    """
+    Envía un lote y reintenta con backoff solo los documentos cuyo fallo es
+    transitorio. Devuelve contadores y las claves que fallaron definitivamente.
+    """
+    send = getattr(search_client, f"{action}_documents")
+    # Las listas de floats solo existen mientras se envía el lote
+    pending = [_serializable(d) for d in batch]
+    result = {'uploaded': 0, 'retried': 0, 'failed_keys': []}
+    for attempt in range(max_retries + 1):
+        try:
+            with external_call('search', action):
+                responses = send(documents=pending)
+        except (HttpResponseError, ServiceRequestError) as e:
+            status = getattr(e, 'status_code', None)
+            if attempt == max_retries or (status is not None and status not in RETRYABLE_STATUS):
+                result['failed_keys'].extend(d['id'] for d in pending)
+                logging.error("Error indexando lote de %d documentos: %s", len(pending), e)
+                return result
+            responses = None
+
+        retry = []
+        if responses is None:
+            retry = pending
+        else:
+            by_key = {d['id']: d for d in pending}
+            for r in responses:
+                if r.succeeded:
+                    result['uploaded'] += 1
+                elif r.status_code in RETRYABLE_STATUS and attempt < max_retries:
+                    retry.append(by_key[r.key])
+                else:
+                    result['failed_keys'].append(r.key)
+                    logging.error("Error indexando %s: %s", r.key, r.error_message)
+        if not retry:
+            return result
+        result['retried'] += len(retry)
+        record('retries', len(retry), 'Reintentos de llamadas externas', service='search')
+        time.sleep(min(30.0, 2 ** attempt) * (0.5 + random.random() / 2))
+        pending = retry
+    return result
+
+
+def upload_documents_streaming(
+    search_client,
+    docs,
+    max_batch_docs: int = 500,
+    max_batch_bytes: int = 8_000_000,
+    max_retries: int = 5,
+    action: str = 'merge_or_upload',
+    overlap: bool = False
+) -> dict:
+    """
+    Sube documentos desde un iterable/generador en lotes acotados por número y
+    bytes estimados, sin materializar todo el conjunto en memoria. Con
+    overlap=True el lote N se sube en segundo plano mientras se produce el
+    lote N+1 (por ejemplo, generando sus embeddings).
+    Devuelve estadísticas de la subida.
+    """
+    stats = {'uploaded': 0, 'failed': 0, 'retried': 0, 'batches': 0, 'bytes': 0, 'failed_keys': []}
+    start = time.perf_counter()
+
+    def merge(result):
+        stats['uploaded'] += result['uploaded']
+        stats['retried'] += result['retried']
+        stats['failed'] += len(result['failed_keys'])
+        stats['failed_keys'].extend(result['failed_keys'])
+
+    if overlap:
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            inflight = None
+            for batch, size in iter_batches(docs, max_batch_docs, max_batch_bytes):
+                if inflight is not None:
+                    merge(inflight.result())
+                inflight = submit_in_context(pool, _send_batch, search_client, batch, action, max_retries)
+                stats['batches'] += 1
+                stats['bytes'] += size
+            if inflight is not None:
+                merge(inflight.result())
+    else:
+        for batch, size in iter_batches(docs, max_batch_docs, max_batch_bytes):
+            merge(_send_batch(search_client, batch, action, max_retries))
+            stats['batches'] += 1
+            stats['bytes'] += size
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['docs_per_s'] = stats['uploaded'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
 def upload_documents(search_client, docs: list):
-    results = search_client.upload_documents(documents=docs)
-    for r in results:
-        if not r.succeeded:
-            print(f"Error indexando {r.key}: {r.error_message}")
+    stats = upload_documents_streaming(search_client, docs, action='upload')
+    for key in stats['failed_keys']:
+        print(f"Error indexando {key}")
+    return stats
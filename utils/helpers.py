@@ -1,10 +1,45 @@
 import re
+from concurrent.futures import FIRST_COMPLETED, wait
+from itertools import islice
+
+# Marcadores de elemento de lista: viñeta, número, número romano o letra
+LIST_MARKER = (
+    r'[•·●○\-\\*]'
+    r'|\d+\.'
+    r'|M{0,4}(?:CM|CD|D?C{0,3})(?:XC|XL|L?X{0,3})(?:IX|IV|V?I{0,3})\.'
+    r'|[A-Za-z]\.'
+)
 
 def compile_list_regex():
-    bullet  = r'[•·●○\-\\*]'
-    decimal = r'\d+\.'
-    roman   = r'M{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})\.'
-    letter  = r'[A-Za-z]\.'
-    return re.compile(
-        rf'^(?P<indent>\s*)(?P<marker>{bullet}|{decimal}|{roman}|{letter})\s+'
-    )
+    return re.compile(rf'^(?P<indent>\s*)(?P<marker>{LIST_MARKER})\s+')
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens (~4 caracteres por token) sin tokenizador."""
+    return (len(text) + 3) // 4
+
+def iter_windows(iterable, size: int):
+    """Agrupa un iterable en listas de como máximo size elementos, sin materializarlo."""
+    it = iter(iterable)
+    while True:
+        window = list(islice(it, size))
+        if not window:
+            return
+        yield window
+
+def iter_completed(pool, fn, tasks, max_in_flight: int):
+    """
+    Envía tareas (tuplas de argumentos de fn) al pool manteniendo como mucho
+    max_in_flight pendientes, de modo que tasks se consume a medida que
+    avanza, y genera (tarea, future) según terminan.
+    """
+    pending = {}
+    for task in tasks:
+        if len(pending) >= max_in_flight:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield pending.pop(fut), fut
+        pending[pool.submit(fn, *task)] = task
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            yield pending.pop(fut), fut
@@ -0,0 +1,119 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+
+class TokenBucket:
+    """
+    Cubo de tokens con reserva: reserve(cost) descuenta el coste aunque el
+    cubo quede en negativo y devuelve los segundos que hay que esperar hasta
+    que la deuda se repone. Así las peticiones se sirven en orden de llegada
+    y un coste mayor que la ráfaga (p. ej. un lote grande de tokens) no se
+    bloquea para siempre.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost: float = 1) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= cost
+            return max(0.0, -self._tokens / self.rate)
+
+
+class RateLimiter:
+    """
+    Un cubo de tokens por servicio externo. Los servicios sin límite
+    configurado (o con límite 0) no se limitan.
+    """
+
+    def __init__(self, limits: dict, burst_s: float = 1.0):
+        self.limits = {name: rate for name, rate in limits.items() if rate and rate > 0}
+        self._buckets = {name: TokenBucket(rate, rate * burst_s) for name, rate in self.limits.items()}
+
+    def reserve(self, service: str, cost: float = 1) -> float:
+        """Reserva cost unidades del servicio y devuelve la espera necesaria (s)."""
+        bucket = self._buckets.get(service)
+        return bucket.reserve(cost) if bucket is not None else 0.0
+
+
+class _LimiterManager(BaseManager):
+    pass
+
+
+_LimiterManager.register('RateLimiter', RateLimiter, exposed=('reserve',))
+
+_limiter = None
+
+
+def rate_limits_from_config(cfg: dict) -> dict:
+    """Límites por servicio (unidades por segundo) a partir de la configuración."""
+    return {
+        'document_intelligence': cfg['DI_MAX_RPS'],
+        'text_analytics': cfg['TA_MAX_RPS'],
+        'openai': cfg['OPENAI_MAX_RPS'],
+        'openai_tokens': cfg['OPENAI_MAX_TPM'] / 60,
+        'search': cfg['SEARCH_MAX_RPS'],
+    }
+
+
+def configure_rate_limits(cfg: dict):
+    """Instala el limitador del proceso según la configuración."""
+    set_rate_limiter(RateLimiter(rate_limits_from_config(cfg), cfg['RATE_LIMIT_BURST_S']))
+
+
+def configure_rate_limits_once(clients, cfg: dict):
+    """
+    Instala el limitador del proceso solo la primera vez para el registro de
+    clientes dado: otra ejecución en el mismo proceso no reinicia los cubos
+    (ni sustituye el limitador compartido de un worker).
+    """
+    clients.once('rate_limits', lambda: configure_rate_limits(cfg))
+
+
+def set_rate_limiter(limiter):
+    """Instala un limitador (local o proxy compartido entre procesos), o None para desactivarlo."""
+    global _limiter
+    _limiter = limiter
+
+
+def start_shared_limiter(cfg: dict):
+    """
+    Arranca un proceso gestor con un RateLimiter único y devuelve
+    (manager, proxy). El proxy se puede pasar a procesos hijos para que
+    todos consuman del mismo cubo por servicio. El gestor se arranca con
+    spawn: el proceso padre ya tiene hilos en marcha y un fork podría
+    heredar sus locks tomados.
+    """
+    manager = _LimiterManager(ctx=multiprocessing.get_context('spawn'))
+    manager.start()
+    return manager, manager.RateLimiter(rate_limits_from_config(cfg), cfg['RATE_LIMIT_BURST_S'])
+
+
+def acquire(service: str, cost: float = 1) -> float:
+    """Espera hasta poder consumir cost unidades del servicio. Devuelve los segundos esperados."""
+    if _limiter is None:
+        return 0.0
+    wait = _limiter.reserve(service, cost)
+    if wait > 0:
+        time.sleep(wait)
+    return wait
+
+
+async def aacquire(service: str, cost: float = 1) -> float:
+    """Equivalente asíncrono de acquire: espera con asyncio.sleep sin bloquear el bucle de eventos."""
+    if _limiter is None:
+        return 0.0
+    wait = _limiter.reserve(service, cost)
+    if wait > 0:
+        await asyncio.sleep(wait)
+    return wait
@@ -0,0 +1,249 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from utils.ratelimit import aacquire, acquire
+
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _label_str(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class MetricsRegistry:
+    """
+    Contadores e histogramas del proceso con etiquetas, en memoria y seguros
+    entre hilos. render() los exporta en el formato de texto de Prometheus.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name: str, value: float = 1, description: str = '', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('counter', description))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, description: str = '', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('histogram', description))
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            idx = bisect.bisect_left(self.buckets, value)
+            if idx < len(self.buckets):
+                hist['buckets'][idx] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def render(self) -> str:
+        """Exporta todas las series en el formato de exposición de Prometheus."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: {'buckets': list(v['buckets']), 'sum': v['sum'], 'count': v['count']}
+                          for k, v in self._histograms.items()}
+            helps = dict(self._help)
+        lines = []
+        for name in sorted(helps):
+            kind, description_text = helps[name]
+            lines.append(f"# HELP {name} {description_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_label_str(labels)} {value}")
+                continue
+            for (metric, labels), hist in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(self.buckets, hist['buckets']):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_label_str(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_bucket{_label_str(labels + (('le', '+Inf'),))} {hist['count']}")
+                lines.append(f"{name}_sum{_label_str(labels)} {hist['sum']}")
+                lines.append(f"{name}_count{_label_str(labels)} {hist['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+_current_document = contextvars.ContextVar('current_document', default=None)
+
+
+class DocumentTelemetry:
+    """
+    Tiempos y contadores de la ingesta de un documento.
+
+    stage() mide tiempo exclusivo: si una etapa se ejecuta dentro de otra (por
+    ejemplo, un generador que tira de otro), su tiempo se descuenta de la
+    exterior, de modo que las etapas suman el tiempo total. Los contadores
+    (llamadas externas, reintentos, bytes, tokens) se pueden incrementar
+    desde cualquier hilo.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages = {}
+        self.counters = {}
+        self._stack = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self.total_s = None
+
+    @contextmanager
+    def stage(self, name: str):
+        now = time.perf_counter()
+        if self._stack:
+            parent, since = self._stack[-1]
+            self.stages[parent] = self.stages.get(parent, 0.0) + now - since
+        self._stack.append((name, now))
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            _, since = self._stack.pop()
+            self.stages[name] = self.stages.get(name, 0.0) + now - since
+            if self._stack:
+                self._stack[-1] = (self._stack[-1][0], now)
+
+    def timed_iter(self, iterable, name: str):
+        """Recorre un iterable atribuyendo a la etapa name el tiempo de producir cada elemento."""
+        it = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> dict:
+        """Campos planos para la entidad de Table Storage."""
+        total = self.total_s if self.total_s is not None else time.perf_counter() - self._start
+        out = {'total_time_s': total}
+        out.update({f"stage_{name}_s": seconds for name, seconds in self.stages.items()})
+        with self._lock:
+            out.update(self.counters)
+        return out
+
+
+@contextmanager
+def track_document(name: str):
+    """
+    Activa la telemetría de un documento en el contexto actual. Al salir
+    vuelca los tiempos por etapa y el total en los histogramas del proceso.
+    """
+    tel = DocumentTelemetry(name)
+    token = _current_document.set(tel)
+    status = 'failed'
+    try:
+        yield tel
+        status = 'succeeded'
+    finally:
+        _current_document.reset(token)
+        tel.total_s = time.perf_counter() - tel._start
+        for stage, seconds in tel.stages.items():
+            REGISTRY.observe('ingest_stage_seconds', seconds, 'Tiempo por etapa y documento', stage=stage)
+        REGISTRY.observe('ingest_document_seconds', tel.total_s, 'Tiempo total por documento')
+        REGISTRY.inc('ingest_documents_total', 1, 'Documentos procesados', status=status)
+
+
+def current_document():
+    """Telemetría del documento en curso, o None fuera de una ingesta."""
+    return _current_document.get()
+
+
+def record(name: str, value: float = 1, description: str = '', **labels):
+    """Incrementa un contador del proceso y el del documento en curso."""
+    REGISTRY.inc(f"{name}_total", value, description, **labels)
+    tel = _current_document.get()
+    if tel is not None:
+        suffix = '_'.join(str(v) for v in labels.values())
+        tel.count(f"{suffix}_{name}" if suffix else name, value)
+
+
+def _record_wait(service: str, waited: float):
+    if waited:
+        REGISTRY.inc('rate_limit_wait_seconds_total', waited, 'Espera por limitación de tasa',
+                     service=service)
+        tel = _current_document.get()
+        if tel is not None:
+            tel.count(f"{service}_throttled_s", waited)
+
+
+def _record_call(service: str, operation: str, seconds: float):
+    REGISTRY.observe('external_call_seconds', seconds, 'Latencia de llamadas externas',
+                     service=service, operation=operation)
+    tel = _current_document.get()
+    if tel is not None:
+        tel.count(f"{service}_calls")
+        tel.count(f"{service}_s", seconds)
+
+
+def _record_error(service: str, operation: str):
+    REGISTRY.inc('external_call_errors_total', 1, 'Llamadas externas fallidas',
+                 service=service, operation=operation)
+
+
+@contextmanager
+def external_call(service: str, operation: str, tokens: int = 0):
+    """
+    Mide una llamada a un servicio externo: histograma de latencia, errores y
+    número de llamadas y segundos acumulados en el documento en curso.
+    Antes de la llamada espera al limitador de tasa compartido del servicio
+    (y al de tokens, si se indican); la espera se contabiliza aparte.
+    """
+    waited = acquire(service)
+    if tokens:
+        waited += acquire(f"{service}_tokens", tokens)
+    _record_wait(service, waited)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        _record_error(service, operation)
+        raise
+    finally:
+        _record_call(service, operation, time.perf_counter() - start)
+
+
+@asynccontextmanager
+async def aexternal_call(service: str, operation: str, tokens: int = 0):
+    """
+    Equivalente asíncrono de external_call para los clientes async: el mismo
+    limitador de tasa (esperando con asyncio.sleep) y las mismas métricas.
+    """
+    waited = await aacquire(service)
+    if tokens:
+        waited += await aacquire(f"{service}_tokens", tokens)
+    _record_wait(service, waited)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        _record_error(service, operation)
+        raise
+    finally:
+        _record_call(service, operation, time.perf_counter() - start)
+
+
+def submit_in_context(pool, fn, *args, **kwargs):
+    """pool.submit que conserva el contexto actual (documento en curso) en el hilo del pool."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)